@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# This file is part of the lib3to6 project
+# https://github.com/mbarkhau/lib3to6
+#
+# Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+"""Compare the throughput of the codegen backends.
+
+Usage: python scripts/bench_codegen.py [<source_file>...]
+
+Each module is parsed once and the full module is regenerated with each
+backend. Without arguments, the modules of lib3to6 itself are used.
+"""
+
+import ast
+import sys
+import time
+import pathlib as pl
+
+from lib3to6 import codegen
+
+REPEAT = 5
+
+
+def main(args: list) -> int:
+    if args:
+        paths = [pl.Path(arg) for arg in args]
+    else:
+        paths = sorted((pl.Path(__file__).parent.parent / "src" / "lib3to6").glob("*.py"))
+
+    sources = [path.read_text(encoding="utf-8") for path in paths]
+    n_lines = sum(source.count("\n") for source in sources)
+    trees   = [ast.parse(source) for source in sources]
+
+    print(f"{len(trees)} modules, {n_lines} lines, best of {REPEAT}")
+    for backend in sorted(codegen.BACKENDS):
+        durations = []
+        for _ in range(REPEAT):
+            t0 = time.perf_counter()
+            for tree in trees:
+                codegen.to_source(tree, backend)
+            durations.append(time.perf_counter() - t0)
+
+        duration = min(durations)
+        print(f"{backend:<12} {duration * 1000:8.1f} ms {n_lines / duration:10.0f} lines/sec")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -4,11 +4,8 @@
 # Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
 # SPDX-License-Identifier: MIT
 
-from .utils import parsedump_ast
-from .utils import parsedump_source
-from .packaging import Distribution
-from .packaging import fix
-from .transpile import transpile_module
+import typing as typ
+import importlib
 
 __version__ = "v202110.1050-b0"
 
@@ -18,4 +15,32 @@ __all__ = [
     'parsedump_ast',
     'parsedump_source',
     'Distribution',
+    'install_import_hook',
 ]
+
+# NOTE (mb 2021-10-17): The public names are loaded from their modules
+#   on first access (PEP 562). Importing lib3to6 should be cheap, in
+#   particular it should not import setuptools, which is only needed
+#   by lib3to6.packaging (Distribution and fix).
+_LAZY_ATTRS = {
+    'fix'                : ".packaging",
+    'Distribution'       : ".packaging",
+    'transpile_module'   : ".transpile",
+    'parsedump_ast'      : ".utils",
+    'parsedump_source'   : ".utils",
+    'install_import_hook': ".importhook",
+}
+
+
+def __getattr__(name: str) -> typ.Any:
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> typ.List[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
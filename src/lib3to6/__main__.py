@@ -5,19 +5,28 @@
 # Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
 # SPDX-License-Identifier: MIT
 
-import io
 import re
 import sys
+import glob
+import stat
 import typing as typ
 import difflib
 import logging
+import pathlib as pl
 
 import click
 
+from . import cache
+from . import watch
+from . import server
 from . import common
-from . import packaging
+from . import codegen
 from . import transpile
 
+# NOTE (mb 2021-10-17): lib3to6.packaging imports setuptools, which is
+#   slow to import and only needed by commands that transpile files, so
+#   it is imported by those commands rather than here.
+
 try:
     import pretty_traceback
 
@@ -79,8 +88,98 @@ __DEFAULT_MODE_HELP = """
 To transpile some files but not others.
 """
 
+__JOBS_HELP = f"""
+Number of parallel workers (0: one per cpu). Default: ${common.ENV_JOBS} or 1
+"""
+
+__OUTPUT_DIR_HELP = """
+Write results to this directory, mirroring the
+directory structure of the inputs.
+"""
+
+__CODEGEN_HELP = f"""
+[{'/'.join(codegen.BACKENDS)}] Code generation backend
+for modified statements. Default: {codegen.DEFAULT_BACKEND}
+"""
+
+
+class SourcePath(typ.NamedTuple):
+
+    path    : pl.Path
+    rel_path: pl.Path  # relative to the directory or glob of its argument
+
+
+def _is_glob(pattern: str) -> bool:
+    return any(char in pattern for char in "*?[")
+
+
+def _glob_base_dir(pattern: str) -> pl.Path:
+    base_parts: typ.List[str] = []
+    for part in pl.Path(pattern).parts:
+        if _is_glob(part):
+            break
+        base_parts.append(part)
+    return pl.Path(*base_parts) if base_parts else pl.Path(".")
+
+
+def expand_source_paths(args: typ.Sequence[str]) -> typ.List[SourcePath]:
+    """Expand directories (recursively) and globs to python files.
+
+    Paths are in the order of the arguments, sorted for each argument
+    and without duplicates.
+    """
+    source_paths: typ.List[SourcePath] = []
+    seen_paths  : typ.Set[pl.Path    ] = set()
+
+    for arg in args:
+        arg_path = pl.Path(arg)
+        if arg_path.is_dir():
+            base_dir = arg_path
+            paths    = sorted(arg_path.rglob("*.py"))
+        elif _is_glob(arg):
+            base_dir = _glob_base_dir(arg)
+            paths    = sorted(pl.Path(path) for path in glob.glob(arg, recursive=True))
+            paths    = [path for path in paths if path.is_file()]
+        else:
+            base_dir = arg_path.parent
+            paths    = [arg_path]
+
+        for path in paths:
+            if path not in seen_paths:
+                seen_paths.add(path)
+                source_paths.append(SourcePath(path, path.relative_to(base_dir)))
+
+    return source_paths
+
+
+def _decode_module(module_data: bytes, target_version: str) -> str:
+    header = transpile.parse_module_header(module_data, target_version)
+    return module_data.decode(header.coding)
+
+
+class _DefaultCommandGroup(click.Group):
+    """Group which runs the transpile command if no subcommand is given.
+
+    This keeps 'lib3to6 <source_file>' working.
+    """
 
-@click.command()
+    def parse_args(self, ctx: click.Context, args: typ.List[str]) -> typ.List[str]:
+        is_group_help = args[:1] == ["--help"]
+        if not is_group_help and (not args or args[0] not in self.commands):
+            args = ["transpile"] + list(args)
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=_DefaultCommandGroup)
+def main() -> None:
+    """Transpile python code and manage the cache of lib3to6.
+
+    The transpile command is the default, so 'lib3to6 <source_file>'
+    is the same as 'lib3to6 transpile <source_file>'.
+    """
+
+
+@main.command("transpile")
 @click.option(
     '-v',
     '--verbose',
@@ -105,6 +204,20 @@ To transpile some files but not others.
     is_flag=True,
     help="Write result back to input file.",
 )
+@click.option(
+    "--output-dir",
+    default=None,
+    metavar="<path>",
+    help=__OUTPUT_DIR_HELP.strip(),
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=None,
+    type=int,
+    metavar="<n>",
+    help=__JOBS_HELP.strip(),
+)
 @click.option(
     "--install-requires",
     default=None,
@@ -117,21 +230,35 @@ To transpile some files but not others.
     metavar="<mode>",
     help=__DEFAULT_MODE_HELP.strip(),
 )
+@click.option(
+    "--codegen",
+    "codegen_backend",
+    default=codegen.DEFAULT_BACKEND,
+    metavar="<backend>",
+    help=__CODEGEN_HELP.strip(),
+)
 @click.argument(
     "source_files",
     metavar="<source_file>",
     nargs=-1,
-    type=click.File(mode="r"),
 )
-def main(
+def transpile_cmd(
     target_version  : str,
     diff            : bool,
     in_place        : bool,
     install_requires: typ.Optional[str],
-    source_files    : typ.Sequence[io.TextIOWrapper],
+    source_files    : typ.Sequence[str],
     default_mode    : str = 'enabled',
+    codegen_backend : str = codegen.DEFAULT_BACKEND,
+    output_dir      : typ.Optional[str] = None,
+    jobs            : typ.Optional[int] = None,
     verbose         : int = 0,
 ) -> None:
+    """Transpile python source files.
+
+    Arguments may be files, directories (all .py files below them)
+    or glob patterns. Use '-' to read from stdin.
+    """
     _configure_logging(verbose)
 
     has_opt_error = False
@@ -145,39 +272,366 @@ def main(
         print("    Must be either 'enabled' or 'disabled'")
         has_opt_error = True
 
-    if not any(source_files):
+    if codegen_backend not in codegen.BACKENDS:
+        print(f"Invalid argument --codegen={codegen_backend}")
+        print("    Must be one of: " + ", ".join(codegen.BACKENDS))
+        has_opt_error = True
+
+    if in_place and output_dir:
+        print("Invalid arguments, use either --in-place or --output-dir")
+        has_opt_error = True
+
+    source_paths = expand_source_paths([arg for arg in source_files if arg != "-"])
+    use_stdin    = "-" in source_files
+    if not (source_paths or use_stdin):
         print("No files.")
         has_opt_error = True
 
     if has_opt_error:
         sys.exit(1)
 
+    # pylint: disable=import-outside-toplevel; lazy import to speed up --help
+    from . import packaging
+
     cfg = packaging.eval_build_config(
         target_version=target_version,
         install_requires=install_requires,
         default_mode=default_mode,
+        codegen=codegen_backend,
+        jobs=jobs,
     )
-    for src_file in source_files:
-        ctx         = common.BuildContext(cfg, src_file.name)
-        source_text = src_file.read()
+
+    if use_stdin:
+        ctx         = common.BuildContext(cfg, "<stdin>")
+        source_text = sys.stdin.read()
         try:
             fixed_source_text = transpile.transpile_module(ctx, source_text)
         except common.CheckError as err:
-            loc = src_file.name
-            if err.lineno >= 0:
-                loc += "@" + str(err.lineno)
-
-            err.args = (loc + " - " + err.args[0],) + err.args[1:]
+            err.add_location(ctx.filepath)
             raise
 
         if diff:
             _print_diff(source_text, fixed_source_text)
-        elif in_place:
-            with io.open(src_file.name, mode="w", encoding="utf-8") as fobj:
-                fobj.write(fixed_source_text)
         else:
             print(fixed_source_text)
 
+    if not source_paths:
+        return
+
+    module_cache     = cache.Cache.from_config(cfg)
+    transpiled_paths = packaging.transpile_paths(
+        cfg, [source_path.path for source_path in source_paths], module_cache
+    )
+    module_cache.record_build()
+
+    # NOTE (mb 2021-10-17): Results are in the order of the arguments,
+    #   no matter in which order the workers finished.
+    for source_path, transpiled_path in zip(source_paths, transpiled_paths):
+        fixed_source_data = transpiled_path.read_bytes()
+        if diff:
+            source_text       = _decode_module(source_path.path.read_bytes(), target_version)
+            fixed_source_text = _decode_module(fixed_source_data, target_version)
+            _print_diff(source_text, fixed_source_text)
+        elif in_place:
+            # keep permissions, e.g. of executable scripts
+            source_mode = stat.S_IMODE(source_path.path.stat().st_mode)
+            cache.atomic_write(source_path.path, fixed_source_data, mode=source_mode)
+        elif output_dir:
+            output_path = pl.Path(output_dir) / source_path.rel_path
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            cache.atomic_write(output_path, fixed_source_data)
+        else:
+            print(_decode_module(fixed_source_data, target_version))
+
+
+@main.command("wheel")
+@click.option(
+    '-v',
+    '--verbose',
+    count=True,
+    help="Control log level. -vv for debug level.",
+)
+@click.option(
+    "--target-version",
+    default="2.7",
+    metavar="<version>",
+    help="Target version of python.",
+)
+@click.option(
+    "-o",
+    "--output-dir",
+    default="dist",
+    metavar="<path>",
+    help="Directory for the transpiled wheels. Default: dist",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=None,
+    type=int,
+    metavar="<n>",
+    help=__JOBS_HELP.strip(),
+)
+@click.option(
+    "--install-requires",
+    default=None,
+    metavar="<packages>",
+    help=__INSTALL_REQUIRES_HELP.strip(),
+)
+@click.option(
+    "--codegen",
+    "codegen_backend",
+    default=codegen.DEFAULT_BACKEND,
+    metavar="<backend>",
+    help=__CODEGEN_HELP.strip(),
+)
+@click.argument(
+    "wheel_files",
+    metavar="<wheel_file>",
+    nargs=-1,
+    required=True,
+)
+def wheel_cmd(
+    wheel_files     : typ.Sequence[str],
+    target_version  : str,
+    output_dir      : str = "dist",
+    jobs            : typ.Optional[int] = None,
+    install_requires: typ.Optional[str] = None,
+    codegen_backend : str = codegen.DEFAULT_BACKEND,
+    verbose         : int = 0,
+) -> None:
+    """Transpile the modules of pure python wheels.
+
+    Writes a copy of each wheel to the output directory, tagged for the
+    target version.
+    """
+    _configure_logging(verbose)
+
+    if not re.match(r"[0-9]+\.[0-9]+", target_version):
+        print(f"Invalid argument --target-version={target_version}")
+        sys.exit(1)
+
+    if codegen_backend not in codegen.BACKENDS:
+        print(f"Invalid argument --codegen={codegen_backend}")
+        print("    Must be one of: " + ", ".join(codegen.BACKENDS))
+        sys.exit(1)
+
+    # pylint: disable=import-outside-toplevel; lazy import to speed up --help
+    from . import packaging
+
+    cfg = packaging.eval_build_config(
+        target_version=target_version,
+        install_requires=install_requires,
+        codegen=codegen_backend,
+        jobs=jobs,
+    )
+    module_cache = cache.Cache.from_config(cfg)
+    for wheel_file in wheel_files:
+        out_path = packaging.transpile_wheel(
+            cfg, pl.Path(wheel_file), pl.Path(output_dir), module_cache
+        )
+        click.echo(str(out_path))
+
+
+@main.command("watch")
+@click.option(
+    '-v',
+    '--verbose',
+    count=True,
+    help="Control log level. -vv for debug level.",
+)
+@click.option(
+    "--target-version",
+    default="2.7",
+    metavar="<version>",
+    help="Target version of python.",
+)
+@click.option(
+    "--output-dir",
+    required=True,
+    metavar="<path>",
+    help=__OUTPUT_DIR_HELP.strip(),
+)
+@click.option(
+    "--install-requires",
+    default=None,
+    metavar="<packages>",
+    help=__INSTALL_REQUIRES_HELP.strip(),
+)
+@click.option(
+    "--default-mode",
+    default='enabled',
+    metavar="<mode>",
+    help=__DEFAULT_MODE_HELP.strip(),
+)
+@click.option(
+    "--codegen",
+    "codegen_backend",
+    default=codegen.DEFAULT_BACKEND,
+    metavar="<backend>",
+    help=__CODEGEN_HELP.strip(),
+)
+@click.option(
+    "--interval",
+    default=watch.DEFAULT_POLL_INTERVAL,
+    type=float,
+    metavar="<seconds>",
+    help=f"Seconds between scans for changes. Default: {watch.DEFAULT_POLL_INTERVAL}",
+)
+@click.argument(
+    "src",
+    metavar="<src>",
+    type=click.Path(exists=True),
+)
+def watch_cmd(
+    src             : str,
+    output_dir      : str,
+    target_version  : str,
+    install_requires: typ.Optional[str] = None,
+    default_mode    : str = 'enabled',
+    codegen_backend : str = codegen.DEFAULT_BACKEND,
+    interval        : float = watch.DEFAULT_POLL_INTERVAL,
+    verbose         : int = 0,
+) -> None:
+    """Transpile modules of <src> to --output-dir whenever they change.
+
+    <src> may be a directory or a single file. Only new or modified
+    modules are transpiled, outputs of removed modules are removed.
+    """
+    _configure_logging(verbose)
+
+    if not re.match(r"[0-9]+\.[0-9]+", target_version):
+        print(f"Invalid argument --target-version={target_version}")
+        sys.exit(1)
+
+    if default_mode not in ('enabled', 'disabled'):
+        print(f"Invalid argument --default-mode={default_mode}")
+        print("    Must be either 'enabled' or 'disabled'")
+        sys.exit(1)
+
+    if codegen_backend not in codegen.BACKENDS:
+        print(f"Invalid argument --codegen={codegen_backend}")
+        print("    Must be one of: " + ", ".join(codegen.BACKENDS))
+        sys.exit(1)
+
+    # pylint: disable=import-outside-toplevel; lazy import to speed up --help
+    from . import packaging
+
+    cfg = packaging.eval_build_config(
+        target_version=target_version,
+        install_requires=install_requires,
+        default_mode=default_mode,
+        codegen=codegen_backend,
+    )
+    watcher = watch.Watcher(cfg, pl.Path(src), pl.Path(output_dir))
+    try:
+        watcher.run(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+@main.command("serve")
+@click.option(
+    '-v',
+    '--verbose',
+    count=True,
+    help="Control log level. -vv for debug level.",
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    default=None,
+    metavar="<path>",
+    help="Listen on this unix socket. Default: requests on stdin, responses on stdout.",
+)
+def serve_cmd(socket_path: typ.Optional[str] = None, verbose: int = 0) -> None:
+    """Transpile requests of other processes, keeping caches warm.
+
+    Requests and responses are JSON objects, one per line, for example:
+
+    \b
+    {"id": 1, "method": "transpile", "params": {"source": "x: int = 1", "target_version": "2.7"}}
+    {"id": 1, "result": {"source": "x = 1"}}
+    """
+    _configure_logging(verbose)
+
+    handler = server.Handler()
+    try:
+        if socket_path:
+            server.serve_unix(socket_path, handler)
+        else:
+            server.serve_stream(sys.stdin.buffer, sys.stdout.buffer, handler)
+    except KeyboardInterrupt:
+        pass
+
+
+def _open_cache(cache_dir: typ.Optional[str]) -> cache.Cache:
+    if cache_dir is None:
+        return cache.Cache(cache.get_cache_dir(), cache.get_cache_size())
+    else:
+        return cache.Cache(pl.Path(cache_dir), cache.get_cache_size())
+
+
+__CACHE_DIR_HELP = f"""
+Cache directory. Default: ${cache.ENV_CACHE_DIR} or {cache.DEFAULT_CACHE_DIR}
+"""
+
+
+@main.group("cache")
+def cache_cmd() -> None:
+    """Inspect and manage the cache of transpiled modules."""
+
+
+@cache_cmd.command("stats")
+@click.option("--cache-dir", default=None, metavar="<path>", help=__CACHE_DIR_HELP.strip())
+def cache_stats(cache_dir: typ.Optional[str] = None) -> None:
+    """Show number of entries, size and hit ratio of recent builds."""
+    module_cache = _open_cache(cache_dir)
+    entries      = list(module_cache.iter_entries())
+    total_size   = sum(entry.size for entry in entries)
+    size_limit   = cache.format_size(module_cache.size_limit)
+
+    click.echo(f"cache dir: {module_cache.cache_dir}")
+    click.echo(f"entries  : {len(entries)}")
+    click.echo(f"size     : {cache.format_size(total_size)} (limit {size_limit})")
+
+    builds = module_cache.build_stats()
+    hits   = sum(build.hits for build in builds)
+    misses = sum(build.misses for build in builds)
+    if hits + misses > 0:
+        hit_ratio = 100 * hits / (hits + misses)
+        click.echo(
+            f"last {len(builds)} builds: {hits} hits, {misses} misses, hit ratio {hit_ratio:.1f}%"
+        )
+    else:
+        click.echo("no builds recorded")
+
+
+@cache_cmd.command("gc")
+@click.option("--cache-dir", default=None, metavar="<path>", help=__CACHE_DIR_HELP.strip())
+@click.option(
+    "--max-size",
+    default=None,
+    metavar="<size>",
+    help=f"Evict entries until below this size (e.g. 100M). Default: ${cache.ENV_CACHE_SIZE}",
+)
+def cache_gc(cache_dir: typ.Optional[str] = None, max_size: typ.Optional[str] = None) -> None:
+    """Evict least recently used entries."""
+    module_cache = _open_cache(cache_dir)
+    size_limit   = None if max_size is None else cache.parse_size(max_size)
+
+    removed_count, removed_size = module_cache.gc(size_limit)
+    click.echo(f"removed {removed_count} entries ({cache.format_size(removed_size)})")
+
+
+@cache_cmd.command("clear")
+@click.option("--cache-dir", default=None, metavar="<path>", help=__CACHE_DIR_HELP.strip())
+def cache_clear(cache_dir: typ.Optional[str] = None) -> None:
+    """Remove all entries."""
+    module_cache = _open_cache(cache_dir)
+    module_cache.clear()
+    click.echo(f"cleared {module_cache.cache_dir}")
+
 
 if __name__ == '__main__':
     # NOTE (mb 2020-07-18): click supplies the parameters
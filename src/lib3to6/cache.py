@@ -0,0 +1,585 @@
+# This file is part of the lib3to6 project
+# https://github.com/mbarkhau/lib3to6
+#
+# Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+
+import os
+import re
+import json
+import time
+import uuid
+import atexit
+import shutil
+import typing as typ
+import hashlib
+import logging
+import pathlib as pl
+import tempfile
+
+from . import common
+from . import __version__
+
+logger = logging.getLogger(__name__)
+
+
+ENV_CACHE_DIR = 'LIB3TO6_CACHE_DIR'
+
+ENV_CACHE_SIZE = 'LIB3TO6_CACHE_SIZE'
+
+DEFAULT_CACHE_DIR = pl.Path(tempfile.gettempdir()) / ".lib3to6_cache"
+
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+# After eviction, the cache is at most this fraction of its size limit,
+# so that not every build has to evict entries.
+GC_TARGET_RATIO = 0.9
+
+# Temporary files older than this are left over from aborted writes.
+TMP_FILE_MAX_AGE = 60 * 60
+
+STATS_FILENAME = "stats.json"
+
+MANIFEST_FILENAME = "manifest.json"
+
+TIMINGS_FILENAME = "timings.json"
+
+# Rough duration to transpile a file, used for files without timings
+# when there are no timings for any file either.
+DEFAULT_SECONDS_PER_BYTE = 1e-5
+
+# NOTE (mb 2021-10-17): A file may be modified again within the
+#   granularity of its mtime without changing its size. Stat
+#   signatures younger than this are not recorded in the manifest,
+#   so such files are always read (same as "racy git").
+MANIFEST_MIN_AGE = 2.0
+
+# Number of builds for which the hit/miss counts are kept.
+MAX_BUILD_STATS = 20
+
+# Fields of the BuildConfig which don't change the output of a build.
+CACHE_KEY_EXCLUDED_FIELDS = {'cache_enabled', 'cache_dir', 'cache_size', 'jobs'}
+
+
+SIZE_PATTERN = r"^\s*(?P<num>[0-9]+(?:\.[0-9]+)?)\s*(?P<unit>[kmgt]?)i?b?\s*$"
+
+SIZE_RE = re.compile(SIZE_PATTERN, flags=re.IGNORECASE)
+
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+
+def parse_size(size: str) -> int:
+    """Parse a size in bytes, with an optional unit.
+
+    >>> parse_size("1000")
+    1000
+    >>> parse_size("1.5K")
+    1536
+    >>> parse_size("256MiB")
+    268435456
+    """
+    match = SIZE_RE.match(size)
+    if match is None:
+        raise ValueError(f"Invalid size '{size}'")
+
+    num  = float(match.group('num'))
+    unit = match.group('unit').lower()
+    return int(num * SIZE_UNITS[unit])
+
+
+def format_size(num_bytes: float) -> str:
+    """Human readable size.
+
+    >>> format_size(100)
+    '100 B'
+    >>> format_size(1536)
+    '1.5 KiB'
+    """
+    if num_bytes < 1024:
+        return f"{num_bytes:.0f} B"
+
+    for unit in ("KiB", "MiB", "GiB"):
+        num_bytes /= 1024
+        if num_bytes < 1024:
+            break
+    return f"{num_bytes:.1f} {unit}"
+
+
+def get_cache_dir(cfg: typ.Optional[common.BuildConfig] = None) -> pl.Path:
+    if cfg and cfg.cache_dir:
+        return pl.Path(cfg.cache_dir)
+
+    env_cache_dir = os.environ.get(ENV_CACHE_DIR)
+    if env_cache_dir:
+        return pl.Path(env_cache_dir)
+    else:
+        return DEFAULT_CACHE_DIR
+
+
+def get_cache_size(cfg: typ.Optional[common.BuildConfig] = None) -> int:
+    if cfg and cfg.cache_size:
+        return cfg.cache_size
+
+    env_cache_size = os.environ.get(ENV_CACHE_SIZE)
+    if env_cache_size:
+        return parse_size(env_cache_size)
+    else:
+        return DEFAULT_CACHE_SIZE
+
+
+def cache_key_data(cfg: common.BuildConfig) -> bytes:
+    """Canonical serialization of everything that determines the output.
+
+    Includes the BuildConfig, the version of lib3to6 and the source
+    version of python. The serialization is stable across processes,
+    in particular it doesn't depend on the ordering of sets.
+    """
+    key_data: typ.Dict[str, typ.Any] = {
+        'lib3to6_version': __version__,
+        'source_version' : common.get_source_version(),
+    }
+    for field, value in cfg._asdict().items():
+        if field in CACHE_KEY_EXCLUDED_FIELDS:
+            continue
+        if isinstance(value, (set, frozenset)):
+            value = sorted(value)
+        key_data[field] = value
+
+    return json.dumps(key_data, sort_keys=True).encode("utf-8")
+
+
+def config_key(cfg: common.BuildConfig) -> str:
+    return hashlib.sha1(cache_key_data(cfg)).hexdigest()
+
+
+def cache_key(cfg: common.BuildConfig, module_source_data: bytes) -> str:
+    filehash = hashlib.sha1()
+    filehash.update(cache_key_data(cfg))
+    filehash.update(module_source_data)
+    return filehash.hexdigest()
+
+
+def tmp_path_for(path: pl.Path) -> pl.Path:
+    """Unique path in the same directory, to be renamed to path.
+
+    The name starts with a "." so it can be recognized as temporary.
+    """
+    return path.parent / f".{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+
+
+def atomic_write(path: pl.Path, data: bytes, mode: typ.Optional[int] = None) -> None:
+    """Write to a temporary file and rename it to path.
+
+    Concurrent readers of path see either the previous or the new
+    content, never a partially written file. If mode is given, it
+    is applied to the file before it is renamed.
+    """
+    # NOTE (mb 2021-10-17): Not using tempfile.mkstemp, since it creates
+    #   files that are only readable by the current user.
+    tmp_path = tmp_path_for(path)
+    try:
+        with tmp_path.open(mode="xb") as fobj:
+            fobj.write(data)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+
+class CacheEntry(typ.NamedTuple):
+
+    path : pl.Path
+    size : int
+    atime: float
+
+
+class CacheCounts(typ.NamedTuple):
+
+    hits         : int
+    misses       : int
+    written_bytes: int
+
+
+class BuildStats(typ.NamedTuple):
+
+    time  : float
+    hits  : int
+    misses: int
+
+
+# (size, mtime_ns, inode, config key)
+StatSignature = typ.Tuple[int, int, int, str]
+
+
+def stat_signature(stat: os.stat_result, cfg_key: str) -> StatSignature:
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino, cfg_key)
+
+
+IndexEntries = typ.Dict[str, typ.List[typ.Any]]
+
+
+class PathIndex:
+    """Persistent mapping from the absolute path of a file to an entry.
+
+    There can be an entry for each variant of a path, such as the build
+    configs the file was transpiled with. The index is loaded on first
+    use and written atomically by save().
+    A missing, corrupt or outdated index is treated as empty. Updates
+    made in another process can be transferred with take_updates() and
+    merge().
+    """
+
+    version    : int = 1
+    max_entries: int = 100_000
+
+    path    : pl.Path
+    _entries: typ.Optional[IndexEntries]
+    _updates: IndexEntries
+
+    def __init__(self, path: pl.Path) -> None:
+        self.path     = path
+        self._entries = None
+        self._updates = {}
+
+    def _load(self) -> IndexEntries:
+        try:
+            with self.path.open(mode="rb") as fobj:
+                index = json.loads(fobj.read().decode("utf-8"))
+        except FileNotFoundError:
+            return {}
+        except (IOError, ValueError) as err:
+            logger.warning(f"Ignoring invalid index {self.path}: {err}")
+            return {}
+
+        is_valid = (
+            isinstance(index, dict)
+            and index.get('version') == self.version
+            and isinstance(index.get('entries'), dict)
+        )
+        if is_valid:
+            return typ.cast(IndexEntries, index['entries'])
+        else:
+            logger.warning(f"Ignoring invalid index {self.path}")
+            return {}
+
+    @property
+    def entries(self) -> IndexEntries:
+        if self._entries is None:
+            self._entries = self._load()
+        return self._entries
+
+    @staticmethod
+    def entry_key(filepath: pl.Path, variant: str = "") -> str:
+        abs_path = str(filepath.absolute())
+        if variant:
+            return f"{variant}:{abs_path}"
+        else:
+            return abs_path
+
+    def get(self, filepath: pl.Path, variant: str = "") -> typ.Optional[typ.List[typ.Any]]:
+        entry = self.entries.get(self.entry_key(filepath, variant))
+        if isinstance(entry, list):
+            return entry
+        else:
+            return None
+
+    def set(self, filepath: pl.Path, entry: typ.List[typ.Any], variant: str = "") -> None:
+        self.merge({self.entry_key(filepath, variant): entry})
+
+    def updated(self) -> IndexEntries:
+        """Entries updated since the last save."""
+        return dict(self._updates)
+
+    def take_updates(self) -> IndexEntries:
+        """Entries updated since the last call (or since loading)."""
+        updates       = self._updates
+        self._updates = {}
+        return updates
+
+    def merge(self, updates: IndexEntries) -> None:
+        entries = self.entries
+        for path, entry in updates.items():
+            # reinsert, so that the oldest entries come first
+            entries.pop(path, None)
+            entries[path]       = entry
+            self._updates[path] = entry
+
+    def save(self) -> None:
+        if not self.take_updates():
+            return
+
+        entries = self.entries
+        while len(entries) > self.max_entries:
+            del entries[next(iter(entries))]
+
+        index = {'version': self.version, 'entries': entries}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.path, json.dumps(index).encode("utf-8"))
+
+
+class Manifest(PathIndex):
+    """Index from the stat signature of a source file to its cache key.
+
+    A source file with the same path, size, mtime and inode as during a
+    previous build is assumed to be unchanged, so its cache entry can be
+    used without reading and hashing the file. There is an entry for
+    each config key, so builds with different configs (e.g. for each
+    target version) don't replace each other's entries.
+    """
+
+    version: int = 2
+
+    def lookup(self, filepath: pl.Path, signature: StatSignature) -> typ.Optional[str]:
+        _, _, _, cfg_key = signature
+        entry = self.get(filepath, variant=cfg_key)
+        if entry is None or len(entry) != 5:
+            return None
+
+        *entry_signature, key = entry
+        if tuple(entry_signature) == signature and isinstance(key, str):
+            return key
+        else:
+            return None
+
+    def update(self, filepath: pl.Path, signature: StatSignature, key: str) -> None:
+        _, mtime_ns, _, cfg_key = signature
+        if time.time() - mtime_ns / 1e9 < MANIFEST_MIN_AGE:
+            return
+
+        self.set(filepath, list(signature) + [key], variant=cfg_key)
+
+
+class Timings(PathIndex):
+    """Durations of the last transpilation of each file.
+
+    Entries are [size, duration]. For files without an entry, the
+    duration is estimated from their size.
+    """
+
+    def record(self, filepath: pl.Path, size: int, duration: float) -> None:
+        self.set(filepath, [size, round(duration, 6)])
+
+    def seconds_per_byte(self) -> float:
+        total_size     = 0
+        total_duration = 0.0
+        for entry in self.entries.values():
+            if len(entry) == 2:
+                total_size     += entry[0]
+                total_duration += entry[1]
+
+        if total_size > 0 and total_duration > 0:
+            return total_duration / total_size
+        else:
+            return DEFAULT_SECONDS_PER_BYTE
+
+    def estimate(self, filepath: pl.Path, size: int, seconds_per_byte: float) -> float:
+        entry = self.get(filepath)
+        if entry and len(entry) == 2 and entry[0] == size:
+            return typ.cast(float, entry[1])
+        else:
+            return size * seconds_per_byte
+
+
+class Cache:
+    """Content addressed cache of transpiled modules.
+
+    Entries are stored in subdirectories named after the first two hex
+    digits of their key, so that no single directory gets too large.
+    The total size of the cache is bounded. When it is exceeded, the
+    least recently used entries (by access time) are evicted.
+    """
+
+    cache_dir : pl.Path
+    size_limit: int
+    manifest  : Manifest
+    timings   : Timings
+
+    hits         : int
+    misses       : int
+    written_bytes: int
+
+    def __init__(self, cache_dir: pl.Path, size_limit: int = DEFAULT_CACHE_SIZE) -> None:
+        self.cache_dir  = cache_dir
+        self.size_limit = size_limit
+        self.manifest   = Manifest(cache_dir / MANIFEST_FILENAME)
+        self.timings    = Timings(cache_dir / TIMINGS_FILENAME)
+
+        self.hits          = 0
+        self.misses        = 0
+        self.written_bytes = 0
+
+    @staticmethod
+    def from_config(cfg: common.BuildConfig) -> 'Cache':
+        """The cache of cfg, or a temporary one if caching is disabled.
+
+        Callers always get paths of transpiled modules from the cache, so
+        with cache_enabled=False the entries are written to a directory
+        which is removed when the process exits, rather than the shared
+        cache directory.
+        """
+        if cfg.cache_enabled:
+            return Cache(get_cache_dir(cfg), get_cache_size(cfg))
+
+        tmp_dir = tempfile.mkdtemp(prefix="lib3to6_nocache_")
+        atexit.register(shutil.rmtree, tmp_dir, ignore_errors=True)
+        return Cache(pl.Path(tmp_dir), get_cache_size(cfg))
+
+    def entry_path(self, key: str) -> pl.Path:
+        return self.cache_dir / key[:2] / (key[2:] + ".py")
+
+    def get(self, key: str) -> typ.Optional[pl.Path]:
+        """Path to the entry for key, or None if there is none.
+
+        The access time of the entry is updated explicitly, since file
+        systems are often mounted with noatime or relatime. The mtime is
+        kept, since build outputs may be hardlinks of the entry (see
+        sync.py), which are recognized by their mtime.
+        """
+        path = self.entry_path(key)
+        try:
+            stat = os.stat(path)
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except FileNotFoundError:
+            return None
+
+        self.hits += 1
+        return path
+
+    def put(self, key: str, data: bytes) -> pl.Path:
+        path = self.entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(path, data)
+
+        self.misses        += 1
+        self.written_bytes += len(data)
+        return path
+
+    def take_counts(self) -> CacheCounts:
+        """Counts since the last call (or since the cache was created)."""
+        counts = CacheCounts(self.hits, self.misses, self.written_bytes)
+
+        self.hits          = 0
+        self.misses        = 0
+        self.written_bytes = 0
+        return counts
+
+    def add_counts(self, counts: CacheCounts) -> None:
+        self.hits          += counts.hits
+        self.misses        += counts.misses
+        self.written_bytes += counts.written_bytes
+
+    def iter_entries(self) -> typ.Iterable[CacheEntry]:
+        if not self.cache_dir.exists():
+            return
+
+        min_tmp_mtime = time.time() - TMP_FILE_MAX_AGE
+        for shard_dir in os.scandir(self.cache_dir):
+            if not (shard_dir.is_dir() and len(shard_dir.name) == 2):
+                continue
+
+            for dir_entry in os.scandir(shard_dir.path):
+                try:
+                    stat = dir_entry.stat()
+                except FileNotFoundError:
+                    continue  # removed concurrently
+
+                if dir_entry.name.startswith("."):
+                    if stat.st_mtime < min_tmp_mtime:
+                        _unlink(pl.Path(dir_entry.path))
+                    continue
+
+                yield CacheEntry(pl.Path(dir_entry.path), stat.st_size, stat.st_atime)
+
+    def gc(self, size_limit: typ.Optional[int] = None) -> typ.Tuple[int, int]:
+        """Evict least recently used entries until below size_limit.
+
+        Returns the number of removed entries and their size in bytes.
+        """
+        if size_limit is None:
+            size_limit = self.size_limit
+
+        entries    = sorted(self.iter_entries(), key=lambda entry: entry.atime)
+        total_size = sum(entry.size for entry in entries)
+
+        removed_count = 0
+        removed_size  = 0
+        if total_size > size_limit:
+            target_size = size_limit * GC_TARGET_RATIO
+            for entry in entries:
+                if total_size - removed_size <= target_size:
+                    break
+                _unlink(entry.path)
+                removed_count += 1
+                removed_size  += entry.size
+
+        self._update_stats(size_estimate=total_size - removed_size)
+        return (removed_count, removed_size)
+
+    def clear(self) -> None:
+        if self.cache_dir.exists():
+            shutil.rmtree(self.cache_dir)
+        self.manifest = Manifest(self.cache_dir / MANIFEST_FILENAME)
+        self.timings  = Timings(self.cache_dir / TIMINGS_FILENAME)
+
+    def read_stats(self) -> typ.Dict[str, typ.Any]:
+        stats_path = self.cache_dir / STATS_FILENAME
+        try:
+            with stats_path.open(mode="rb") as fobj:
+                stats = json.loads(fobj.read().decode("utf-8"))
+            if isinstance(stats, dict):
+                return stats
+        except (IOError, ValueError):
+            pass
+        return {}
+
+    def build_stats(self) -> typ.List[BuildStats]:
+        stats = self.read_stats()
+        return [BuildStats(*build) for build in stats.get('builds', [])]
+
+    def _update_stats(
+        self,
+        size_estimate: typ.Optional[int] = None,
+        build        : typ.Optional[BuildStats] = None,
+    ) -> None:
+        # NOTE (mb 2021-10-17): Concurrent builds may overwrite each
+        #   others update. These are only statistics, so that's fine.
+        stats = self.read_stats()
+        if size_estimate is not None:
+            stats['size_estimate'] = size_estimate
+        if build:
+            builds = stats.get('builds', []) + [list(build)]
+            stats['builds'] = builds[-MAX_BUILD_STATS:]
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        stats_data = json.dumps(stats, sort_keys=True).encode("utf-8")
+        atomic_write(self.cache_dir / STATS_FILENAME, stats_data)
+
+    def record_build(self) -> None:
+        """Record hits/misses of a build and evict entries if needed."""
+        self.manifest.save()
+        self.timings.save()
+
+        counts = self.take_counts()
+        build  = BuildStats(time.time(), counts.hits, counts.misses)
+        logger.debug(f"cache hits: {counts.hits}, misses: {counts.misses}")
+
+        size_estimate = self.read_stats().get('size_estimate')
+        if isinstance(size_estimate, int):
+            size_estimate += counts.written_bytes
+        else:
+            size_estimate = None
+
+        self._update_stats(size_estimate=size_estimate, build=build)
+
+        if size_estimate is None or size_estimate > self.size_limit:
+            self.gc()
+
+
+def _unlink(path: pl.Path) -> None:
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass  # removed concurrently
@@ -4,14 +4,191 @@
 # Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
 # SPDX-License-Identifier: MIT
 import ast
+import typing as typ
 
 from . import common
 
+DispatchTypes = typ.Tuple[typ.Type[ast.AST], ...]
+
+ImportNode = typ.Union[ast.Import, ast.ImportFrom]
+
+
+def iter_scope_names(node: ast.AST) -> typ.Iterable[typ.Tuple[str, ast.AST]]:
+    """Names which node introduces into its scope."""
+    if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+        yield node.name, node
+    elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+        yield node.id, node
+    elif isinstance(node, (ast.ImportFrom, ast.Import)):
+        for alias in node.names:
+            name = alias.name if alias.asname is None else alias.asname
+            yield name, node
+    elif isinstance(node, ast.arg):
+        yield node.arg, node
+
+
+def is_open_call(node: ast.AST) -> bool:
+    if not isinstance(node, ast.Call):
+        return False
+
+    func_node = node.func
+    return (
+        isinstance(func_node, ast.Name)
+        and func_node.id == "open"
+        and isinstance(func_node.ctx, ast.Load)
+    )
+
+
+def iter_features(node: ast.AST) -> typ.Iterable[str]:
+    """Features of a node, which fixers may declare as their trigger.
+
+    Features are the name of the node type, plus some more specific
+    markers:
+
+    - "name:<id>" for any use of a name
+    - "import:<module>" for any import of a module
+    - "kwonlyargs" for a function with keyword only arguments
+    - "starstarargs" for a ** in a call or dict display
+    """
+    yield type(node).__name__
+
+    if isinstance(node, ast.Name):
+        yield "name:" + node.id
+    elif isinstance(node, ast.Import):
+        for alias in node.names:
+            yield "import:" + alias.name
+    elif isinstance(node, ast.ImportFrom):
+        if node.module:
+            yield "import:" + node.module
+    elif isinstance(node, ast.arguments):
+        if node.kwonlyargs:
+            yield "kwonlyargs"
+    elif isinstance(node, ast.keyword):
+        if node.arg is None:
+            yield "starstarargs"
+    elif isinstance(node, ast.Dict):
+        if None in node.keys:
+            yield "starstarargs"
+
+
+class ModuleFacts:
+    """Index of a module, built during a single walk of its tree.
+
+    All lists are in the order of ast.walk.
+    """
+
+    scope_names: typ.List[typ.Tuple[str, ast.AST]]
+    imports    : typ.List[ImportNode]
+    open_calls : typ.List[ast.Call]
+    class_defs : typ.List[ast.ClassDef]
+    features   : typ.Set[str]
+
+    def __init__(self) -> None:
+        self.scope_names = []
+        self.imports     = []
+        self.open_calls  = []
+        self.class_defs  = []
+        self.features    = set()
+
+    def add_node(self, node: ast.AST) -> None:
+        self.scope_names.extend(iter_scope_names(node))
+        self.features.update(iter_features(node))
+
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            self.imports.append(node)
+        elif isinstance(node, ast.ClassDef):
+            self.class_defs.append(node)
+        elif is_open_call(node):
+            self.open_calls.append(typ.cast(ast.Call, node))
+
 
 class CheckerBase:
 
     # no info -> always apply
     version_info: common.VersionInfo = common.VersionInfo()
 
+    # Node types for which check_node is called while the module is
+    # walked. The walk is shared with all other checkers (see
+    # CheckerDispatcher). Checkers which only need the ModuleFacts or
+    # the top level of the module implement check_module instead.
+    dispatch_types: DispatchTypes = ()
+
+    # Whether the checker gives the same result for any target version
+    # to which it applies. When a module is checked for multiple
+    # targets, such a checker is only run once.
+    target_independent: bool = True
+
     def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> None:
+        CheckerDispatcher([self])(ctx, tree)
+
+    def check_node(self, ctx: common.BuildContext, node: ast.AST) -> None:
         raise NotImplementedError()
+
+    def check_module(self, ctx: common.BuildContext, tree: ast.Module, facts: ModuleFacts) -> None:
+        pass
+
+
+class CheckerDispatcher:
+    """Run multiple checkers with a single walk of a module.
+
+    Each node is passed to every checker that declares its type in
+    dispatch_types, and is added to the ModuleFacts of the module.
+    After the walk, check_module is called for each checker.
+
+    The reported error is the same as if the checkers had been called
+    one after another: a checker stops receiving nodes after its first
+    error, and errors are raised in the order of the checkers.
+    """
+
+    checkers: typ.List[CheckerBase]
+    handlers: typ.Dict[typ.Type[ast.AST], typ.List[CheckerBase]]
+
+    def __init__(self, checkers: typ.Sequence[CheckerBase]) -> None:
+        self.checkers = list(checkers)
+        self.handlers = {}
+        for checker in self.checkers:
+            for node_type in checker.dispatch_types:
+                self.handlers.setdefault(node_type, []).append(checker)
+
+    def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> ModuleFacts:
+        facts, errors = self.collect(ctx, tree)
+        for checker in self.checkers:
+            err = errors.get(id(checker))
+            if err:
+                raise err
+        return facts
+
+    def collect(
+        self,
+        ctx     : common.BuildContext,
+        tree    : ast.Module,
+        contexts: typ.Optional[typ.Dict[int, common.BuildContext]] = None,
+    ) -> typ.Tuple[ModuleFacts, typ.Dict[int, common.CheckError]]:
+        """Walk the module and collect the first error of each checker.
+
+        Errors are keyed by the id of the checker. A checker is called
+        with contexts[id(checker)] if present and with ctx otherwise.
+        """
+        contexts = contexts or {}
+        facts    = ModuleFacts()
+        errors: typ.Dict[int, common.CheckError] = {}
+
+        for node in ast.walk(tree):
+            facts.add_node(node)
+            for checker in self.handlers.get(type(node), []):
+                if id(checker) in errors:
+                    continue
+                try:
+                    checker.check_node(contexts.get(id(checker), ctx), node)
+                except common.CheckError as err:
+                    errors[id(checker)] = err
+
+        for checker in self.checkers:
+            if id(checker) in errors:
+                continue
+            try:
+                checker.check_module(contexts.get(id(checker), ctx), tree, facts)
+            except common.CheckError as err:
+                errors[id(checker)] = err
+
+        return facts, errors
@@ -14,28 +14,14 @@ from .checkers_backports import NoUnusableImportsChecker
 
 
 class NoStarImports(cb.CheckerBase):
-    def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> None:
-        for node in ast.walk(tree):
-            if not isinstance(node, ast.ImportFrom):
-                continue
-
-            for alias in node.names:
-                if alias.name == "*":
-                    raise common.CheckError(f"Prohibited from {node.module} import *.", node)
 
+    dispatch_types = (ast.ImportFrom,)
 
-def _iter_scope_names(tree: ast.Module) -> typ.Iterable[typ.Tuple[str, ast.AST]]:
-    for node in ast.walk(tree):
-        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
-            yield node.name, node
-        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
-            yield node.id, node
-        elif isinstance(node, (ast.ImportFrom, ast.Import)):
-            for alias in node.names:
-                name = alias.name if alias.asname is None else alias.asname
-                yield name, node
-        elif isinstance(node, ast.arg):
-            yield node.arg, node
+    def check_node(self, ctx: common.BuildContext, node: ast.AST) -> None:
+        assert isinstance(node, ast.ImportFrom)
+        for alias in node.names:
+            if alias.name == "*":
+                raise common.CheckError(f"Prohibited from {node.module} import *.", node)
 
 
 class NoOverriddenFixerImportsChecker(cb.CheckerBase):
@@ -43,8 +29,10 @@ class NoOverriddenFixerImportsChecker(cb.CheckerBase):
 
     prohibited_import_overrides = {"itertools", "six", "builtins"}
 
-    def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> None:
-        for name_in_scope, node in _iter_scope_names(tree):
+    def check_module(
+        self, ctx: common.BuildContext, tree: ast.Module, facts: cb.ModuleFacts
+    ) -> None:
+        for name_in_scope, node in facts.scope_names:
             is_fixer_import = (
                 isinstance(node, ast.Import)
                 and len(node.names) == 1
@@ -62,8 +50,10 @@ class NoOverriddenFixerImportsChecker(cb.CheckerBase):
 class NoOverriddenBuiltinsChecker(cb.CheckerBase):
     """Don't override names that fixers may reference."""
 
-    def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> None:
-        for name_in_scope, node in _iter_scope_names(tree):
+    def check_module(
+        self, ctx: common.BuildContext, tree: ast.Module, facts: cb.ModuleFacts
+    ) -> None:
+        for name_in_scope, node in facts.scope_names:
             if name_in_scope in common.BUILTIN_NAMES:
                 msg = f"Prohibited override of builtin '{name_in_scope}'"
                 raise common.CheckError(msg, node)
@@ -76,17 +66,10 @@ class NoOpenWithEncodingChecker(cb.CheckerBase):
 
     version_info = common.VersionInfo(apply_until="2.7")
 
-    def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> None:
-        for node in ast.walk(tree):
-            if not isinstance(node, ast.Call):
-                continue
-
-            func_node = node.func
-            if not isinstance(func_node, ast.Name):
-                continue
-            if func_node.id != "open" or not isinstance(func_node.ctx, ast.Load):
-                continue
-
+    def check_module(
+        self, ctx: common.BuildContext, tree: ast.Module, facts: cb.ModuleFacts
+    ) -> None:
+        for node in facts.open_calls:
             mode = "r"
             if len(node.args) >= 2:
                 mode_node = node.args[1]
@@ -129,65 +112,63 @@ class NoOpenWithEncodingChecker(cb.CheckerBase):
 
 class NoAsyncAwait(cb.CheckerBase):
 
-    version_info = common.VersionInfo(apply_until="3.4", works_since="3.5")
-
-    def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> None:
-        async_await_node_types = (ast.AsyncFor, ast.AsyncWith, ast.AsyncFunctionDef, ast.Await)
-        for node in ast.walk(tree):
-            if not isinstance(node, async_await_node_types):
-                continue
+    version_info   = common.VersionInfo(apply_until="3.4", works_since="3.5")
+    dispatch_types = (ast.AsyncFor, ast.AsyncWith, ast.AsyncFunctionDef, ast.Await)
+
+    # the target version is part of the error message
+    target_independent = False
+
+    def check_node(self, ctx: common.BuildContext, node: ast.AST) -> None:
+        if isinstance(node, ast.AsyncFor):
+            keywords = "async for"
+        elif isinstance(node, ast.AsyncWith):
+            keywords = "async with"
+        elif isinstance(node, ast.AsyncFunctionDef):
+            keywords = "async def"
+        elif isinstance(node, ast.Await):
+            keywords = "await"
+        else:
+            # probably dead codepath
+            keywords = "async/await"
 
-            if isinstance(node, ast.AsyncFor):
-                keywords = "async for"
-            elif isinstance(node, ast.AsyncWith):
-                keywords = "async with"
-            elif isinstance(node, ast.AsyncFunctionDef):
-                keywords = "async def"
-            elif isinstance(node, ast.Await):
-                keywords = "await"
-            else:
-                # probably dead codepath
-                keywords = "async/await"
-
-            msg = (
-                f"Prohibited use of '{keywords}', which is not supported "
-                f"for target_version='{ctx.cfg.target_version}'."
-            )
-            raise common.CheckError(msg, node)
+        msg = (
+            f"Prohibited use of '{keywords}', which is not supported "
+            f"for target_version='{ctx.cfg.target_version}'."
+        )
+        raise common.CheckError(msg, node)
 
 
 class NoYieldFromChecker(cb.CheckerBase):
 
-    version_info = common.VersionInfo(apply_until="3.2", works_since="3.3")
+    version_info   = common.VersionInfo(apply_until="3.2", works_since="3.3")
+    dispatch_types = (ast.YieldFrom,)
 
-    def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> None:
+    # the target version is part of the error message
+    target_independent = False
 
-        for node in ast.walk(tree):
-            if isinstance(node, ast.YieldFrom):
-                msg = (
-                    "Prohibited use of 'yield from', which is not supported "
-                    f"for your target_version={ctx.cfg.target_version}"
-                )
-                raise common.CheckError(msg, node)
+    def check_node(self, ctx: common.BuildContext, node: ast.AST) -> None:
+        msg = (
+            "Prohibited use of 'yield from', which is not supported "
+            f"for your target_version={ctx.cfg.target_version}"
+        )
+        raise common.CheckError(msg, node)
 
 
 class NoMatMultOpChecker(cb.CheckerBase):
 
-    version_info = common.VersionInfo(apply_until="3.4", works_since="3.5")
+    version_info   = common.VersionInfo(apply_until="3.4", works_since="3.5")
+    dispatch_types = (ast.BinOp,)
 
-    def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> None:
+    def check_node(self, ctx: common.BuildContext, node: ast.AST) -> None:
         if not hasattr(ast, 'MatMult'):
             return
 
-        for node in ast.walk(tree):
-            if not isinstance(node, ast.BinOp):
-                continue
-
-            if not isinstance(node.op, ast.MatMult):
-                continue
+        assert isinstance(node, ast.BinOp)
+        if not isinstance(node.op, ast.MatMult):
+            return
 
-            msg = "Prohibited use of matrix multiplication '@' operator."
-            raise common.CheckError(msg, node)
+        msg = "Prohibited use of matrix multiplication '@' operator."
+        raise common.CheckError(msg, node)
 
 
 def _raise_if_complex_named_tuple(node: ast.ClassDef) -> None:
@@ -215,35 +196,38 @@ def _raise_if_complex_named_tuple(node: ast.ClassDef) -> None:
 
 class NoComplexNamedTuple(cb.CheckerBase):
 
-    version_info = common.VersionInfo(apply_until="3.4", works_since="3.5")
+    version_info   = common.VersionInfo(apply_until="3.4", works_since="3.5")
+    dispatch_types = (ast.Import, ast.ImportFrom, ast.ClassDef)
 
-    def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> None:
-        _typing_module_name   : typ.Optional[str] = None
-        _namedtuple_class_name: str = "NamedTuple"
+    _typing_module_name   : typ.Optional[str]
+    _namedtuple_class_name: str
 
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Import):
-                for alias in node.names:
-                    if alias.name == 'typing':
-                        _typing_module_name = alias.name if alias.asname is None else alias.asname
-                continue
+    def __init__(self) -> None:
+        self._typing_module_name    = None
+        self._namedtuple_class_name = "NamedTuple"
+
+    def check_node(self, ctx: common.BuildContext, node: ast.AST) -> None:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == 'typing':
+                    self._typing_module_name = alias.name if alias.asname is None else alias.asname
+            return
 
-            if isinstance(node, ast.ImportFrom) and node.module == 'typing':
+        if isinstance(node, ast.ImportFrom):
+            if node.module == 'typing':
                 for alias in node.names:
                     if alias.name == 'NamedTuple':
-                        _namedtuple_class_name = (
+                        self._namedtuple_class_name = (
                             alias.name if alias.asname is None else alias.asname
                         )
-                continue
+            return
 
-            is_namedtuple_class = (
-                isinstance(node, ast.ClassDef)
-                and (_typing_module_name or _namedtuple_class_name)
-                and utils.has_base_class(node, _typing_module_name, _namedtuple_class_name)
-            )
-            if is_namedtuple_class:
-                assert isinstance(node, ast.ClassDef), "mypy is stupid sometimes"
-                _raise_if_complex_named_tuple(node)
+        assert isinstance(node, ast.ClassDef)
+        is_namedtuple_class = utils.has_base_class(
+            node, self._typing_module_name, self._namedtuple_class_name
+        )
+        if is_namedtuple_class:
+            _raise_if_complex_named_tuple(node)
 
 
 # NOTE (mb 2018-06-24): I don't know how this could be done reliably.
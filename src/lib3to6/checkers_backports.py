@@ -6,6 +6,7 @@
 import ast
 import typing as typ
 import logging
+import functools
 
 from . import common
 from . import checker_base as cb
@@ -30,13 +31,6 @@ class ModuleVersionInfo(typ.NamedTuple):
     backport_package: typ.Optional[str]
 
 
-def parse_version(version: str) -> typ.Any:
-    # pylint: disable=import-outside-toplevel; lazy import to speed up --help
-    import pkg_resources
-
-    return pkg_resources.parse_version(version)
-
-
 MAYBE_UNUSABLE_MODULES = {
     # case 1 (simple). Always error because no backport available
     'asyncio': ModuleVersionInfo("3.4", None, None),
@@ -74,11 +68,26 @@ def _iter_module_names(node: ast.AST) -> typ.Iterable[str]:
             yield mname
 
 
-def _iter_maybe_unusable_modules(node: ast.AST) -> typ.Iterable[typ.Tuple[str, ModuleVersionInfo]]:
-    for mname in _iter_module_names(node):
-        vnfo = MAYBE_UNUSABLE_MODULES.get(mname)
-        if vnfo:
-            yield (mname, vnfo)
+# by module name, the parsed ModuleVersionInfo.available_since
+_AVAILABLE_SINCE = {
+    mname: common.parse_version(vnfo.available_since)
+    for mname, vnfo in MAYBE_UNUSABLE_MODULES.items()
+}
+
+
+@functools.lru_cache(maxsize=None)
+def unusable_modules(target_version: str) -> typ.Dict[str, ModuleVersionInfo]:
+    """Modules of MAYBE_UNUSABLE_MODULES which are not available for target_version.
+
+    >>> sorted(unusable_modules("3.6"))
+    ['contextvars', 'dataclasses', 'importlib.resources']
+    """
+    version = common.parse_version(target_version)
+    return {
+        mname: vnfo
+        for mname, vnfo in MAYBE_UNUSABLE_MODULES.items()
+        if version < _AVAILABLE_SINCE[mname]
+    }
 
 
 class NoUnusableImportsChecker(cb.CheckerBase):
@@ -95,7 +104,11 @@ class NoUnusableImportsChecker(cb.CheckerBase):
     #   except ImportError:
     #       improt backport_module as newmodule
 
-    def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> None:
+    target_independent = False
+
+    def check_module(
+        self, ctx: common.BuildContext, tree: ast.Module, facts: cb.ModuleFacts
+    ) -> None:
         # NOTE (mb 2020-05-28):
         #   - Strict mode fails hard
         #   - Only raises an error if an unusable module is not used
@@ -108,10 +121,12 @@ class NoUnusableImportsChecker(cb.CheckerBase):
         install_requires: typ.Optional[set[str]] = ctx.cfg.install_requires
 
         target_version = ctx.cfg.target_version
+        # modules which the target supports are not in the lookup
+        maybe_unusable = unusable_modules(target_version)
         for node in ast.iter_child_nodes(tree):
-            for mname, vnfo in _iter_maybe_unusable_modules(node):
-                if parse_version(target_version) >= parse_version(vnfo.available_since):
-                    # target supports the newer name
+            for mname in _iter_module_names(node):
+                vnfo = maybe_unusable.get(mname)
+                if vnfo is None:
                     continue
 
                 bppkg = vnfo.backport_package
@@ -0,0 +1,65 @@
+# This file is part of the lib3to6 project
+# https://github.com/mbarkhau/lib3to6
+#
+# Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+
+import ast
+import typing as typ
+
+CodegenBackend = typ.Callable[[ast.AST], str]
+
+# NOTE (mb 2021-10-17): astor is imported when it is first used, so
+#   that it isn't imported by modules which are never regenerated.
+
+
+def astor_to_source(node: ast.AST) -> str:
+    # pylint: disable=import-outside-toplevel; lazy import, astor is slow to import
+    import astor
+
+    return astor.to_source(node)
+
+
+def _join_source(source: typ.List[str]) -> str:
+    return "".join(source)
+
+
+def astor_fast_to_source(node: ast.AST) -> str:
+    # NOTE (mb 2021-10-17): The default pretty_source of astor splits
+    #   long lines and minimizes parens, which is most of its cost.
+    #   Without it, lines can get long, but they are still valid.
+    # pylint: disable=import-outside-toplevel; lazy import, astor is slow to import
+    import astor
+
+    return astor.to_source(node, pretty_source=_join_source)
+
+
+def unparse_to_source(node: ast.AST) -> str:
+    # NOTE (mb 2021-10-17): ast.unparse looks up type comments by
+    #   lineno, which nodes created by fixers don't have.
+    ast.fix_missing_locations(node)
+    # pylint:disable=no-member ; only available since python 3.9
+    return ast.unparse(node) + "\n"  # type: ignore[attr-defined]
+
+
+DEFAULT_BACKEND = 'astor'
+
+BACKENDS: typ.Dict[str, CodegenBackend] = {
+    'astor'     : astor_to_source,
+    'astor_fast': astor_fast_to_source,
+}
+
+if hasattr(ast, 'unparse'):
+    BACKENDS['unparse'] = unparse_to_source
+
+
+def get_backend(name: str) -> CodegenBackend:
+    backend = BACKENDS.get(name)
+    if backend is None:
+        available = ", ".join(sorted(BACKENDS))
+        raise ValueError(f"Invalid codegen backend '{name}', must be one of: {available}")
+    return backend
+
+
+def to_source(node: ast.AST, backend: str = DEFAULT_BACKEND) -> str:
+    return get_backend(backend)(node)
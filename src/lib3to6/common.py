@@ -4,9 +4,12 @@
 # Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
 # SPDX-License-Identifier: MIT
 
+import re
 import ast
+import sys
 import typing as typ
 import builtins
+import functools
 
 PackageName      = str
 PackageDirectory = str
@@ -14,6 +17,15 @@ PackageDir       = typ.Dict[PackageName, PackageDirectory]
 
 InstallRequires = typ.Optional[typ.Set[str]]
 
+# by new module name, the old module name (see fixers_import_fallback)
+ImportFallbacks = typ.Dict[str, str]
+
+# by new builtin name, "<module>.<old_name>" (see fixers_builtin_rename)
+BuiltinRenames = typ.Dict[str, str]
+
+# Number of parallel workers, if it isn't configured explicitly.
+ENV_JOBS = 'LIB3TO6_JOBS'
+
 
 ConstantNodeTypes: typ.Tuple[typ.Type[ast.Constant], ...] = (ast.Constant,)
 
@@ -47,6 +59,12 @@ class BuildConfig(typ.NamedTuple):
     fixers          : str
     checkers        : str
     install_requires: InstallRequires
+    codegen         : str = 'astor'
+    cache_dir       : typ.Optional[str] = None
+    cache_size      : typ.Optional[int] = None
+    jobs            : typ.Optional[int] = None
+    import_fallbacks: typ.Optional[ImportFallbacks] = None
+    builtin_renames : typ.Optional[BuiltinRenames ] = None
 
 
 class BuildContext(typ.NamedTuple):
@@ -63,6 +81,9 @@ def init_build_context(
     checkers        : str             = "",
     install_requires: InstallRequires = None,
     filepath        : str             = "<filepath>",
+    codegen         : str             = 'astor',
+    import_fallbacks: typ.Optional[ImportFallbacks] = None,
+    builtin_renames : typ.Optional[BuiltinRenames ] = None,
 ) -> BuildContext:
     cfg = BuildConfig(
         target_version=target_version,
@@ -71,6 +92,9 @@ def init_build_context(
         fixers=fixers,
         checkers=checkers,
         install_requires=install_requires,
+        codegen=codegen,
+        import_fallbacks=import_fallbacks,
+        builtin_renames=builtin_renames,
     )
     return BuildContext(cfg=cfg, filepath=filepath)
 
@@ -102,6 +126,14 @@ class CheckError(Exception):
         self.lineno = get_node_lineno(node, parent)
         super().__init__(msg)
 
+    def add_location(self, filepath: str) -> None:
+        """Prefix the message with the filepath and lineno."""
+        loc = filepath
+        if self.lineno >= 0:
+            loc += "@" + str(self.lineno)
+
+        self.args = (loc + " - " + self.args[0],) + self.args[1:]
+
 
 class FixerError(Exception):
 
@@ -123,6 +155,10 @@ class FixerError(Exception):
         self.filepath = filepath
         super().__init__(msg)
 
+    def __reduce__(self) -> typ.Any:
+        # required to pass errors from worker processes
+        return (FixerError, (self.msg, self.node, self.parent, self.filepath))
+
     def __str__(self) -> str:
         msg = self.msg
         if self.filepath:
@@ -131,6 +167,52 @@ class FixerError(Exception):
         return msg
 
 
+VersionTuple = typ.Tuple[int, ...]
+
+# the release segment of a version, without any pre-release suffix
+VERSION_RE = re.compile(r"\d+(\.\d+)*")
+
+
+@functools.lru_cache(maxsize=None)
+def parse_version(version: str) -> VersionTuple:
+    """Parse a version such as "3.7" into a tuple of ints.
+
+    Trailing zeros are dropped, so "3" and "3.0" compare as equal.
+    Results are memoized, so each version is only parsed once and the
+    same (interned) tuple is returned on every call.
+
+    >>> parse_version("3.7")
+    (3, 7)
+    >>> parse_version("3.0") == parse_version("3")
+    True
+    >>> parse_version("2.7") < parse_version("3.4") < parse_version("3.10")
+    True
+
+    Pre-release and other suffixes are ignored.
+
+    >>> parse_version("3.7rc1"), parse_version("3.8.0b2"), parse_version("3.9.1+local")
+    ((3, 7), (3, 8), (3, 9, 1))
+    >>> parse_version("latest")
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid version 'latest', expected a version such as '3.7'
+    """
+    match = VERSION_RE.match(version.strip())
+    if match is None:
+        raise ValueError(f"Invalid version '{version}', expected a version such as '3.7'")
+
+    parts = [int(part) for part in match.group(0).split(".")]
+    while len(parts) > 1 and parts[-1] == 0:
+        parts.pop()
+    return tuple(parts)
+
+
+def get_source_version() -> str:
+    """Version of the running interpreter, such as "3.7"."""
+    ver = sys.version_info
+    return f"{ver.major}.{ver.minor}"
+
+
 class VersionInfo:
     """Compatibility info for Fixer and Checker classes.
 
@@ -141,10 +223,10 @@ class VersionInfo:
     """
 
     # since/until is inclusive
-    apply_since: typ.List[int]
-    apply_until: typ.Optional[typ.List[int]]
-    works_since: typ.List[int]
-    works_until: typ.Optional[typ.List[int]]
+    apply_since: VersionTuple
+    apply_until: typ.Optional[VersionTuple]
+    works_since: VersionTuple
+    works_until: typ.Optional[VersionTuple]
 
     def __init__(
         self,
@@ -154,26 +236,19 @@ class VersionInfo:
         works_until: typ.Optional[str] = None,
     ) -> None:
 
-        self.apply_since = [int(part) for part in apply_since.split(".")]
-        if apply_until is None:
-            self.apply_until = None
-        else:
-            self.apply_until = [int(part) for part in apply_until.split(".")]
+        self.apply_since = parse_version(apply_since)
+        self.apply_until = None if apply_until is None else parse_version(apply_until)
 
-        if works_since is None:
-            # Implicitly, if it's applied since a version, it
-            # also works since then.
-            self.works_since = self.apply_since
-        else:
-            self.works_since = [int(part) for part in works_since.split(".")]
+        # Implicitly, if it's applied since a version, it
+        # also works since then.
+        self.works_since = self.apply_since if works_since is None else parse_version(works_since)
+        self.works_until = None if works_until is None else parse_version(works_until)
 
-        if works_until is None:
-            self.works_until = None
-        else:
-            self.works_until = [int(part) for part in works_until.split(".")]
+        # by (source_version, target_version)
+        self._applicable: typ.Dict[typ.Tuple[str, str], bool] = {}
 
     def is_required_for(self, version: str) -> bool:
-        version_num = [int(part) for part in version.split(".")]
+        version_num = parse_version(version)
         apply_until = self.apply_until
         if apply_until and apply_until < version_num:
             return False
@@ -181,7 +256,7 @@ class VersionInfo:
             return self.apply_since <= version_num
 
     def is_compatible_with(self, version: str) -> bool:
-        version_num = [int(part) for part in version.split(".")]
+        version_num = parse_version(version)
         works_since = self.works_since
         works_until = self.works_until
         if works_since and version_num < works_since:
@@ -192,7 +267,14 @@ class VersionInfo:
             return True
 
     def is_applicable_to(self, source_version: str, target_version: str) -> bool:
-        return self.is_required_for(target_version) and self.is_compatible_with(source_version)
+        key = (source_version, target_version)
+        is_applicable = self._applicable.get(key)
+        if is_applicable is None:
+            is_applicable = (
+                self.is_required_for(target_version) and self.is_compatible_with(source_version)
+            )
+            self._applicable[key] = is_applicable
+        return is_applicable
 
 
 # NOTE (mb 2018-06-29): None of the fixers use asname. If a
@@ -13,15 +13,78 @@ from . import common
 # https://docs.python.org/3/library/__future__.html
 
 
+DispatchTypes = typ.Tuple[typ.Type[ast.AST], ...]
+
+NodeHandler = typ.Callable[[ast.AST], typ.Optional[ast.AST]]
+
+
 class FixerBase:
 
     version_info       : common.VersionInfo
     required_imports   : typ.Set[common.ImportDecl]
     module_declarations: typ.Set[str]
 
+    # Changes to the tree are recorded with mark_modified. Replacement
+    # of a node by a dispatch handler is recorded by the FixerDispatcher.
+    # Required imports and module declarations are tracked separately.
+    #
+    # modified_stmts are the top level statements of the module which
+    # were changed in place. It is None if a change was recorded
+    # without the statement, in which case it may be anywhere.
+    modified_count: int
+    modified_stmts: typ.Optional[typ.List[ast.stmt]]
+
+    # Node types for which the fixer implements a visit_<NodeType>
+    # method. Such fixers are applied by a FixerDispatcher, which may
+    # share a single traversal of the module with other fixers. A
+    # handler is only given the node itself, so it must not depend on
+    # other parts of the module. Fixers that need the whole module
+    # leave this empty and implement apply_fix instead.
+    dispatch_types: DispatchTypes = ()
+
+    # Features of a module (see checker_base.iter_features) which the
+    # fixer acts on. If a module has none of them, the fixer is not
+    # applied. By default, these are the names of the dispatch_types.
+    # Fixers without any trigger features are always applied.
+    trigger_features: typ.Tuple[str, ...] = ()
+
+    # Whether the fixer makes the same changes for any target version
+    # to which it applies. When a module is transpiled for multiple
+    # targets, those with the same fixers share the fixed tree.
+    target_independent: bool = True
+
     def __init__(self) -> None:
         self.required_imports    = set()
         self.module_declarations = set()
+        self.modified_count      = 0
+        self.modified_stmts      = []
+
+    @property
+    def is_modified(self) -> bool:
+        return self.modified_count > 0
+
+    def mark_modified(self, stmt: typ.Optional[ast.stmt] = None) -> None:
+        self.modified_count += 1
+        if stmt is None:
+            self.modified_stmts = None
+        elif self.modified_stmts is not None:
+            self.modified_stmts.append(stmt)
+
+    @classmethod
+    def from_config(cls, cfg: common.BuildConfig) -> 'FixerBase':
+        """Create the fixer for a build configuration.
+
+        Fixers which have options in the BuildConfig override this.
+        """
+        return cls()
+
+    def get_trigger_features(self) -> typ.Set[str]:
+        if self.trigger_features:
+            return set(self.trigger_features)
+        elif ast.Module in self.dispatch_types:
+            return set()
+        else:
+            return {node_type.__name__ for node_type in self.dispatch_types}
 
     def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> ast.Module:
         try:
@@ -34,10 +97,184 @@ class FixerBase:
             raise
 
     def apply_fix(self, ctx: common.BuildContext, tree: ast.Module) -> ast.Module:
+        if self.dispatch_types:
+            return FixerDispatcher([self]).apply_fix(ctx, tree)
         raise NotImplementedError()
 
 
 class TransformerFixerBase(FixerBase, ast.NodeTransformer):
     def apply_fix(self, ctx: common.BuildContext, tree: ast.Module) -> ast.Module:
+        # NOTE (mb 2021-10-17): A NodeTransformer may change any node
+        #   and we can't tell if it did, so the tree is assumed to be
+        #   modified.
+        self.mark_modified()
         new_tree = self.visit(tree)
         return typ.cast(ast.Module, new_tree)
+
+
+class FixerDispatcher(ast.NodeTransformer):
+    """Apply multiple fixers with a single traversal of a module.
+
+    The table of node type -> handlers is built once, in the order
+    in which the fixers are given. The tree is traversed top down and
+    the handlers for a node are called before its children are
+    visited, so a subtree that is replaced or dropped by a handler is
+    not seen by any fixer. For any one node, the fixers are applied
+    in the same order as if each of them had its own pass. When a
+    handler replaces a node with a node of a different type, the
+    remaining fixers are dispatched on the replacement.
+
+    Each node is fixed at most once. A replacement may contain the
+    original node (e.g. an import wrapped in a try/except), which is
+    then not passed to the handlers again.
+
+    Changes made by the handlers are recorded per top level statement
+    of the module (see FixerBase.modified_stmts).
+    """
+
+    fixers  : typ.List[FixerBase]
+    handlers: typ.Dict[typ.Type[ast.AST], typ.List[typ.Tuple[int, NodeHandler]]]
+    is_deep : bool
+
+    modified_count  : int
+    modified_stmts  : typ.Optional[typ.List[ast.stmt]]
+    is_in_stmt      : bool
+    is_stmt_modified: bool
+    # NOTE (mb 2021-10-17): Nodes are kept as values so that their
+    #   id cannot be reused by a new node during the traversal.
+    fixed_nodes: typ.Dict[int, ast.AST]
+
+    def __init__(self, fixers: typ.Sequence[FixerBase]) -> None:
+        self.fixers   = list(fixers)
+        self.handlers = {}
+        for fixer_index, fixer in enumerate(self.fixers):
+            for node_type in fixer.dispatch_types:
+                handler = getattr(fixer, "visit_" + node_type.__name__)
+                self.handlers.setdefault(node_type, []).append((fixer_index, handler))
+
+        # If only the module node itself is handled, there is no need to
+        # traverse the rest of the tree.
+        self.is_deep     = any(node_type is not ast.Module for node_type in self.handlers)
+        self.fixed_nodes = {}
+
+        self.modified_count   = 0
+        self.modified_stmts   = []
+        self.is_in_stmt       = False
+        self.is_stmt_modified = False
+
+    @property
+    def is_modified(self) -> bool:
+        return self.modified_count > 0
+
+    def mark_modified(self) -> None:
+        self.modified_count += 1
+        if self.is_in_stmt:
+            self.is_stmt_modified = True
+        else:
+            self.modified_stmts = None
+
+    def __call__(self, ctx: common.BuildContext, tree: ast.Module) -> ast.Module:
+        try:
+            return self.apply_fix(ctx, tree)
+        except common.FixerError as ex:
+            if ex.parent is None:
+                ex.parent = tree
+            if ex.filepath is None:
+                ex.filepath = ctx.filepath
+            raise
+
+    def apply_fix(self, ctx: common.BuildContext, tree: ast.Module) -> ast.Module:
+        try:
+            if self.is_deep:
+                new_tree = self.visit(tree)
+            else:
+                new_tree = self.fix_node(tree)
+        finally:
+            self.fixed_nodes = {}
+        return typ.cast(ast.Module, new_tree)
+
+    def fix_node(self, node: ast.AST) -> typ.Optional[ast.AST]:
+        node_handlers = self.handlers.get(type(node), [])
+        if not node_handlers:
+            return node
+
+        if id(node) in self.fixed_nodes:
+            return node
+        self.fixed_nodes[id(node)] = node
+
+        min_index     = 0
+        i             = 0
+        while i < len(node_handlers):
+            fixer_index, handler = node_handlers[i]
+            i += 1
+            if fixer_index < min_index:
+                continue
+
+            fixer          = self.fixers[fixer_index]
+            modified_count = fixer.modified_count
+
+            new_node = handler(node)
+            if new_node is not node:
+                fixer.mark_modified()
+            if fixer.modified_count > modified_count:
+                self.mark_modified()
+
+            if new_node is None:
+                return None
+
+            if new_node is not node:
+                self.fixed_nodes[id(new_node)] = new_node
+            if type(new_node) is not type(node):
+                node_handlers = self.handlers.get(type(new_node), [])
+                min_index     = fixer_index + 1
+                i             = 0
+            node = new_node
+        return node
+
+    def visit(self, node: ast.AST) -> typ.Optional[ast.AST]:
+        if self.is_in_stmt or not isinstance(node, ast.stmt):
+            return self._visit(node)
+
+        # top level statement of the module
+        self.is_in_stmt       = True
+        self.is_stmt_modified = False
+        try:
+            new_node = self._visit(node)
+        finally:
+            self.is_in_stmt = False
+
+        if self.is_stmt_modified and new_node is not None and self.modified_stmts is not None:
+            self.modified_stmts.append(typ.cast(ast.stmt, new_node))
+        return new_node
+
+    def _visit(self, node: ast.AST) -> typ.Optional[ast.AST]:
+        new_node = self.fix_node(node)
+        if new_node is None:
+            return None
+        else:
+            return self.generic_visit(new_node)
+
+
+FixerPass = typ.Union[FixerBase, FixerDispatcher]
+
+
+def iter_fixer_passes(fixers: typ.Sequence[FixerBase]) -> typ.Iterable[FixerPass]:
+    """Group consecutive dispatch fixers so they share one traversal.
+
+    Fixers without dispatch_types get a pass of their own. Since they
+    may depend on the result of the fixers before them (and vice
+    versa), a dispatch fixer is never moved across such a fixer.
+    """
+    dispatch_fixers: typ.List[FixerBase] = []
+    for fixer in fixers:
+        if fixer.dispatch_types:
+            dispatch_fixers.append(fixer)
+            continue
+
+        if dispatch_fixers:
+            yield FixerDispatcher(dispatch_fixers)
+            dispatch_fixers = []
+        yield fixer
+
+    if dispatch_fixers:
+        yield FixerDispatcher(dispatch_fixers)
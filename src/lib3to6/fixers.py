@@ -7,6 +7,7 @@
 import ast
 import sys
 import typing as typ
+import warnings
 
 from . import utils
 from . import common
@@ -21,47 +22,10 @@ from .fixers_future import WithStatementFutureFixer
 from .fixers_future import AbsoluteImportFutureFixer
 from .fixers_future import UnicodeLiteralsFutureFixer
 from .fixers_future import RemoveUnsupportedFuturesFixer
-from .fixers_builtin_rename import UnichrToChrFixer
-from .fixers_builtin_rename import UnicodeToStrFixer
-from .fixers_builtin_rename import XrangeToRangeFixer
-from .fixers_builtin_rename import RawInputToInputFixer
-from .fixers_import_fallback import QueueImportFallbackFixer
-from .fixers_import_fallback import DbmGnuImportFallbackFixer
-from .fixers_import_fallback import PickleImportFallbackFixer
-from .fixers_import_fallback import ThreadImportFallbackFixer
-from .fixers_import_fallback import WinRegImportFallbackFixer
-from .fixers_import_fallback import CopyRegImportFallbackFixer
-from .fixers_import_fallback import ReprLibImportFallbackFixer
-from .fixers_import_fallback import TkinterImportFallbackFixer
-from .fixers_import_fallback import BuiltinsImportFallbackFixer
-from .fixers_import_fallback import HtmlParserImportFallbackFixer
-from .fixers_import_fallback import HttpClientImportFallbackFixer
-from .fixers_import_fallback import TkinterDndImportFallbackFixer
-from .fixers_import_fallback import TkinterTixImportFallbackFixer
-from .fixers_import_fallback import TkinterTtkImportFallbackFixer
-from .fixers_import_fallback import DummyThreadImportFallbackFixer
-from .fixers_import_fallback import HttpCookiesImportFallbackFixer
-from .fixers_import_fallback import TkinterFontImportFallbackFixer
-from .fixers_import_fallback import UrllibErrorImportFallbackFixer
-from .fixers_import_fallback import UrllibParseImportFallbackFixer
-from .fixers_import_fallback import ConfigParserImportFallbackFixer
-from .fixers_import_fallback import SocketServerImportFallbackFixer
-from .fixers_import_fallback import XMLRPCClientImportFallbackFixer
-from .fixers_import_fallback import XmlrpcServerImportFallbackFixer
-from .fixers_import_fallback import EmailMimeBaseImportFallbackFixer
-from .fixers_import_fallback import EmailMimeTextImportFallbackFixer
-from .fixers_import_fallback import HttpCookiejarImportFallbackFixer
-from .fixers_import_fallback import TkinterDialogImportFallbackFixer
-from .fixers_import_fallback import UrllibRequestImportFallbackFixer
-from .fixers_import_fallback import EmailMimeImageImportFallbackFixer
-from .fixers_import_fallback import TkinterConstantsImportFallbackFixer
-from .fixers_import_fallback import TkinterMessageboxImportFallbackFixer
-from .fixers_import_fallback import UrllibRobotParserImportFallbackFixer
-from .fixers_import_fallback import EmailMimeMultipartImportFallbackFixer
-from .fixers_import_fallback import TkinterColorchooserImportFallbackFixer
-from .fixers_import_fallback import TkinterCommonDialogImportFallbackFixer
-from .fixers_import_fallback import TkinterScrolledTextImportFallbackFixer
-from .fixers_import_fallback import EmailMimeNonmultipartImportFallbackFixer
+from .fixers_builtin_rename import BuiltinRenameFixer
+from .fixers_import_fallback import ModuleImportFallbackFixer
+from .fixers_builtin_rename import DEPRECATED_FIXERS as _BUILTIN_RENAME_ALIASES
+from .fixers_import_fallback import DEPRECATED_FIXERS as _IMPORT_FALLBACK_ALIASES
 from .fixers_unpacking_generalization import UnpackingGeneralizationsFixer
 
 AstStr = getattr(ast, 'Str', ast.Constant)
@@ -82,13 +46,19 @@ class _FRAFContext:
 
     local_classes: typ.Set[str]
     known_classes: typ.Set[str]
+    is_modified  : bool
 
     def __init__(self, local_classes: typ.Set[str]) -> None:
         self.local_classes = local_classes
         self.known_classes = set()
+        self.is_modified   = False
 
     def is_forward_ref(self, name: str) -> bool:
-        return name in self.local_classes and name not in self.known_classes
+        is_ref = name in self.local_classes and name not in self.known_classes
+        if is_ref:
+            # every forward ref found is replaced with a string
+            self.is_modified = True
+        return is_ref
 
     def update_index_elts(self, elts: Elts) -> None:
         # NOTE (mb 2020-07-19): We modify elts during iteration
@@ -196,33 +166,37 @@ class ForwardReferenceAnnotationsFixer(fb.FixerBase):
 
         fraf_ctx = _FRAFContext(local_classes)
         fraf_ctx.remove_forward_references(tree)
+        if fraf_ctx.is_modified:
+            self.mark_modified()
         return tree
 
 
 class RemoveFunctionDefAnnotationsFixer(fb.FixerBase):
 
-    version_info = common.VersionInfo(apply_since="1.0", apply_until="2.7")
+    version_info   = common.VersionInfo(apply_since="1.0", apply_until="2.7")
+    dispatch_types = (ast.FunctionDef,)
 
-    def apply_fix(self, ctx: common.BuildContext, tree: ast.Module) -> ast.Module:
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                node.returns = None
-                for arg in node.args.args:
-                    arg.annotation = None
-                for arg in node.args.kwonlyargs:
-                    arg.annotation = None
-
-                if node.args.kwarg:
-                    node.args.kwarg.annotation = None
-                if node.args.vararg:
-                    node.args.vararg.annotation = None
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> ast.FunctionDef:
+        args = node.args.args + node.args.kwonlyargs
+        if node.args.kwarg:
+            args.append(node.args.kwarg)
+        if node.args.vararg:
+            args.append(node.args.vararg)
 
-        return tree
+        if node.returns or any(arg.annotation for arg in args):
+            self.mark_modified()
+
+        node.returns = None
+        for arg in args:
+            arg.annotation = None
+
+        return node
 
 
-class RemoveAnnAssignFixer(fb.TransformerFixerBase):
+class RemoveAnnAssignFixer(fb.FixerBase):
 
-    version_info = common.VersionInfo(apply_since="1.0", apply_until="3.5")
+    version_info   = common.VersionInfo(apply_since="1.0", apply_until="3.5")
+    dispatch_types = (ast.AnnAssign,)
 
     @staticmethod
     def visit_AnnAssign(node: ast.AnnAssign) -> ast.Assign:
@@ -238,12 +212,12 @@ class RemoveAnnAssignFixer(fb.TransformerFixerBase):
             raise common.FixerError("Unexpected Node type", tgt_node)
 
 
-class ShortToLongFormSuperFixer(fb.TransformerFixerBase):
+class ShortToLongFormSuperFixer(fb.FixerBase):
 
-    version_info = common.VersionInfo(apply_since="2.2", apply_until="2.7")
+    version_info   = common.VersionInfo(apply_since="2.2", apply_until="2.7")
+    dispatch_types = (ast.ClassDef,)
 
-    @staticmethod
-    def visit_ClassDef(node: ast.ClassDef) -> ast.ClassDef:
+    def visit_ClassDef(self, node: ast.ClassDef) -> ast.ClassDef:
         for maybe_method in ast.walk(node):
             if not isinstance(maybe_method, ast.FunctionDef):
                 continue
@@ -271,18 +245,22 @@ class ShortToLongFormSuperFixer(fb.TransformerFixerBase):
                     ast.Name(id=node.name   , ctx=ast.Load()),
                     ast.Name(id=self_arg.arg, ctx=ast.Load()),
                 ]
+                self.mark_modified()
         return node
 
 
-class InlineKWOnlyArgsFixer(fb.TransformerFixerBase):
+class InlineKWOnlyArgsFixer(fb.FixerBase):
 
-    version_info = common.VersionInfo(apply_since="1.0", apply_until="2.99")
+    version_info     = common.VersionInfo(apply_since="1.0", apply_until="2.99")
+    dispatch_types   = (ast.FunctionDef,)
+    trigger_features = ("kwonlyargs",)
 
-    @staticmethod
-    def visit_FunctionDef(node: ast.FunctionDef) -> ast.FunctionDef:
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> ast.FunctionDef:
         if not node.args.kwonlyargs:
             return node
 
+        self.mark_modified()
+
         if node.args.kwarg:
             kw_name = node.args.kwarg.arg
         else:
@@ -328,45 +306,23 @@ class InlineKWOnlyArgsFixer(fb.TransformerFixerBase):
         return node
 
 
-class NewStyleClassesFixer(fb.TransformerFixerBase):
+class NewStyleClassesFixer(fb.FixerBase):
 
-    version_info = common.VersionInfo(apply_since="2.0", apply_until="2.7")
+    version_info   = common.VersionInfo(apply_since="2.0", apply_until="2.7")
+    dispatch_types = (ast.ClassDef,)
 
     def visit_ClassDef(self, node: ast.ClassDef) -> ast.ClassDef:
-        self.generic_visit(node)
         if len(node.bases) == 0:
             node.bases.append(ast.Name(id="object", ctx=ast.Load()))
+            self.mark_modified()
         return node
 
 
-class ItertoolsBuiltinsFixer(fb.TransformerFixerBase):
-
-    version_info = common.VersionInfo(
-        apply_since="2.3",  # introduction of the itertools module
-        apply_until="2.7",
-        works_until="3.99",
-    )
-
-    # WARNING (mb 2018-06-09): This fix is very broad, and should
-    #   only be used in combination with a sanity check that the
-    #   builtin names are not being overridden.
-
-    def apply_fix(self, ctx: common.BuildContext, tree: ast.Module) -> ast.Module:
-        new_tree = self.visit(tree)
-        return typ.cast(ast.Module, new_tree)
-
-    def visit_Name(self, node: ast.Name) -> typ.Union[ast.Name, ast.Attribute]:
-        if isinstance(node.ctx, ast.Load) and node.id in ("map", "zip", "filter"):
-            self.required_imports.add(common.ImportDecl("itertools", None, None))
-            global_decl = f"{node.id} = getattr(itertools, 'i{node.id}', {node.id})"
-            self.module_declarations.add(global_decl)
-
-        return node
-
-
-class NamedTupleClassToAssignFixer(fb.TransformerFixerBase):
+class NamedTupleClassToAssignFixer(fb.FixerBase):
 
-    version_info = common.VersionInfo(apply_since="2.6", apply_until="3.4")
+    version_info     = common.VersionInfo(apply_since="2.6", apply_until="3.4")
+    dispatch_types   = (ast.Import, ast.ImportFrom, ast.ClassDef)
+    trigger_features = ("import:typing",)
 
     _typing_module_name   : typ.Optional[str]
     _namedtuple_class_name: typ.Optional[str]
@@ -397,7 +353,6 @@ class NamedTupleClassToAssignFixer(fb.TransformerFixerBase):
         return node
 
     def visit_ClassDef(self, node: ast.ClassDef) -> typ.Union[ast.ClassDef, ast.Assign]:
-        self.generic_visit(node)
         if len(node.bases) == 0:
             return node
 
@@ -457,6 +412,29 @@ else:
     NamedExprFixer = None
 
 
+# by name, fixers which were replaced by a table-driven fixer
+DEPRECATED_FIXERS: typ.Dict[str, typ.Type[fb.FixerBase]] = {
+    **_IMPORT_FALLBACK_ALIASES,
+    **_BUILTIN_RENAME_ALIASES,
+}
+
+
+def get_deprecated_fixer(name: str) -> typ.Type[fb.FixerBase]:
+    fixer_type  = DEPRECATED_FIXERS[name]
+    replacement = next(base for base in fixer_type.__mro__[1:] if not base.__name__.startswith("_"))
+    msg         = f"Fixer {name} is deprecated, it was replaced by {replacement.__name__}"
+    warnings.warn(msg, DeprecationWarning, stacklevel=3)
+    return fixer_type
+
+
+def __getattr__(name: str) -> typ.Type[fb.FixerBase]:
+    # NOTE (mb 2021-10-17): Deprecated fixers are not attributes of the
+    #   module, so they are only applied if they are selected by name.
+    if name in DEPRECATED_FIXERS:
+        return get_deprecated_fixer(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 __all__ = [
     "AnnotationsFutureFixer",
     "GeneratorStopFutureFixer",
@@ -468,54 +446,14 @@ __all__ = [
     "DivisionFutureFixer",
     "GeneratorsFutureFixer",
     "NestedScopesFutureFixer",
-    "ConfigParserImportFallbackFixer",
-    "SocketServerImportFallbackFixer",
-    "BuiltinsImportFallbackFixer",
-    "QueueImportFallbackFixer",
-    "CopyRegImportFallbackFixer",
-    "WinRegImportFallbackFixer",
-    "ReprLibImportFallbackFixer",
-    "ThreadImportFallbackFixer",
-    "DummyThreadImportFallbackFixer",
-    "HttpCookiejarImportFallbackFixer",
-    "UrllibParseImportFallbackFixer",
-    "UrllibRequestImportFallbackFixer",
-    "UrllibErrorImportFallbackFixer",
-    "UrllibRobotParserImportFallbackFixer",
-    "XMLRPCClientImportFallbackFixer",
-    "XmlrpcServerImportFallbackFixer",
-    "HtmlParserImportFallbackFixer",
-    "HttpClientImportFallbackFixer",
-    "HttpCookiesImportFallbackFixer",
-    "PickleImportFallbackFixer",
-    "DbmGnuImportFallbackFixer",
-    "EmailMimeBaseImportFallbackFixer",
-    "EmailMimeImageImportFallbackFixer",
-    "EmailMimeMultipartImportFallbackFixer",
-    "EmailMimeNonmultipartImportFallbackFixer",
-    "EmailMimeTextImportFallbackFixer",
-    "TkinterImportFallbackFixer",
-    "TkinterDialogImportFallbackFixer",
-    "TkinterScrolledTextImportFallbackFixer",
-    "TkinterTixImportFallbackFixer",
-    "TkinterTtkImportFallbackFixer",
-    "TkinterConstantsImportFallbackFixer",
-    "TkinterDndImportFallbackFixer",
-    "TkinterColorchooserImportFallbackFixer",
-    "TkinterCommonDialogImportFallbackFixer",
-    "TkinterFontImportFallbackFixer",
-    "TkinterMessageboxImportFallbackFixer",
-    "XrangeToRangeFixer",
-    "UnicodeToStrFixer",
-    "UnichrToChrFixer",
-    "RawInputToInputFixer",
+    "ModuleImportFallbackFixer",
+    "BuiltinRenameFixer",
     "RemoveFunctionDefAnnotationsFixer",
     "ForwardReferenceAnnotationsFixer",
     "RemoveAnnAssignFixer",
     "ShortToLongFormSuperFixer",
     "InlineKWOnlyArgsFixer",
     "NewStyleClassesFixer",
-    "ItertoolsBuiltinsFixer",
     "UnpackingGeneralizationsFixer",
     "NamedTupleClassToAssignFixer",
     "FStringToStrFormatFixer",
@@ -5,61 +5,173 @@
 # SPDX-License-Identifier: MIT
 
 import ast
+import typing as typ
+import functools
 
 from . import common
 from . import fixer_base as fb
+from .fixers_import_fallback import IMPORT_FALLBACKS
+
+# Builtins which were renamed in python 3 (or replaced by a function
+# of a module), by new name, the "<module>.<name>" to use if the module
+# has it. In python 3 the module doesn't have the old name, so the new
+# builtin is used.
+BUILTIN_RENAMES: common.BuiltinRenames = {
+    'range' : "builtins.xrange",
+    'str'   : "builtins.unicode",
+    'chr'   : "builtins.unichr",
+    'input' : "builtins.raw_input",
+    'map'   : "itertools.imap",
+    'zip'   : "itertools.izip",
+    'filter': "itertools.ifilter",
+}
+
+# WARNING (mb 2018-06-09): The renames of map/zip/filter are very
+#   broad, and should only be used in combination with a sanity check
+#   that the builtin names are not being overridden.
+
+_ITERTOOLS_VERSION_INFO = common.VersionInfo(
+    apply_since="2.3",  # introduction of the itertools module
+    apply_until="2.7",
+    works_until="3.99",
+)
+
+_DEFAULT_VERSION_INFO = common.VersionInfo(apply_until="2.7")
+
+# by new name, for which (source_version, target_version) the rename
+# is applied, if it differs from _DEFAULT_VERSION_INFO
+BUILTIN_RENAME_VERSIONS: typ.Dict[str, common.VersionInfo] = {
+    'map'   : _ITERTOOLS_VERSION_INFO,
+    'zip'   : _ITERTOOLS_VERSION_INFO,
+    'filter': _ITERTOOLS_VERSION_INFO,
+}
+
+# by new name, the import of the module and the declaration of the name
+Renames = typ.Dict[str, typ.Tuple[common.ImportDecl, str]]
+
+
+def init_renames(
+    builtin_renames : common.BuiltinRenames,
+    import_fallbacks: common.ImportFallbacks,
+    source_version  : typ.Optional[str] = None,
+    target_version  : typ.Optional[str] = None,
+) -> Renames:
+    """Parse the table of renames.
+
+    If source_version and target_version are given, only the renames
+    which apply to them are included (see BUILTIN_RENAME_VERSIONS).
+
+    >>> renames = init_renames({'range': "builtins.xrange"}, {'builtins': "__builtin__"})
+    >>> import_decl, decl_str = renames['range']
+    >>> import_decl
+    ImportDecl(module_name='builtins', import_name=None, py2_module_name='__builtin__')
+    >>> decl_str
+    "range = getattr(builtins, 'xrange', range)"
+    >>> sorted(init_renames(BUILTIN_RENAMES, {}, "3.9", "2.7"))
+    ['chr', 'filter', 'input', 'map', 'range', 'str', 'zip']
+    >>> sorted(init_renames(BUILTIN_RENAMES, {}, "3.9", "2.2"))
+    ['chr', 'input', 'range', 'str']
+    """
+    renames: Renames = {}
+    for new_name, qualname in builtin_renames.items():
+        module_name, _, old_name = qualname.rpartition(".")
+        if not module_name:
+            raise ValueError(f"Invalid builtin rename '{qualname}', expected '<module>.<name>'")
+
+        if source_version and target_version:
+            version_info = BUILTIN_RENAME_VERSIONS.get(new_name, _DEFAULT_VERSION_INFO)
+            if not version_info.is_applicable_to(source_version, target_version):
+                continue
+
+        import_decl = common.ImportDecl(module_name, None, import_fallbacks.get(module_name))
+        decl_str    = f"{new_name} = getattr({module_name}, '{old_name}', {new_name})"
+        renames[new_name] = (import_decl, decl_str)
+    return renames
+
+
+_DEFAULT_RENAMES = init_renames(BUILTIN_RENAMES, IMPORT_FALLBACKS)
+
+
+@functools.lru_cache(maxsize=16)
+def _init_default_renames(source_version: str, target_version: str) -> Renames:
+    return init_renames(BUILTIN_RENAMES, IMPORT_FALLBACKS, source_version, target_version)
+
+
+class BuiltinRenameFixer(fb.FixerBase):
+    """Declare the old builtins for names of BUILTIN_RENAMES which are used.
+
+    The renames are those of BUILTIN_RENAMES, extended by the
+    builtin_renames of the BuildConfig, which apply to the source and
+    target version. Each use of a name is a single lookup in the table.
+    """
+
+    version_info   = common.VersionInfo(apply_until="2.7")
+    dispatch_types = (ast.Name,)
+
+    renames   : Renames
+    used_names: typ.Set[str]
+
+    def __init__(self, renames: typ.Optional[Renames] = None) -> None:
+        super().__init__()
+        self.renames    = _DEFAULT_RENAMES if renames is None else renames
+        self.used_names = set()
+
+    @classmethod
+    def from_config(cls, cfg: common.BuildConfig) -> 'BuiltinRenameFixer':
+        source_version = common.get_source_version()
+        target_version = cfg.target_version
+        if cfg.builtin_renames is None and cfg.import_fallbacks is None:
+            return cls(_init_default_renames(source_version, target_version))
+
+        builtin_renames  = {**BUILTIN_RENAMES , **(cfg.builtin_renames  or {})}
+        import_fallbacks = {**IMPORT_FALLBACKS, **(cfg.import_fallbacks or {})}
+        return cls(init_renames(builtin_renames, import_fallbacks, source_version, target_version))
+
+    def visit_Name(self, node: ast.Name) -> ast.Name:
+        name = node.id
+        if name in self.used_names or not isinstance(node.ctx, ast.Load):
+            return node
+
+        rename = self.renames.get(name)
+        if rename:
+            import_decl, decl_str = rename
+            self.required_imports.add(import_decl)
+            self.module_declarations.add(decl_str)
+            self.used_names.add(name)
+
+        return node
+
+    def get_trigger_features(self) -> typ.Set[str]:
+        return {"name:" + new_name for new_name in self.renames}
+
+
+class _SelectedBuiltinRenameFixer(BuiltinRenameFixer):
+
+    new_names: typ.Tuple[str, ...]
+
+    def __init__(self, renames: typ.Optional[Renames] = None) -> None:
+        super().__init__(renames)
+        self.renames = {
+            new_name: rename
+            for new_name, rename in self.renames.items()
+            if new_name in self.new_names
+        }
+
+
+# NOTE (mb 2021-10-17): Before BuiltinRenameFixer, there were fixers
+#   for each rename. Their names can still be selected, which applies
+#   only the renames they were for.
+
+# by name of the (deprecated) fixer, the new names of the builtins
+DEPRECATED_FIXER_NEW_NAMES: typ.Dict[str, typ.Tuple[str, ...]] = {
+    'XrangeToRangeFixer'    : ("range",),
+    'UnicodeToStrFixer'     : ("str",),
+    'UnichrToChrFixer'      : ("chr",),
+    'RawInputToInputFixer'  : ("input",),
+    'ItertoolsBuiltinsFixer': ("map", "zip", "filter"),
+}
 
-
-class BuiltinsRenameFixerBase(fb.FixerBase):
-
-    new_name: str
-    old_name: str
-
-    def apply_fix(self, ctx: common.BuildContext, tree: ast.Module) -> ast.Module:
-        for node in ast.walk(tree):
-            is_access_to_builtin = (
-                isinstance(node, ast.Name)
-                and isinstance(node.ctx, ast.Load)
-                and node.id == self.new_name
-            )
-
-            if is_access_to_builtin:
-                self.required_imports.add(common.ImportDecl("builtins", None, "__builtin__"))
-                builtin_renmae_decl_str = f"""
-                {self.new_name} = getattr(builtins, '{self.old_name}', {self.new_name})
-                """
-                self.module_declarations.add(builtin_renmae_decl_str.strip())
-
-        return tree
-
-
-class XrangeToRangeFixer(BuiltinsRenameFixerBase):
-
-    version_info = common.VersionInfo(apply_until="2.7")
-
-    new_name = "range"
-    old_name = "xrange"
-
-
-class UnicodeToStrFixer(BuiltinsRenameFixerBase):
-
-    version_info = common.VersionInfo(apply_until="2.7")
-
-    new_name = "str"
-    old_name = "unicode"
-
-
-class UnichrToChrFixer(BuiltinsRenameFixerBase):
-
-    version_info = common.VersionInfo(apply_until="2.7")
-
-    new_name = "chr"
-    old_name = "unichr"
-
-
-class RawInputToInputFixer(BuiltinsRenameFixerBase):
-
-    version_info = common.VersionInfo(apply_until="2.7")
-
-    new_name = "input"
-    old_name = "raw_input"
+DEPRECATED_FIXERS: typ.Dict[str, typ.Type[BuiltinRenameFixer]] = {
+    fixer_name: type(fixer_name, (_SelectedBuiltinRenameFixer,), {'new_names': new_names})
+    for fixer_name, new_names in DEPRECATED_FIXER_NEW_NAMES.items()
+}
@@ -11,9 +11,10 @@ from . import common
 from . import fixer_base as fb
 
 
-class FStringToStrFormatFixer(fb.TransformerFixerBase):
+class FStringToStrFormatFixer(fb.FixerBase):
 
-    version_info = common.VersionInfo(apply_since="2.6", apply_until="3.5")
+    version_info   = common.VersionInfo(apply_since="2.6", apply_until="3.5")
+    dispatch_types = (ast.JoinedStr,)
 
     def _formatted_value_str(
         self, fmt_val_node: ast.FormattedValue, arg_nodes: typ.List[ast.expr]
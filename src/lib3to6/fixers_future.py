@@ -12,11 +12,13 @@ from . import fixer_base as fb
 
 class FutureImportFixerBase(fb.FixerBase):
 
+    dispatch_types = (ast.Module,)
+
     future_name: str
 
-    def apply_fix(self, ctx: common.BuildContext, tree: ast.Module) -> ast.Module:
+    def visit_Module(self, node: ast.Module) -> ast.Module:
         self.required_imports.add(common.ImportDecl("__future__", self.future_name, None))
-        return tree
+        return node
 
 
 class AnnotationsFutureFixer(FutureImportFixerBase):
@@ -84,7 +86,11 @@ class NestedScopesFutureFixer(FutureImportFixerBase):
 
 class RemoveUnsupportedFuturesFixer(fb.FixerBase):
 
-    version_info = common.VersionInfo(apply_since="2.0", apply_until="3.99")
+    version_info       = common.VersionInfo(apply_since="2.0", apply_until="3.99")
+    target_independent = False
+    # NOTE (mb 2021-10-17): Without a trigger, modules would be fixed
+    #   separately for every target, even if they have no future imports.
+    trigger_features   = ("import:__future__",)
 
     def apply_fix(self, ctx: common.BuildContext, tree: ast.Module) -> ast.Module:
         target_version    = ctx.cfg.target_version
@@ -113,6 +119,7 @@ class RemoveUnsupportedFuturesFixer(fb.FixerBase):
             if new_names == node.names:
                 continue
 
+            self.mark_modified(node)
             if not any(new_names):
                 nodes_to_del.append(i)
             else:
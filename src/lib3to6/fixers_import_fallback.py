@@ -5,6 +5,7 @@
 # SPDX-License-Identifier: MIT
 
 import ast
+import typing as typ
 
 from . import common
 from . import fixer_base as fb
@@ -23,306 +24,172 @@ def _try_fallback(node: ast.stmt, fallback_node: ast.stmt) -> ast.Try:
     )
 
 
-class ModuleImportFallbackFixerBase(fb.TransformerFixerBase):
+# Modules which were renamed in python 3, by new name, the old
+# (python 2) name to import if the new name is not available.
+IMPORT_FALLBACKS: common.ImportFallbacks = {
+    'configparser'           : "ConfigParser",
+    'socketserver'           : "SocketServer",
+    'builtins'               : "__builtin__",
+    'queue'                  : "Queue",
+    'copyreg'                : "copy_reg",
+    'winreg'                 : "_winreg",
+    'reprlib'                : "repr",
+    '_thread'                : "thread",
+    '_dummy_thread'          : "dummy_thread",
+    # NOTE (mb 2018-09-01): Up to here are the simple cases. Below
+    #   here, the fixes only work when using ast.FromImport, or when
+    #   using asname. For everything else, we raise a CheckError. The
+    #   only other option would be to scan whole tree and rewrite
+    #   reverences
+    'http.cookiejar'         : "cookielib",
+    'urllib.parse'           : "urlparse",
+    'urllib.request'         : "urllib2",
+    'urllib.error'           : "urllib2",
+    'urllib.robotparser'     : "robotparser",
+    'xmlrpc.client'          : "xmlrpclib",
+    'xmlrpc.server'          : "SimpleXMLRPCServer",
+    'html.parser'            : "HTMLParser",
+    'http.client'            : "httplib",
+    'http.cookies'           : "Cookie",
+    'pickle'                 : "cPickle",
+    'dbm.gnu'                : "gdbm",
+    'email.mime.base'        : "email.MIMEBase",
+    'email.mime.image'       : "email.MIMEImage",
+    'email.mime.multipart'   : "email.MIMEMultipart",
+    'email.mime.nonmultipart': "email.MIMENonMultipart",
+    'email.mime.text'        : "email.MIMEText",
+    'tkinter'                : "Tkinter",
+    'tkinter.dialog'         : "Dialog",
+    'tkinter.scrolledtext'   : "ScrolledText",
+    'tkinter.tix'            : "Tix",
+    'tkinter.ttk'            : "ttk",
+    'tkinter.constants'      : "Tkconstants",
+    'tkinter.dnd'            : "Tkdnd",
+    'tkinter.colorchooser'   : "tkColorChooser",
+    'tkinter.commondialog'   : "tkCommonDialog",
+    'tkinter.font'           : "tkFont",
+    'tkinter.messagebox'     : "tkMessageBox",
+}
+
+
+class ModuleImportFallbackFixer(fb.FixerBase):
+    """Wrap imports of renamed modules in a try/except with a fallback.
+
+    The renames are those of IMPORT_FALLBACKS, extended by the
+    import_fallbacks of the BuildConfig. Each import is a single
+    lookup in the table.
+    """
+
+    version_info   = common.VersionInfo(apply_since="2.3", apply_until="2.7")
+    dispatch_types = (ast.Import, ast.ImportFrom)
+
+    fallbacks: common.ImportFallbacks
+
+    def __init__(self, fallbacks: typ.Optional[common.ImportFallbacks] = None) -> None:
+        super().__init__()
+        if fallbacks:
+            self.fallbacks = {**IMPORT_FALLBACKS, **fallbacks}
+        else:
+            self.fallbacks = IMPORT_FALLBACKS
 
-    new_name: str
-    old_name: str
+    @classmethod
+    def from_config(cls, cfg: common.BuildConfig) -> 'ModuleImportFallbackFixer':
+        return cls(cfg.import_fallbacks)
 
     def visit_Import(self, node: ast.Import) -> ast.stmt:
         if len(node.names) != 1:
             return node
 
-        alias = node.names[0]
-        if alias.name != self.new_name:
+        alias    = node.names[0]
+        new_name = alias.name
+        old_name = self.fallbacks.get(new_name)
+        if old_name is None:
             return node
 
         if alias.asname:
             asname = alias.asname
-        elif "." in self.new_name:
-            asname = self.new_name.replace(".", "_")
+        elif "." in new_name:
+            asname = new_name.replace(".", "_")
             msg    = (
-                f"Prohibited use of 'import {self.new_name}', "
-                f"use 'import {self.new_name} as {asname}' instead."
+                f"Prohibited use of 'import {new_name}', "
+                f"use 'import {new_name} as {asname}' instead."
             )
             raise common.CheckError(msg, node)
         else:
-            asname = self.new_name
+            asname = new_name
 
-        return _try_fallback(node, ast.Import(names=[ast.alias(name=self.old_name, asname=asname)]))
+        return _try_fallback(node, ast.Import(names=[ast.alias(name=old_name, asname=asname)]))
 
     def visit_ImportFrom(self, node: ast.ImportFrom) -> ast.stmt:
-        if node.module != self.new_name:
+        old_name = self.fallbacks.get(node.module) if node.module else None
+        if old_name is None:
             return node
 
-        return _try_fallback(
-            node, ast.ImportFrom(module=self.old_name, names=node.names, level=node.level)
-        )
-
-
-class ConfigParserImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "configparser"
-    old_name     = "ConfigParser"
-
-
-class SocketServerImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "socketserver"
-    old_name     = "SocketServer"
-
-
-class BuiltinsImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "builtins"
-    old_name     = "__builtin__"
-
-
-class QueueImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "queue"
-    old_name     = "Queue"
-
-
-class CopyRegImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "copyreg"
-    old_name     = "copy_reg"
-
-
-class WinRegImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "winreg"
-    old_name     = "_winreg"
-
-
-class ReprLibImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "reprlib"
-    old_name     = "repr"
-
-
-class ThreadImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "_thread"
-    old_name     = "thread"
-
-
-class DummyThreadImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "_dummy_thread"
-    old_name     = "dummy_thread"
-
-
-# NOTE (mb 2018-09-01): Up to here are the simple cases. Below
-#   here, the fixes only work when using ast.FromImport, or when
-#   using asname. For everything else, we raise a CheckError. The
-#   only other option would be to scan whole tree and rewrite
-#   reverences
-
-
-class HttpCookiejarImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "http.cookiejar"
-    old_name     = "cookielib"
-
-
-class UrllibParseImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "urllib.parse"
-    old_name     = "urlparse"
-
-
-class UrllibRequestImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "urllib.request"
-    old_name     = "urllib2"
-
-
-class UrllibErrorImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "urllib.error"
-    old_name     = "urllib2"
-
-
-class UrllibRobotParserImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "urllib.robotparser"
-    old_name     = "robotparser"
-
-
-class XMLRPCClientImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "xmlrpc.client"
-    old_name     = "xmlrpclib"
-
-
-class XmlrpcServerImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "xmlrpc.server"
-    old_name     = "SimpleXMLRPCServer"
-
-
-class HtmlParserImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "html.parser"
-    old_name     = "HTMLParser"
-
+        fallback_node = ast.ImportFrom(module=old_name, names=node.names, level=node.level)
+        return _try_fallback(node, fallback_node)
 
-class HttpClientImportFallbackFixer(ModuleImportFallbackFixerBase):
+    def get_trigger_features(self) -> typ.Set[str]:
+        return {"import:" + new_name for new_name in self.fallbacks}
 
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "http.client"
-    old_name     = "httplib"
 
+class _SingleModuleImportFallbackFixer(ModuleImportFallbackFixer):
 
-class HttpCookiesImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "http.cookies"
-    old_name     = "Cookie"
-
-
-class PickleImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "pickle"
-    old_name     = "cPickle"
-
-
-class DbmGnuImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "dbm.gnu"
-    old_name     = "gdbm"
-
-
-class EmailMimeBaseImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "email.mime.base"
-    old_name     = "email.MIMEBase"
-
-
-class EmailMimeImageImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "email.mime.image"
-    old_name     = "email.MIMEImage"
-
-
-class EmailMimeMultipartImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "email.mime.multipart"
-    old_name     = "email.MIMEMultipart"
-
-
-class EmailMimeNonmultipartImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "email.mime.nonmultipart"
-    old_name     = "email.MIMENonMultipart"
-
-
-class EmailMimeTextImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "email.mime.text"
-    old_name     = "email.MIMEText"
-
-
-class TkinterImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "tkinter"
-    old_name     = "Tkinter"
-
-
-class TkinterDialogImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "tkinter.dialog"
-    old_name     = "Dialog"
-
-
-class TkinterScrolledTextImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "tkinter.scrolledtext"
-    old_name     = "ScrolledText"
-
-
-class TkinterTixImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "tkinter.tix"
-    old_name     = "Tix"
-
-
-class TkinterTtkImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "tkinter.ttk"
-    old_name     = "ttk"
-
-
-class TkinterConstantsImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "tkinter.constants"
-    old_name     = "Tkconstants"
-
-
-class TkinterDndImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "tkinter.dnd"
-    old_name     = "Tkdnd"
-
-
-class TkinterColorchooserImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "tkinter.colorchooser"
-    old_name     = "tkColorChooser"
-
-
-class TkinterCommonDialogImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "tkinter.commondialog"
-    old_name     = "tkCommonDialog"
-
-
-class TkinterFontImportFallbackFixer(ModuleImportFallbackFixerBase):
-
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "tkinter.font"
-    old_name     = "tkFont"
-
-
-class TkinterMessageboxImportFallbackFixer(ModuleImportFallbackFixerBase):
+    new_name: str
 
-    version_info = common.VersionInfo(apply_since="2.3", apply_until="2.7")
-    new_name     = "tkinter.messagebox"
-    old_name     = "tkMessageBox"
+    def __init__(self, fallbacks: typ.Optional[common.ImportFallbacks] = None) -> None:
+        super().__init__(fallbacks)
+        self.fallbacks = {self.new_name: self.fallbacks[self.new_name]}
+
+
+# NOTE (mb 2021-10-17): Before ModuleImportFallbackFixer, there was a
+#   fixer for each module. Their names can still be selected, which
+#   applies only the fallback of the module they were for.
+
+# by name of the (deprecated) fixer, the new name of the module
+DEPRECATED_FIXER_MODULE_NAMES: typ.Dict[str, str] = {
+    'ConfigParserImportFallbackFixer'         : "configparser",
+    'SocketServerImportFallbackFixer'         : "socketserver",
+    'BuiltinsImportFallbackFixer'             : "builtins",
+    'QueueImportFallbackFixer'                : "queue",
+    'CopyRegImportFallbackFixer'              : "copyreg",
+    'WinRegImportFallbackFixer'               : "winreg",
+    'ReprLibImportFallbackFixer'              : "reprlib",
+    'ThreadImportFallbackFixer'               : "_thread",
+    'DummyThreadImportFallbackFixer'          : "_dummy_thread",
+    'HttpCookiejarImportFallbackFixer'        : "http.cookiejar",
+    'UrllibParseImportFallbackFixer'          : "urllib.parse",
+    'UrllibRequestImportFallbackFixer'        : "urllib.request",
+    'UrllibErrorImportFallbackFixer'          : "urllib.error",
+    'UrllibRobotParserImportFallbackFixer'    : "urllib.robotparser",
+    'XMLRPCClientImportFallbackFixer'         : "xmlrpc.client",
+    'XmlrpcServerImportFallbackFixer'         : "xmlrpc.server",
+    'HtmlParserImportFallbackFixer'           : "html.parser",
+    'HttpClientImportFallbackFixer'           : "http.client",
+    'HttpCookiesImportFallbackFixer'          : "http.cookies",
+    'PickleImportFallbackFixer'               : "pickle",
+    'DbmGnuImportFallbackFixer'               : "dbm.gnu",
+    'EmailMimeBaseImportFallbackFixer'        : "email.mime.base",
+    'EmailMimeImageImportFallbackFixer'       : "email.mime.image",
+    'EmailMimeMultipartImportFallbackFixer'   : "email.mime.multipart",
+    'EmailMimeNonmultipartImportFallbackFixer': "email.mime.nonmultipart",
+    'EmailMimeTextImportFallbackFixer'        : "email.mime.text",
+    'TkinterImportFallbackFixer'              : "tkinter",
+    'TkinterDialogImportFallbackFixer'        : "tkinter.dialog",
+    'TkinterScrolledTextImportFallbackFixer'  : "tkinter.scrolledtext",
+    'TkinterTixImportFallbackFixer'           : "tkinter.tix",
+    'TkinterTtkImportFallbackFixer'           : "tkinter.ttk",
+    'TkinterConstantsImportFallbackFixer'     : "tkinter.constants",
+    'TkinterDndImportFallbackFixer'           : "tkinter.dnd",
+    'TkinterColorchooserImportFallbackFixer'  : "tkinter.colorchooser",
+    'TkinterCommonDialogImportFallbackFixer'  : "tkinter.commondialog",
+    'TkinterFontImportFallbackFixer'          : "tkinter.font",
+    'TkinterMessageboxImportFallbackFixer'    : "tkinter.messagebox",
+}
+
+DEPRECATED_FIXERS: typ.Dict[str, typ.Type[ModuleImportFallbackFixer]] = {
+    fixer_name: type(fixer_name, (_SingleModuleImportFallbackFixer,), {'new_name': new_name})
+    for fixer_name, new_name in DEPRECATED_FIXER_MODULE_NAMES.items()
+}
 
 
 # TODO (mb 2018-09-02): Only ImportFrom is permitted for
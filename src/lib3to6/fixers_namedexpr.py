@@ -13,13 +13,15 @@ from . import fixer_base as fb
 
 class NamedExprFixer(fb.TransformerFixerBase):
 
-    version_info = common.VersionInfo(apply_since="2.7", apply_until="3.7")
+    version_info     = common.VersionInfo(apply_since="2.7", apply_until="3.7")
+    trigger_features = ("NamedExpr",)
 
     def _extract_and_replace_named_exprs(
         self, expr: ast.expr
     ) -> typ.Tuple[typ.List[ast.stmt], ast.expr]:
         new_assigns: typ.List[ast.stmt] = []
         if isinstance(expr, ast.NamedExpr):
+            self.mark_modified()
             new_assigns.append(ast.Assign(targets=[expr.target], value=expr.value))
             new_expr = ast.Name(id=expr.target.id, ctx=ast.Load())
             return new_assigns, new_expr
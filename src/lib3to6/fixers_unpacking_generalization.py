@@ -178,7 +178,8 @@ def _expand_stararg_g12n(node: ast.AST) -> ast.expr:
 
 class UnpackingGeneralizationsFixer(fb.FixerBase):
 
-    version_info = common.VersionInfo(apply_since="2.0", apply_until="3.4")
+    version_info     = common.VersionInfo(apply_since="2.0", apply_until="3.4")
+    trigger_features = ("Starred", "starstarargs")
 
     def expand_starstararg_g12n(self, node: ast.expr) -> ast.expr:
         chain_values: typ.List[ast.expr] = []
@@ -284,8 +285,10 @@ class UnpackingGeneralizationsFixer(fb.FixerBase):
     def visit_expr(self, node: ast.expr) -> ast.expr:
         new_node = node
         if isinstance(node, ArgUnpackNodes) and _has_stararg_g12n(node):
+            self.mark_modified()
             new_node = _expand_stararg_g12n(new_node)
         if isinstance(node, KwArgUnpackNodes) and _has_starstarargs_g12n(node):
+            self.mark_modified()
             new_node = self.expand_starstararg_g12n(new_node)
         return new_node
 
@@ -0,0 +1,215 @@
+# This file is part of the lib3to6 project
+# https://github.com/mbarkhau/lib3to6
+#
+# Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+
+import os
+import sys
+import time
+import types
+import struct
+import typing as typ
+import hashlib
+import logging
+import marshal
+import pathlib as pl
+import importlib.abc
+import importlib.util
+import importlib.machinery
+
+from . import cache
+from . import common
+from . import transpile
+
+logger = logging.getLogger(__name__)
+
+# Files start with a prefix of the magic number of the interpreter, the
+# hash of the configuration (40 hex digits) and the stat signature of the
+# source, followed by cache.cache_key(cfg, source) (40 hex digits).
+PYC_STAT_FORMAT = "<Qq"  # size, mtime_ns
+PYC_CFG_SIZE    = len(importlib.util.MAGIC_NUMBER) + 40
+PYC_PREFIX_SIZE = PYC_CFG_SIZE + struct.calcsize(PYC_STAT_FORMAT)
+PYC_HEADER_SIZE = PYC_PREFIX_SIZE + 40
+
+# stat signature of sources which were modified too recently to be
+# recognized by their stat (see cache.MANIFEST_MIN_AGE)
+PYC_RACY_STAT = struct.pack(PYC_STAT_FORMAT, 0, -1)
+
+def _is_selected(fullname: str, packages: typ.Sequence[str]) -> bool:
+    """
+    >>> _is_selected("mypkg.sub", ["mypkg"])
+    True
+    >>> _is_selected("mypkg2", ["mypkg"])
+    False
+    """
+    return any(fullname == package or fullname.startswith(package + ".") for package in packages)
+
+
+class Lib3to6Loader(importlib.machinery.SourceFileLoader):
+    """Loader for the transpiled code of a module.
+
+    The code object is read from the cache if the size and mtime of the
+    source match. Otherwise the cache is used if the hash of the source
+    and configuration matches. If neither is the case, the source is
+    transpiled and compiled, and the cache is updated.
+    """
+
+    def __init__(
+        self, fullname: str, path: str, cfg: common.BuildConfig, key_hash: typ.Any
+    ) -> None:
+        super().__init__(fullname, path)
+        self.cfg       = cfg
+        self._key_hash = key_hash
+
+    def pyc_path(self) -> pl.Path:
+        # NOTE (mb 2021-10-17): The optimization tag separates the files
+        #   of each configuration from each other and from regular .pyc
+        #   files, which would otherwise be loaded without lib3to6.
+        opt_tag = "lib3to6" + self._key_hash.hexdigest()[:16]
+        return pl.Path(importlib.util.cache_from_source(self.path, optimization=opt_tag))
+
+    def _pyc_prefix(self, source_path: str) -> bytes:
+        stat = os.stat(source_path)
+        if time.time() - stat.st_mtime_ns / 1e9 < cache.MANIFEST_MIN_AGE:
+            stat_data = PYC_RACY_STAT
+        else:
+            stat_data = struct.pack(PYC_STAT_FORMAT, stat.st_size, stat.st_mtime_ns)
+        cfg_hash = self._key_hash.hexdigest().encode("ascii")
+        return importlib.util.MAGIC_NUMBER + cfg_hash + stat_data
+
+    def _load_pyc(self, pyc_path: pl.Path, pyc_data: bytes) -> typ.Optional[types.CodeType]:
+        try:
+            return typ.cast(types.CodeType, marshal.loads(pyc_data[PYC_HEADER_SIZE:]))
+        except (EOFError, ValueError, TypeError):
+            logger.warning(f"Invalid cache file {pyc_path}")
+            return None
+
+    def _write_pyc(self, pyc_path: pl.Path, pyc_data: bytes) -> None:
+        if sys.dont_write_bytecode:
+            return
+        try:
+            pyc_path.parent.mkdir(exist_ok=True)
+            cache.atomic_write(pyc_path, pyc_data)
+        except OSError as err:
+            # same as for regular .pyc files, e.g. a read-only directory
+            logger.debug(f"Could not write {pyc_path}: {err}")
+
+    def get_code(self, fullname: str) -> types.CodeType:
+        source_path = self.get_filename(fullname)
+        prefix      = self._pyc_prefix(source_path)
+
+        pyc_path = self.pyc_path()
+        try:
+            pyc_data = pyc_path.read_bytes()
+        except OSError:
+            pyc_data = b""
+
+        # NOTE (mb 2021-10-17): If the size and mtime of the source are
+        #   unchanged, the source is neither read nor hashed.
+        is_stat_match = prefix[PYC_CFG_SIZE:] != PYC_RACY_STAT and (
+            pyc_data[:PYC_PREFIX_SIZE] == prefix
+        )
+        if is_stat_match:
+            code = self._load_pyc(pyc_path, pyc_data)
+            if code is not None:
+                return code
+
+        source_data = self.get_data(source_path)
+
+        filehash = self._key_hash.copy()
+        filehash.update(source_data)
+        header = prefix + filehash.hexdigest().encode("ascii")
+
+        is_hash_match = (
+            pyc_data[:PYC_CFG_SIZE] == header[:PYC_CFG_SIZE]
+            and pyc_data[PYC_PREFIX_SIZE:PYC_HEADER_SIZE] == header[PYC_PREFIX_SIZE:]
+        )
+        if is_hash_match:
+            code = self._load_pyc(pyc_path, pyc_data)
+            if code is not None:
+                if pyc_data[:PYC_PREFIX_SIZE] != prefix:
+                    # e.g. the source was touched, record its new stat
+                    self._write_pyc(pyc_path, header + pyc_data[PYC_HEADER_SIZE:])
+                return code
+
+        ctx = common.BuildContext(self.cfg, source_path)
+        try:
+            fixed_source_data = transpile.transpile_module_data(ctx, source_data)
+        except common.CheckError as err:
+            err.add_location(source_path)
+            raise
+
+        code = compile(fixed_source_data, source_path, 'exec', dont_inherit=True)
+        self._write_pyc(pyc_path, header + marshal.dumps(code))
+        return code
+
+
+class Lib3to6Finder(importlib.abc.MetaPathFinder):
+    """Find modules of the selected packages on sys.path.
+
+    Only modules with a source file are transpiled. Packages are
+    top level names, their subpackages are also transpiled.
+    """
+
+    cfg     : common.BuildConfig
+    packages: typ.Tuple[str, ...]
+
+    def __init__(self, cfg: common.BuildConfig, packages: typ.Sequence[str]) -> None:
+        self.cfg       = cfg
+        self.packages  = tuple(packages)
+        self._key_hash = hashlib.sha1(cache.cache_key_data(cfg))
+
+    def find_spec(
+        self,
+        fullname: str,
+        path    : typ.Optional[typ.Sequence[str]],
+        target  : typ.Optional[types.ModuleType] = None,
+    ) -> typ.Optional[importlib.machinery.ModuleSpec]:
+        if not _is_selected(fullname, self.packages):
+            return None
+
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if spec is None or not isinstance(spec.loader, importlib.machinery.SourceFileLoader):
+            return spec
+
+        spec.loader = Lib3to6Loader(fullname, spec.loader.path, self.cfg, self._key_hash)
+        return spec
+
+
+def install_import_hook(
+    packages        : typ.Sequence[str],
+    target_version  : str = transpile.DEFAULT_TARGET_VERSION,
+    install_requires: typ.Optional[typ.Iterable[str]] = None,
+    default_mode    : str = 'enabled',
+    codegen         : str = 'astor',
+) -> Lib3to6Finder:
+    """Transpile the modules of packages when they are imported.
+
+        finder = lib3to6.install_import_hook(packages=["mypkg"], target_version="2.7")
+        import mypkg  # transpiled for python 2.7
+
+    The finder is inserted at the start of sys.meta_path and returned,
+    it can be removed with sys.meta_path.remove. Modules which were
+    already imported are not affected.
+
+    The code of transpiled modules is cached in __pycache__, next to
+    the regular .pyc files, with a name that depends on the
+    configuration. Cache files are validated by the size and mtime of
+    the source, or if these changed, by the hash of the source and
+    configuration, so a stale file is never used.
+    """
+    if isinstance(packages, str):
+        packages = [packages]
+    if not packages:
+        raise ValueError("Missing argument: packages")
+
+    cfg = common.init_build_context(
+        target_version=target_version,
+        install_requires=None if install_requires is None else set(install_requires),
+        default_mode=default_mode,
+        codegen=codegen,
+    ).cfg
+    finder = Lib3to6Finder(cfg, packages)
+    sys.meta_path.insert(0, finder)
+    return finder
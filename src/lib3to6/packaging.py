@@ -4,24 +4,49 @@
 # Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
 # SPDX-License-Identifier: MIT
 
+import io
 import os
 import re
 import sys
-import shutil
+import time
 import typing as typ
-import hashlib
+import logging
+import zipfile
 import pathlib as pl
-import tempfile
 import warnings
+import multiprocessing as mp
+import concurrent.futures
 
+import setuptools
 import setuptools.dist
 import setuptools.command.build_py as _build_py
 
+from . import cache
+from . import sync
 from . import common
+from . import wheels
+from . import codegen
 from . import transpile
+from . import __version__
+
+logger = logging.getLogger(__name__)
 
 ENV_PATH = str(pl.Path(sys.executable).parent.parent)
 
+ENV_JOBS = common.ENV_JOBS
+
+SYNC_MANIFEST_FILENAME = "lib3to6_sync.json"
+
+# Files are sent to worker processes in chunks of at most this size.
+MAX_CHUNK_SIZE = 32
+
+# Number of files in the report of the slowest files of a build.
+SLOWEST_REPORT_SIZE = 5
+
+# Worker processes are replaced after (on average) this many chunks,
+# so that memory held by a worker is released during large builds.
+MAX_TASKS_PER_CHILD = 32
+
 
 PYTHON_TAG_PREFIXES = {
     'py': "Generic Python",
@@ -32,7 +57,30 @@ PYTHON_TAG_PREFIXES = {
 }
 
 
-CACHE_DIR = pl.Path(tempfile.gettempdir()) / ".lib3to6_cache"
+def _parse_renames(arg: typ.Any, option: str) -> typ.Optional[typ.Dict[str, str]]:
+    """Parse renames, either a dict or "new_name:old_name" pairs.
+
+    Used for the import_fallbacks and builtin_renames options.
+
+    >>> _parse_renames("mypkg.new:mypkg_old other:Other", 'import_fallbacks')
+    {'mypkg.new': 'mypkg_old', 'other': 'Other'}
+    >>> _parse_renames({'mypkg.new': 'mypkg_old'}, 'import_fallbacks')
+    {'mypkg.new': 'mypkg_old'}
+    """
+    if not arg:
+        return None
+    elif isinstance(arg, dict):
+        pairs = list(arg.items())
+    elif isinstance(arg, str):
+        pairs = [tuple(pair.split(":", 1)) for pair in arg.split()]
+    else:
+        raise TypeError(f"Invalid argument for {option}: {type(arg)}")
+
+    for pair in pairs:
+        is_valid = len(pair) == 2 and all(isinstance(name, str) and name for name in pair)
+        if not is_valid:
+            raise ValueError(f"Invalid argument for {option}: {pair}, expected new_name:old_name")
+    return dict(pairs)
 
 
 def eval_build_config(**kwargs) -> common.BuildConfig:
@@ -40,6 +88,12 @@ def eval_build_config(**kwargs) -> common.BuildConfig:
     _install_requires = kwargs.get('install_requires', None)
     cache_enabled     = kwargs.get('cache_enabled', True)
     default_mode      = kwargs.get('default_mode', 'enabled')
+    codegen_backend   = kwargs.get('codegen', None) or codegen.DEFAULT_BACKEND
+    cache_dir         = kwargs.get('cache_dir', None)
+    cache_size        = kwargs.get('cache_size', None)
+    jobs              = kwargs.get('jobs', None)
+    import_fallbacks  = _parse_renames(kwargs.get('import_fallbacks', None), 'import_fallbacks')
+    builtin_renames   = _parse_renames(kwargs.get('builtin_renames' , None), 'builtin_renames')
 
     install_requires: common.InstallRequires
     if _install_requires is None:
@@ -51,6 +105,15 @@ def eval_build_config(**kwargs) -> common.BuildConfig:
     else:
         raise TypeError(f"Invalid argument for install_requires: {type(_install_requires)}")
 
+    # raises ValueError for unknown backends
+    codegen.get_backend(codegen_backend)
+
+    if isinstance(cache_size, str):
+        cache_size = cache.parse_size(cache_size)
+
+    if isinstance(jobs, str):
+        jobs = int(jobs)
+
     if install_requires:
         # Remove version specs. We only handle the bare requirement
         # and assume the maintainer knows what they're doing wrt.
@@ -64,9 +127,28 @@ def eval_build_config(**kwargs) -> common.BuildConfig:
         fixers="",
         checkers="",
         install_requires=install_requires,
+        codegen=codegen_backend,
+        cache_dir=str(cache_dir) if cache_dir else None,
+        cache_size=cache_size,
+        jobs=jobs,
+        import_fallbacks=import_fallbacks,
+        builtin_renames=builtin_renames,
     )
 
 
+def get_jobs(cfg: common.BuildConfig) -> int:
+    """Number of worker processes, 0 means one per cpu."""
+    jobs = cfg.jobs
+    if jobs is None:
+        env_jobs = os.environ.get(ENV_JOBS)
+        jobs     = int(env_jobs) if env_jobs else 1
+
+    if jobs <= 0:
+        return os.cpu_count() or 1
+    else:
+        return jobs
+
+
 def _ignore_tmp_files(src: str, names: typ.List[str]) -> typ.List[str]:
     if isinstance(src, str):
         src_str = src
@@ -93,6 +175,8 @@ def init_build_package_dir(local_package_dir: common.PackageDir) -> common.Packa
     output_dir = pl.Path("build") / "lib3to6_out"
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    sync_manifest = sync.SyncManifest(pl.Path("build") / SYNC_MANIFEST_FILENAME)
+
     build_package_dir: common.PackageDir = {}
 
     for package, src_package_dir in local_package_dir.items():
@@ -102,65 +186,592 @@ def init_build_package_dir(local_package_dir: common.PackageDir) -> common.Packa
 
         build_package_subdir = output_dir / src_package_dir
 
-        # TODO (mb 2018-08-25): As an optimization, we could
-        #   restrict deletion to files that we manipulate, in
-        #   other words, to *.py files.
-        if build_package_subdir.exists():
-            shutil.rmtree(build_package_subdir)
-
-        shutil.copytree(src_package_dir, str(build_package_subdir), ignore=_ignore_tmp_files)
+        # NOTE (mb 2021-10-17): Only new or modified files are copied
+        #   (or linked). Since the transpiled modules are written by
+        #   replacing files, links to the sources are never modified.
+        sync.sync_tree(
+            pl.Path(src_package_dir),
+            build_package_subdir,
+            sync_manifest,
+            ignore=_ignore_tmp_files,
+        )
         build_package_dir[package] = str(build_package_subdir)
 
+    sync_manifest.save()
     return build_package_dir
 
 
-def transpile_path(cfg: common.BuildConfig, filepath: pl.Path) -> pl.Path:
+def _transpile_data(cfg: common.BuildConfig, filepath: str, module_source_data: bytes) -> bytes:
+    return _transpile_data_targets(cfg, filepath, module_source_data, [cfg.target_version])[0]
+
+
+def _transpile_data_targets(
+    cfg               : common.BuildConfig,
+    filepath          : str,
+    module_source_data: bytes,
+    target_versions   : typ.Sequence[str],
+) -> typ.List[bytes]:
+    ctx = common.BuildContext(cfg, filepath)
+    try:
+        return transpile.transpile_module_data_targets(ctx, module_source_data, target_versions)
+    except common.CheckError as err:
+        err.add_location(filepath)
+        raise
+
+
+def transpile_data(
+    cfg: common.BuildConfig, filepath: str, module_source_data: bytes, module_cache: cache.Cache
+) -> bytes:
+    """Transpile the content of a module, using the cache.
+
+    The filepath is only used in error messages.
+    """
+    key = cache.cache_key(cfg, module_source_data)
+    if cfg.cache_enabled:
+        cache_path = module_cache.get(key)
+        if cache_path:
+            return cache_path.read_bytes()
+
+    fixed_module_source_data = _transpile_data(cfg, filepath, module_source_data)
+    module_cache.put(key, fixed_module_source_data)
+    return fixed_module_source_data
+
+
+def _transpile_to_cache(
+    cfg: common.BuildConfig, filepath: pl.Path, module_cache: cache.Cache
+) -> typ.Tuple[pl.Path, typ.Optional[bytes]]:
+    """Path of the cache entry and, on a cache miss, its content."""
+    cfg_key = cache.config_key(cfg)
+    if cfg.cache_enabled:
+        # fast path: file unchanged since it was last transpiled
+        signature = cache.stat_signature(os.stat(filepath), cfg_key)
+        key       = module_cache.manifest.lookup(filepath, signature)
+        if key:
+            cache_path = module_cache.get(key)
+            if cache_path:
+                return (cache_path, None)
+
     with open(filepath, mode="rb") as fobj:
+        signature          = cache.stat_signature(os.fstat(fobj.fileno()), cfg_key)
         module_source_data = fobj.read()
 
-    filehash = hashlib.sha1()
-    filehash.update(str(cfg).encode("utf-8"))
-    filehash.update(module_source_data)
+    key = cache.cache_key(cfg, module_source_data)
+    if cfg.cache_enabled:
+        cache_path = module_cache.get(key)
+        if cache_path:
+            module_cache.manifest.update(filepath, signature, key)
+            return (cache_path, None)
 
-    cache_path = CACHE_DIR / (filehash.hexdigest() + ".py")
+    # NOTE (mb 2021-10-17): not cache_enabled -> module_cache is a temporary
+    #   cache (see Cache.from_config), which is only used to hand out paths.
+    t0 = time.perf_counter()
+    fixed_module_source_data = _transpile_data(cfg, str(filepath), module_source_data)
+    duration = time.perf_counter() - t0
 
-    if cfg.cache_enabled and cache_path.exists():
-        return cache_path
+    cache_path = module_cache.put(key, fixed_module_source_data)
+    if cfg.cache_enabled:
+        module_cache.timings.record(filepath, len(module_source_data), duration)
+        module_cache.manifest.update(filepath, signature, key)
+    return (cache_path, fixed_module_source_data)
 
-    # NOTE (mb 2020-09-01): not cache_enabled -> always update cache
-    ctx = common.BuildContext(cfg, str(filepath))
-    try:
-        fixed_module_source_data = transpile.transpile_module_data(ctx, module_source_data)
-    except common.CheckError as err:
-        loc = str(filepath)
-        if err.lineno >= 0:
-            loc += "@" + str(err.lineno)
 
-        err.args = (loc + " - " + err.args[0],) + err.args[1:]
-        raise
+def transpile_path(
+    cfg         : common.BuildConfig,
+    filepath    : pl.Path,
+    module_cache: typ.Optional[cache.Cache] = None,
+    dest        : typ.Optional[pl.Path] = None,
+    link_mode   : typ.Optional[str] = None,
+) -> pl.Path:
+    """Transpile filepath and return the path of its cache entry.
+
+    If dest is given, the result is also placed there. The cache entry
+    is linked if possible (see sync.LINK_MODES), otherwise it is copied
+    or, on a cache miss, the result is written directly.
+    """
+    if module_cache is None:
+        module_cache = cache.Cache.from_config(cfg)
+
+    cache_path, fixed_module_source_data = _transpile_to_cache(cfg, filepath, module_cache)
+    if dest is None:
+        return cache_path
 
-    with open(cache_path, mode="wb") as fobj:
-        fobj.write(fixed_module_source_data)
+    if link_mode is None:
+        link_mode = sync.get_link_mode()
 
+    _place_result(cache_path, fixed_module_source_data, dest, link_mode)
     return cache_path
 
 
-def build_package(cfg: common.BuildConfig, package: str, build_dir: str) -> None:
-    # pylint:disable=unused-argument ; `package` is part of the public api now
-    for root, _dirs, files in os.walk(build_dir):
-        for filename in files:
+def _place_result(
+    cache_path              : pl.Path,
+    fixed_module_source_data: typ.Optional[bytes],
+    dest                    : pl.Path,
+    link_mode               : str,
+) -> None:
+    if sync.link_file(cache_path, dest, link_mode):
+        pass
+    elif fixed_module_source_data is None:
+        sync.place_file(cache_path, dest)
+    else:
+        cache.atomic_write(dest, fixed_module_source_data)
+
+
+def transpile_path_targets(
+    cfg            : common.BuildConfig,
+    filepath       : pl.Path,
+    target_versions: typ.Sequence[str],
+    module_cache   : typ.Optional[cache.Cache] = None,
+    dests          : typ.Optional[typ.Sequence[pl.Path]] = None,
+    link_mode      : typ.Optional[str] = None,
+) -> typ.List[pl.Path]:
+    """Transpile filepath for multiple target versions.
+
+    Returns the paths of the cache entries, one for each target. The
+    file is read once and, for all targets which are not in the cache,
+    parsed and checked once (see transpile.transpile_module_targets).
+    If dests are given, the result for each target is placed at its
+    dest, as with transpile_path.
+    """
+    if module_cache is None:
+        module_cache = cache.Cache.from_config(cfg)
+
+    module_source_data = filepath.read_bytes()
+
+    cfgs  = [cfg._replace(target_version=target_version) for target_version in target_versions]
+    keys  = [cache.cache_key(target_cfg, module_source_data) for target_cfg in cfgs]
+    datas: typ.List[typ.Optional[bytes]] = [None] * len(cfgs)
+    cache_paths = [module_cache.get(key) if cfg.cache_enabled else None for key in keys]
+
+    missing = [i for i, cache_path in enumerate(cache_paths) if cache_path is None]
+    if missing:
+        t0 = time.perf_counter()
+        fixed_datas = _transpile_data_targets(
+            cfg, str(filepath), module_source_data, [target_versions[i] for i in missing]
+        )
+        duration = time.perf_counter() - t0
+        module_cache.timings.record(filepath, len(module_source_data), duration)
+
+        for i, fixed_module_source_data in zip(missing, fixed_datas):
+            cache_paths[i] = module_cache.put(keys[i], fixed_module_source_data)
+            datas[i]       = fixed_module_source_data
+
+    result = [typ.cast(pl.Path, cache_path) for cache_path in cache_paths]
+    if dests is not None:
+        if link_mode is None:
+            link_mode = sync.get_link_mode()
+        for cache_path, fixed_module_source_data, dest in zip(result, datas, dests):
+            _place_result(cache_path, fixed_module_source_data, dest, link_mode)
+    return result
+
+
+class ChunkResult(typ.NamedTuple):
+
+    # for each item either the result (the path of the cache entry
+    # or the transpiled data) or an error
+    results         : typ.List[typ.Any]
+    counts          : cache.CacheCounts
+    manifest_updates: cache.IndexEntries
+    timings_updates : cache.IndexEntries
+
+
+# (filepath, dest)
+ChunkItem = typ.Tuple[pl.Path, typ.Optional[pl.Path]]
+
+# state of worker processes, set by _init_worker
+_worker_cfg      : typ.Optional[common.BuildConfig] = None
+_worker_cache    : typ.Optional[cache.Cache       ] = None
+_worker_link_mode: typ.Optional[str               ] = None
+
+
+def _init_worker(
+    cfg: common.BuildConfig, cache_dir: pl.Path, cache_size_limit: int, link_mode: str
+) -> None:
+    # pylint:disable=global-statement ; the config is sent to each worker only once
+    global _worker_cfg
+    global _worker_cache
+    global _worker_link_mode
+
+    # NOTE (mb 2021-10-17): Workers use the cache directory of the
+    #   parent, rather than Cache.from_config. With cache_enabled=False
+    #   that is a temporary directory, which the parent removes. A
+    #   directory created by a worker would be left behind, since the
+    #   atexit handlers of worker processes don't run.
+    _worker_cfg       = cfg
+    _worker_cache     = cache.Cache(cache_dir, cache_size_limit)
+    _worker_link_mode = link_mode
+
+
+def _transpile_chunk(chunk: typ.List[ChunkItem]) -> ChunkResult:
+    assert _worker_cfg is not None
+    assert _worker_cache is not None
+
+    results: typ.List[typ.Any] = []
+    for filepath, dest in chunk:
+        try:
+            cache_path = transpile_path(
+                _worker_cfg, filepath, _worker_cache, dest, _worker_link_mode
+            )
+            results.append(str(cache_path))
+        except Exception as err:
+            results.append(err)
+
+    return _chunk_result(results, _worker_cache)
+
+
+# (filepath, target_versions, dest for each target)
+TargetsChunkItem = typ.Tuple[pl.Path, typ.Tuple[str, ...], typ.Tuple[pl.Path, ...]]
+
+
+def _transpile_targets_chunk(chunk: typ.List[TargetsChunkItem]) -> ChunkResult:
+    assert _worker_cfg is not None
+    assert _worker_cache is not None
+
+    results: typ.List[typ.Any] = []
+    for filepath, target_versions, dests in chunk:
+        try:
+            transpile_path_targets(
+                _worker_cfg, filepath, target_versions, _worker_cache, dests, _worker_link_mode
+            )
+            results.append(None)
+        except Exception as err:
+            results.append(err)
+
+    return _chunk_result(results, _worker_cache)
+
+
+def _transpile_data_chunk(chunk: typ.List[typ.Tuple[str, bytes]]) -> ChunkResult:
+    assert _worker_cfg is not None
+    assert _worker_cache is not None
+
+    results: typ.List[typ.Any] = []
+    for filepath, module_source_data in chunk:
+        try:
+            results.append(transpile_data(_worker_cfg, filepath, module_source_data, _worker_cache))
+        except Exception as err:
+            results.append(err)
+
+    return _chunk_result(results, _worker_cache)
+
+
+def _chunk_result(results: typ.List[typ.Any], worker_cache: cache.Cache) -> ChunkResult:
+    return ChunkResult(
+        results,
+        worker_cache.take_counts(),
+        worker_cache.manifest.take_updates(),
+        worker_cache.timings.take_updates(),
+    )
+
+
+def _estimate_costs(filepaths: typ.Sequence[pl.Path], timings: cache.Timings) -> typ.List[float]:
+    seconds_per_byte = timings.seconds_per_byte()
+    costs            = []
+    for filepath in filepaths:
+        try:
+            size = filepath.stat().st_size
+        except OSError:
+            size = 0
+        costs.append(timings.estimate(filepath, size, seconds_per_byte))
+    return costs
+
+
+def _schedule_chunks(costs: typ.Sequence[float], jobs: int) -> typ.List[typ.List[int]]:
+    """Group files (by index) into chunks, the most expensive first.
+
+    The pool processes chunks in the order they are submitted, so the
+    longest files are started first and the cheap ones fill the gaps at
+    the end of the build. Each chunk has roughly the same cost, several
+    chunks per worker, so that no single chunk dominates the build.
+    """
+    target_cost = sum(costs) / (jobs * 4)
+    order       = sorted(range(len(costs)), key=lambda idx: -costs[idx])
+
+    chunks    : typ.List[typ.List[int]] = []
+    chunk     : typ.List[int]           = []
+    chunk_cost: float                   = 0.0
+    for idx in order:
+        chunk.append(idx)
+        chunk_cost += costs[idx]
+        if chunk_cost >= target_cost or len(chunk) >= MAX_CHUNK_SIZE:
+            chunks.append(chunk)
+            chunk      = []
+            chunk_cost = 0.0
+
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _run_parallel(
+    cfg         : common.BuildConfig,
+    chunk_fn    : typ.Callable[[typ.List[typ.Any]], ChunkResult],
+    items       : typ.Sequence[typ.Any],
+    costs       : typ.Sequence[float],
+    module_cache: cache.Cache,
+    jobs        : int,
+    link_mode   : str,
+) -> typ.List[typ.Any]:
+    """Apply chunk_fn to chunks of items in worker processes.
+
+    Returns the results in the order of items. If there are errors,
+    they are logged in the order of items and the first is raised.
+    """
+    chunk_indexes = _schedule_chunks(costs, jobs)
+    chunks        = [[items[idx] for idx in chunk] for chunk in chunk_indexes]
+
+    # NOTE (mb 2021-10-17): Workers are forked where possible. With
+    #   spawn, workers import the __main__ module, which for a setup.py
+    #   without a main guard would run the build again.
+    if "fork" in mp.get_all_start_methods():
+        mp_context = mp.get_context("fork")
+    else:
+        mp_context = mp.get_context()
+
+    # NOTE (mb 2021-10-17): The max_tasks_per_child argument of the
+    #   ProcessPoolExecutor is only available since python 3.11 and
+    #   can't be used with fork, so the pool is replaced instead.
+    batch_size    = jobs * MAX_TASKS_PER_CHILD
+    chunk_results = []
+    for batch_start in range(0, len(chunks), batch_size):
+        batch = chunks[batch_start : batch_start + batch_size]
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(jobs, len(batch)),
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(cfg, module_cache.cache_dir, module_cache.size_limit, link_mode),
+        ) as executor:
+            futures = [executor.submit(chunk_fn, chunk) for chunk in batch]
+            chunk_results.extend(future.result() for future in futures)
+
+    results: typ.List[typ.Any] = [None] * len(items)
+    for chunk, chunk_result in zip(chunk_indexes, chunk_results):
+        module_cache.add_counts(chunk_result.counts)
+        module_cache.manifest.merge(chunk_result.manifest_updates)
+        module_cache.timings.merge(chunk_result.timings_updates)
+        for idx, result in zip(chunk, chunk_result.results):
+            results[idx] = result
+
+    # NOTE (mb 2021-10-17): Errors are reported in the order of the
+    #   items, regardless of the order in which they were scheduled.
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        for err in errors:
+            logger.error(str(err))
+        raise errors[0]
+
+    return results
+
+
+def transpile_paths(
+    cfg         : common.BuildConfig,
+    filepaths   : typ.Sequence[pl.Path],
+    module_cache: typ.Optional[cache.Cache] = None,
+    dest_paths  : typ.Optional[typ.Sequence[pl.Path]] = None,
+) -> typ.List[pl.Path]:
+    """Transpile multiple files, using cfg.jobs worker processes.
+
+    Returns the paths of the cache entries in the order of filepaths.
+    If dest_paths are given, results are placed there (see transpile_path).
+    """
+    if module_cache is None:
+        module_cache = cache.Cache.from_config(cfg)
+
+    items: typ.List[ChunkItem]
+    if dest_paths is None:
+        items = [(filepath, None) for filepath in filepaths]
+    else:
+        items = list(zip(filepaths, dest_paths))
+
+    link_mode = sync.get_link_mode()
+    jobs      = get_jobs(cfg)
+    if jobs == 1 or len(items) <= 1:
+        return [
+            transpile_path(cfg, filepath, module_cache, dest, link_mode) for filepath, dest in items
+        ]
+    else:
+        filepaths = [filepath for filepath, _ in items]
+        costs     = _estimate_costs(filepaths, module_cache.timings)
+        results   = _run_parallel(
+            cfg, _transpile_chunk, items, costs, module_cache, jobs, link_mode
+        )
+        return [pl.Path(result) for result in results]
+
+
+def transpile_datas(
+    cfg         : common.BuildConfig,
+    items       : typ.Sequence[typ.Tuple[str, bytes]],
+    module_cache: typ.Optional[cache.Cache] = None,
+) -> typ.List[bytes]:
+    """Transpile the content of multiple modules (filepath, data).
+
+    Same as transpile_paths, for modules which are not files.
+    """
+    if module_cache is None:
+        module_cache = cache.Cache.from_config(cfg)
+
+    jobs = get_jobs(cfg)
+    if jobs == 1 or len(items) <= 1:
+        return [transpile_data(cfg, filepath, data, module_cache) for filepath, data in items]
+    else:
+        timings          = module_cache.timings
+        seconds_per_byte = timings.seconds_per_byte()
+        costs            = [len(data) * seconds_per_byte for _, data in items]
+        link_mode        = sync.get_link_mode()
+        return _run_parallel(
+            cfg, _transpile_data_chunk, items, costs, module_cache, jobs, link_mode
+        )
+
+
+def log_slowest_files(module_cache: cache.Cache) -> None:
+    """Log the files which took longest to transpile in this build."""
+    updated   = module_cache.timings.updated()
+    durations = [(entry[1], path) for path, entry in updated.items() if len(entry) == 2]
+    if not durations:
+        return
+
+    slowest = sorted(durations, reverse=True)[:SLOWEST_REPORT_SIZE]
+    total   = sum(duration for duration, _ in durations)
+    logger.info(f"transpiled {len(durations)} files in {total:.2f} sec, slowest:")
+    for duration, path in slowest:
+        logger.info(f"  {duration * 1000:8.1f} ms  {path}")
+
+
+def _iter_build_files(build_dir: str) -> typ.Iterable[pl.Path]:
+    for root, dirs, files in os.walk(build_dir):
+        dirs.sort()
+        for filename in sorted(files):
             filepath = pl.Path(root) / filename
             if filepath.suffix == ".py":
-                transpiled_path = transpile_path(cfg, filepath)
-                # overwrite original with transpiled
-                shutil.copy(transpiled_path, filepath)
+                yield filepath
+
+
+def _overwrite_with_transpiled(
+    cfg: common.BuildConfig, filepaths: typ.Sequence[pl.Path], module_cache: cache.Cache
+) -> None:
+    # NOTE (mb 2021-10-17): Each file is replaced rather than written
+    #   to, since it may be linked to a source file.
+    transpile_paths(cfg, filepaths, module_cache, dest_paths=filepaths)
+
+
+def build_package(
+    cfg         : common.BuildConfig,
+    package     : str,
+    build_dir   : str,
+    module_cache: typ.Optional[cache.Cache] = None,
+) -> None:
+    # pylint:disable=unused-argument ; `package` is part of the public api now
+    if module_cache is None:
+        module_cache = cache.Cache.from_config(cfg)
+
+    filepaths = list(_iter_build_files(build_dir))
+    _overwrite_with_transpiled(cfg, filepaths, module_cache)
+
+
+def target_tag(target_version: str) -> str:
+    """Suffix of the build directories of a target version.
+
+    >>> target_tag("2.7")
+    'py27'
+    """
+    return "py" + target_version.replace(".", "")
+
 
+def target_package_dirs(
+    build_package_dir: common.PackageDir, target_versions: typ.Sequence[str]
+) -> typ.Dict[str, common.PackageDir]:
+    """Build directories for each target of a multi target build.
 
-def build_packages(cfg: common.BuildConfig, build_package_dir: common.PackageDir) -> None:
-    CACHE_DIR.mkdir(exist_ok=True)
+    The tree of each target is next to the common root of the build
+    directories, e.g. build/lib3to6_out -> build/lib3to6_out_py27.
+    """
+    build_dirs = [pl.Path(build_dir) for build_dir in build_package_dir.values()]
+    root_dir   = pl.Path(os.path.commonpath(build_dirs))
+    return {
+        target_version: {
+            package: str(
+                pl.Path(f"{root_dir}_{target_tag(target_version)}")
+                / pl.Path(build_dir).relative_to(root_dir)
+            )
+            for package, build_dir in build_package_dir.items()
+        }
+        for target_version in target_versions
+    }
 
+
+def _build_targets(
+    cfg              : common.BuildConfig,
+    build_package_dir: common.PackageDir,
+    target_versions  : typ.Sequence[str],
+    module_cache     : cache.Cache,
+) -> typ.Dict[str, common.PackageDir]:
+    package_dirs  = target_package_dirs(build_package_dir, target_versions)
+    sync_manifest = sync.SyncManifest(pl.Path("build") / SYNC_MANIFEST_FILENAME)
+    # NOTE (mb 2021-10-17): The build directories were already filtered
+    #   by init_build_package_dir (and _ignore_tmp_files would ignore
+    #   everything, since they are below build/).
+    for package_dir in package_dirs.values():
+        for package, target_build_dir in package_dir.items():
+            sync.sync_tree(
+                pl.Path(build_package_dir[package]), pl.Path(target_build_dir), sync_manifest
+            )
+    sync_manifest.save()
+
+    items: typ.List[TargetsChunkItem] = []
     for package, build_dir in build_package_dir.items():
-        build_package(cfg, package, build_dir)
+        for filepath in _iter_build_files(build_dir):
+            rel_path = filepath.relative_to(build_dir)
+            dests    = tuple(
+                pl.Path(package_dirs[target_version][package]) / rel_path
+                for target_version in target_versions
+            )
+            items.append((filepath, tuple(target_versions), dests))
+
+    jobs      = get_jobs(cfg)
+    link_mode = sync.get_link_mode()
+    if jobs == 1 or len(items) <= 1:
+        for filepath, item_target_versions, dests in items:
+            transpile_path_targets(
+                cfg, filepath, item_target_versions, module_cache, dests, link_mode
+            )
+    else:
+        filepaths = [filepath for filepath, _, _ in items]
+        costs     = _estimate_costs(filepaths, module_cache.timings)
+        _run_parallel(
+            cfg, _transpile_targets_chunk, items, costs, module_cache, jobs, link_mode
+        )
+    return package_dirs
+
+
+def build_packages(
+    cfg              : common.BuildConfig,
+    build_package_dir: common.PackageDir,
+    target_versions  : typ.Optional[typ.Sequence[str]] = None,
+) -> typ.Dict[str, common.PackageDir]:
+    """Transpile the modules of build_package_dir.
+
+    Without target_versions, modules are transpiled in place for
+    cfg.target_version. With target_versions, build_package_dir is left
+    as is and a tree is written for each target (see target_package_dirs).
+    Each module is read, parsed and checked once for all targets.
+
+    Returns the build directories of each target version.
+    """
+    module_cache = cache.Cache.from_config(cfg)
+    if target_versions is None:
+        # all files are transpiled together, so that a single pool of
+        # workers is used for all packages
+        filepaths = [
+            filepath
+            for build_dir in build_package_dir.values()
+            for filepath in _iter_build_files(build_dir)
+        ]
+        _overwrite_with_transpiled(cfg, filepaths, module_cache)
+        package_dirs = {cfg.target_version: build_package_dir}
+    else:
+        package_dirs = _build_targets(cfg, build_package_dir, target_versions, module_cache)
+
+    log_slowest_files(module_cache)
+    module_cache.record_build()
+    return package_dirs
 
 
 def fix(
@@ -185,37 +796,75 @@ def fix(
     return build_package_dir
 
 
+def _eval_dist_build_config(
+    dist: setuptools.dist.Distribution, jobs: typ.Optional[int]
+) -> common.BuildConfig:
+    pyreq      = dist.python_requires
+    preq_match = isinstance(pyreq, str) and re.match(r">=([0-9]+\.[0-9]+)", pyreq)
+    if preq_match:
+        target_version = preq_match.group(1)
+    else:
+        raise ValueError('lib3to6: missing python_requires=">=X.Y" in setup.py')
+
+    # pylint: disable=protected-access
+    install_requires = sorted(dist._lib3to6_install_requires)
+    return eval_build_config(
+        target_version=target_version,
+        install_requires=install_requires,
+        default_mode=getattr(dist, 'lib3to6_default_mode', 'enabled'),
+        codegen=getattr(dist, 'lib3to6_codegen', None),
+        jobs=jobs,
+        import_fallbacks=getattr(dist, 'lib3to6_import_fallbacks', None),
+        builtin_renames=getattr(dist, 'lib3to6_builtin_renames', None),
+    )
+
+
+def _parse_jobs(cmd: setuptools.Command) -> typ.Optional[int]:
+    jobs = cmd.jobs
+    if jobs is None:
+        jobs = getattr(cmd.distribution, 'lib3to6_jobs', None)
+    if jobs is None:
+        return None
+    else:
+        return int(jobs)
+
+
 class build_py(_build_py.build_py):
     # pylint: disable=invalid-name      ; following the convention of setuptools
 
+    user_options = _build_py.build_py.user_options + [
+        ('jobs=', None, "number of parallel lib3to6 workers (0: one per cpu)"),
+    ]
+
+    def initialize_options(self) -> None:
+        super().initialize_options()
+        self.jobs = None
+
+    def finalize_options(self) -> None:
+        super().finalize_options()
+        self.jobs = _parse_jobs(self)
+
+    def copy_file(self, infile: str, outfile: str, *args, **kwargs) -> typ.Any:
+        # NOTE (mb 2021-10-17): A previous build may have linked outfile
+        #   to an entry of the cache. It is removed, since distutils
+        #   writes into existing files, which would modify the entry.
+        if os.path.isfile(outfile) and os.stat(outfile).st_nlink > 1:
+            os.unlink(outfile)
+        return super().copy_file(infile, outfile, *args, **kwargs)
+
     def _get_outputs(self) -> typ.List[str]:
         outputs = _build_py.orig.build_py.get_outputs(self, include_bytecode=0)  # type: ignore[attr-defined]
         return typ.cast(typ.List[str], outputs)
 
     def run_3to6(self) -> None:
-        outputs = self._get_outputs()
-        dist    = self.distribution
-        pyreq   = dist.python_requires
-
-        preq_match = isinstance(pyreq, str) and re.match(r">=([0-9]+\.[0-9]+)", pyreq)
-        if preq_match:
-            target_version = preq_match.group(1)
-        else:
-            raise ValueError('lib3to6: missing python_requires=">=X.Y" in setup.py')
-
-        # pylint: disable=protected-access
-        install_requires = sorted(dist._lib3to6_install_requires)
-        build_cfg        = eval_build_config(
-            target_version=target_version,
-            install_requires=install_requires,
-            default_mode=getattr(dist, 'lib3to6_default_mode', 'enabled'),
-        )
+        outputs   = self._get_outputs()
+        build_cfg = _eval_dist_build_config(self.distribution, self.jobs)
 
-        CACHE_DIR.mkdir(exist_ok=True)
-        for output in outputs:
-            if output.endswith(".py"):
-                transpiled_path = transpile_path(build_cfg, pl.Path(output))
-                shutil.copy(transpiled_path, output)
+        module_cache = cache.Cache.from_config(build_cfg)
+        filepaths    = [pl.Path(output) for output in outputs if output.endswith(".py")]
+        _overwrite_with_transpiled(build_cfg, filepaths, module_cache)
+        log_slowest_files(module_cache)
+        module_cache.record_build()
 
     def run(self) -> None:
         """Build modules, packages, and copy data files to build directory"""
@@ -241,6 +890,179 @@ class build_py(_build_py.build_py):
         self.byte_compile(self._get_outputs())
 
 
+def _dist_metadata(dist: setuptools.dist.Distribution) -> str:
+    buf = io.StringIO()
+    dist.metadata.write_pkg_file(buf)
+    pkg_info = buf.getvalue()
+
+    # NOTE (mb 2021-10-17): Newer versions of setuptools already
+    #   write the requirements to PKG-INFO.
+    headers = pkg_info.partition("\n\n")[0]
+    if "Requires-Dist:" in headers or "Provides-Extra:" in headers:
+        return pkg_info
+
+    # pylint: disable=protected-access
+    install_requires = dist._lib3to6_install_requires or []
+    extras_require   = dist.extras_require or {}
+    requirements     = wheels.iter_requires_dist(install_requires, extras_require)
+    return wheels.metadata_text(pkg_info, requirements)
+
+
+def build_wheel(
+    dist    : setuptools.dist.Distribution,
+    dist_dir: pl.Path,
+    jobs    : typ.Optional[int] = None,
+) -> pl.Path:
+    """Write a wheel of the distribution with transpiled modules.
+
+    Transpiled modules are streamed from the cache into the wheel and
+    package data from the source tree, without a build directory.
+    """
+    cfg     = _eval_dist_build_config(dist, jobs)
+    build   = dist.get_command_obj('build_py')
+    name    = dist.get_name()
+    version = dist.get_version()
+    tag     = wheels.python_tag(cfg.target_version)
+    build.ensure_finalized()
+
+    modules: typ.Dict[str, pl.Path] = {}
+    for package, module, module_file in build.find_all_modules():
+        arcname = "/".join(package.split(".") + [module + ".py"]).lstrip("/")
+        modules[arcname] = pl.Path(module_file)
+
+    data_files: typ.Dict[str, pl.Path] = {}
+    for package, src_dir, _build_dir, filenames in build.data_files:
+        for filename in filenames:
+            arcname = "/".join(package.split(".") + [pl.Path(filename).as_posix()]).lstrip("/")
+            data_files[arcname] = pl.Path(src_dir) / filename
+
+    arcnames     = sorted(modules)
+    module_cache = cache.Cache.from_config(cfg)
+    cache_paths  = transpile_paths(cfg, [modules[arcname] for arcname in arcnames], module_cache)
+
+    dist_dir.mkdir(parents=True, exist_ok=True)
+    dist_info  = f"{wheels.escape_name(name)}-{wheels.escape_name(version)}.dist-info"
+    wheel_path = dist_dir / wheels.wheel_filename(name, version, tag)
+    with wheels.WheelWriter(wheel_path, dist_info) as writer:
+        for arcname, cache_path in zip(arcnames, cache_paths):
+            writer.write_path(arcname, cache_path)
+        for arcname in sorted(data_files):
+            writer.write_path(arcname, data_files[arcname])
+
+        for license_file in getattr(dist.metadata, 'license_files', None) or []:
+            writer.write_path(f"{dist_info}/{pl.Path(license_file).name}", pl.Path(license_file))
+
+        top_level  = sorted({arcname.split("/")[0].replace(".py", "") for arcname in arcnames})
+        wheel_info = wheels.wheel_text(tag, generator=f"lib3to6 ({__version__})")
+        writer.write(f"{dist_info}/METADATA", _dist_metadata(dist).encode("utf-8"))
+        writer.write(f"{dist_info}/WHEEL", wheel_info.encode("utf-8"))
+        writer.write(f"{dist_info}/top_level.txt", "\n".join(top_level + [""]).encode("utf-8"))
+        if dist.entry_points:
+            entry_points = wheels.entry_points_text(dist.entry_points)
+            writer.write(f"{dist_info}/entry_points.txt", entry_points.encode("utf-8"))
+
+    log_slowest_files(module_cache)
+    module_cache.record_build()
+    return wheel_path
+
+
+# Signatures of RECORD are invalid once it is rewritten.
+WHEEL_SIGNATURE_FILES = ("RECORD.jws", "RECORD.p7s")
+
+
+def transpile_wheel(
+    cfg         : common.BuildConfig,
+    wheel_path  : pl.Path,
+    dist_dir    : pl.Path,
+    module_cache: typ.Optional[cache.Cache] = None,
+) -> pl.Path:
+    """Write a copy of a pure python wheel with transpiled modules.
+
+    Members other than modules are copied without recompression. The
+    python tag of the wheel and Requires-Python are set for the target
+    version and RECORD is rewritten.
+    """
+    if module_cache is None:
+        module_cache = cache.Cache.from_config(cfg)
+
+    tag      = wheels.python_tag(cfg.target_version)
+    filename = wheels.retag_wheel_filename(wheel_path.name, tag)
+
+    with zipfile.ZipFile(wheel_path) as in_zip:
+        in_infos  = [zinfo for zinfo in in_zip.infolist() if not zinfo.is_dir()]
+        dist_info = wheels.find_dist_info(zinfo.filename for zinfo in in_infos)
+        records   = wheels.parse_record(in_zip.read(f"{dist_info}/RECORD").decode("utf-8"))
+
+        wheel_info = in_zip.read(f"{dist_info}/WHEEL").decode("utf-8")
+        metadata   = in_zip.read(f"{dist_info}/METADATA").decode("utf-8")
+        rewritten  = {
+            f"{dist_info}/WHEEL"   : wheels.retag_wheel_text(wheel_info, tag),
+            f"{dist_info}/METADATA": wheels.replace_header(
+                metadata, "Requires-Python", ">=" + cfg.target_version
+            ),
+        }
+        skipped = {f"{dist_info}/RECORD"} | {
+            f"{dist_info}/{signature_file}" for signature_file in WHEEL_SIGNATURE_FILES
+        }
+
+        module_infos = [
+            zinfo
+            for zinfo in in_infos
+            if zinfo.filename.endswith(".py") and not zinfo.filename.startswith(dist_info + "/")
+        ]
+        items   = [(zinfo.filename, in_zip.read(zinfo)) for zinfo in module_infos]
+        modules = dict(zip(
+            [zinfo.filename for zinfo in module_infos],
+            transpile_datas(cfg, items, module_cache),
+        ))
+
+        dist_dir.mkdir(parents=True, exist_ok=True)
+        out_path = dist_dir / filename
+        n_copied = 0
+        with wheels.WheelWriter(out_path, dist_info) as writer:
+            for zinfo in in_infos:
+                arcname = zinfo.filename
+                mode    = (zinfo.external_attr >> 16) or 0o644
+                if arcname in skipped:
+                    continue
+                elif arcname in modules:
+                    writer.write(arcname, modules[arcname], mode)
+                elif arcname in rewritten:
+                    writer.write(arcname, rewritten[arcname].encode("utf-8"), mode)
+                elif writer.copy_member(in_zip, zinfo, records.get(arcname)):
+                    n_copied += 1
+
+    logger.info(
+        f"transpiled {len(modules)} modules, copied {n_copied} files without recompression"
+    )
+    module_cache.record_build()
+    return out_path
+
+
+class lib3to6_wheel(setuptools.Command):
+    # pylint: disable=invalid-name      ; following the convention of setuptools
+
+    description = "create a wheel of transpiled modules, without a build directory"
+
+    user_options = [
+        ('dist-dir=', 'd', "directory for the wheel (default: dist)"),
+        ('jobs='    , None, "number of parallel lib3to6 workers (0: one per cpu)"),
+    ]
+
+    def initialize_options(self) -> None:
+        self.dist_dir = None
+        self.jobs     = None
+
+    def finalize_options(self) -> None:
+        if self.dist_dir is None:
+            self.dist_dir = "dist"
+        self.jobs = _parse_jobs(self)
+
+    def run(self) -> None:
+        wheel_path = build_wheel(self.distribution, pl.Path(self.dist_dir), self.jobs)
+        logger.info(f"created {wheel_path}")
+
+
 class Distribution(setuptools.dist.Distribution):
     def __init__(self, attrs=None) -> None:
         # NOTE (mb 2021-08-20): Distutils removes all requirements
@@ -256,5 +1078,8 @@ class Distribution(setuptools.dist.Distribution):
         elif command == 'build_py':
             self.cmdclass[command] = build_py
             return build_py
+        elif command == 'lib3to6_wheel':
+            self.cmdclass[command] = lib3to6_wheel
+            return lib3to6_wheel
         else:
             return super().get_command_class(command)  # type: ignore[no-untyped-call]
@@ -0,0 +1,349 @@
+# This file is part of the lib3to6 project
+# https://github.com/mbarkhau/lib3to6
+#
+# Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+
+import os
+import json
+import socket
+import typing as typ
+import hashlib
+import logging
+import threading
+import collections
+import socketserver
+
+from . import cache
+from . import common
+from . import transpile
+
+logger = logging.getLogger(__name__)
+
+# Path of the socket of a running server, used by clients if no path
+# is given explicitly.
+ENV_SOCKET = 'LIB3TO6_SOCKET'
+
+# Number of results the server keeps in memory.
+MEMORY_CACHE_SIZE = 1024
+
+# Options of a transpile request, with their defaults.
+TRANSPILE_OPTIONS: typ.Dict[str, typ.Any] = {
+    'target_version'  : transpile.DEFAULT_TARGET_VERSION,
+    'install_requires': None,
+    'default_mode'    : 'enabled',
+    'fixers'          : "",
+    'checkers'        : "",
+    'codegen'         : 'astor',
+}
+
+# Protocol
+#
+# Requests and responses are JSON objects, one per line (utf-8).
+#
+#   {"id": 1, "method": "transpile", "params": {"source": "...", "target_version": "2.7"}}
+#   {"id": 1, "result": {"source": "..."}}
+#   {"id": 1, "error": {"type": "CheckError", "message": "...", "lineno": 3}}
+#
+# Methods: transpile, ping, shutdown
+
+Request  = typ.Dict[str, typ.Any]
+Response = typ.Dict[str, typ.Any]
+
+
+class RequestError(Exception):
+    pass
+
+
+class ServerError(Exception):
+    """An error of the server, which is not an error of the source."""
+
+
+def _error_response(err: Exception) -> typ.Dict[str, typ.Any]:
+    error: typ.Dict[str, typ.Any] = {'type': type(err).__name__, 'message': str(err)}
+    lineno = getattr(err, 'lineno', None)
+    if isinstance(lineno, int) and lineno >= 0:
+        error['lineno'] = lineno
+    return error
+
+
+class Handler:
+    """Handle requests, keeping plans and recent results in memory."""
+
+    def __init__(self, memory_cache_size: int = MEMORY_CACHE_SIZE) -> None:
+        self.memory_cache_size = memory_cache_size
+        self.is_shutdown       = False
+
+        self._lock    = threading.Lock()
+        self._results: typ.MutableMapping[str, str] = collections.OrderedDict()
+        # by options, the config and the hash of its cache key data
+        self._configs: typ.Dict[str, typ.Tuple[common.BuildConfig, typ.Any]] = {}
+
+    def _init_config(
+        self, params: typ.Dict[str, typ.Any]
+    ) -> typ.Tuple[common.BuildConfig, typ.Any]:
+        options = {name: params.get(name, default) for name, default in TRANSPILE_OPTIONS.items()}
+        options_key = json.dumps(options, sort_keys=True)
+        config      = self._configs.get(options_key)
+        if config is None:
+            install_requires = options['install_requires']
+            if isinstance(install_requires, str):
+                install_requires = install_requires.split()
+            if install_requires is not None:
+                options['install_requires'] = set(install_requires)
+
+            try:
+                cfg = common.init_build_context(**options).cfg
+                transpile.get_transpile_plan(cfg)
+            except (TypeError, ValueError, AssertionError) as err:
+                raise RequestError(f"Invalid options: {err}")
+
+            config = (cfg, hashlib.sha1(cache.cache_key_data(cfg)))
+            self._configs[options_key] = config
+        return config
+
+    def transpile(self, params: typ.Dict[str, typ.Any]) -> str:
+        source = params.get('source')
+        if not isinstance(source, str):
+            raise RequestError("Missing parameter: source")
+
+        cfg, key_hash = self._init_config(params)
+        filehash      = key_hash.copy()
+        filehash.update(source.encode("utf-8"))
+        key = filehash.hexdigest()
+
+        with self._lock:
+            fixed_source = self._results.get(key)
+            if fixed_source is not None:
+                self._results.move_to_end(key)  # type: ignore[attr-defined]
+                return fixed_source
+
+        filepath = params.get('filepath') or "<source>"
+        ctx      = common.BuildContext(cfg, filepath)
+        try:
+            fixed_source = transpile.transpile_module(ctx, source)
+        except common.CheckError as err:
+            err.add_location(filepath)
+            raise
+
+        with self._lock:
+            self._results[key] = fixed_source
+            while len(self._results) > self.memory_cache_size:
+                self._results.popitem(last=False)  # type: ignore[call-arg]
+        return fixed_source
+
+    def handle(self, request: Request) -> Response:
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise RequestError("Invalid request, must be an object")
+
+            method = request.get('method')
+            params = request.get('params') or {}
+            if not isinstance(params, dict):
+                raise RequestError("Invalid params, must be an object")
+
+            result: typ.Dict[str, typ.Any]
+            if method == 'transpile':
+                result = {'source': self.transpile(params)}
+            elif method == 'ping':
+                result = {}
+            elif method == 'shutdown':
+                self.is_shutdown = True
+                result = {}
+            else:
+                raise RequestError(f"Invalid method: {method}")
+            return {'id': request_id, 'result': result}
+        except Exception as err:
+            if not isinstance(err, (RequestError, common.CheckError, SyntaxError)):
+                logger.error(f"Error handling request: {err}", exc_info=True)
+            return {'id': request_id, 'error': _error_response(err)}
+
+    def handle_line(self, line: bytes) -> bytes:
+        try:
+            request = json.loads(line.decode("utf-8"))
+        except ValueError as err:
+            response = {'id': None, 'error': _error_response(RequestError(f"Invalid json: {err}"))}
+        else:
+            response = self.handle(request)
+        return json.dumps(response).encode("utf-8") + b"\n"
+
+
+def serve_stream(in_fobj: typ.IO[bytes], out_fobj: typ.IO[bytes], handler: Handler) -> None:
+    """Handle requests from in_fobj until EOF or a shutdown request."""
+    for line in in_fobj:
+        if not line.strip():
+            continue
+        out_fobj.write(handler.handle_line(line))
+        out_fobj.flush()
+        if handler.is_shutdown:
+            break
+
+
+class _StreamRequestHandler(socketserver.StreamRequestHandler):
+
+    server: '_UnixServer'
+
+    def handle(self) -> None:
+        handler = self.server.handler
+        serve_stream(self.rfile, typ.cast(typ.IO[bytes], self.wfile), handler)
+        if handler.is_shutdown:
+            # NOTE (mb 2021-10-17): shutdown blocks until serve_forever
+            #   returns, which would never happen in this thread.
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+    handler: Handler
+
+
+def _is_listening(socket_path: str) -> bool:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def serve_unix(
+    socket_path: str,
+    handler    : typ.Optional[Handler] = None,
+    ready      : typ.Optional[threading.Event] = None,
+) -> None:
+    """Handle requests on a unix socket until a shutdown request."""
+    if os.path.exists(socket_path):
+        if _is_listening(socket_path):
+            raise ServerError(f"Server already running on {socket_path}")
+        os.unlink(socket_path)  # stale socket of a server that was killed
+
+    server = _UnixServer(socket_path, _StreamRequestHandler)
+    server.handler = handler or Handler()
+    logger.info(f"listening on {socket_path}")
+    try:
+        if ready:
+            ready.set()
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def _raise_error(error: typ.Dict[str, typ.Any]) -> typ.NoReturn:
+    err_type = error.get('type')
+    message  = error.get('message', "")
+    lineno   = error.get('lineno', -1)
+
+    err: Exception
+    if err_type == 'CheckError':
+        err = common.CheckError(message)
+        err.lineno = lineno
+    elif err_type == 'SyntaxError':
+        err = SyntaxError(message)
+        err.lineno = lineno
+    else:
+        err = ServerError(f"{err_type}: {message}")
+    raise err
+
+
+class Client:
+    """Client of a server on a unix socket.
+
+    Connects on the first request, OSError is raised if there is no
+    server. Errors of the source are raised as common.CheckError or
+    SyntaxError, other errors of the server as ServerError.
+    """
+
+    def __init__(self, socket_path: str, timeout: typ.Optional[float] = None) -> None:
+        self.socket_path = socket_path
+        self.timeout     = timeout
+
+        self._request_id = 0
+        self._sock : typ.Optional[socket.socket] = None
+        self._rfile: typ.Optional[typ.IO[bytes]] = None
+
+    def _connect(self) -> typ.Tuple[socket.socket, typ.IO[bytes]]:
+        if self._sock is None or self._rfile is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._sock  = sock
+            self._rfile = sock.makefile(mode="rb")
+        return (self._sock, self._rfile)
+
+    def close(self) -> None:
+        if self._rfile:
+            self._rfile.close()
+        if self._sock:
+            self._sock.close()
+        self._sock  = None
+        self._rfile = None
+
+    def __enter__(self) -> 'Client':
+        return self
+
+    def __exit__(self, exc_type: typ.Any, exc_value: typ.Any, traceback: typ.Any) -> None:
+        self.close()
+
+    def request(self, method: str, params: typ.Optional[typ.Dict[str, typ.Any]] = None) -> typ.Any:
+        sock, rfile = self._connect()
+        self._request_id += 1
+        request = {'id': self._request_id, 'method': method, 'params': params or {}}
+        try:
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            line = rfile.readline()
+        except OSError:
+            self.close()
+            raise
+
+        if not line:
+            self.close()
+            raise ConnectionError("Connection closed by server")
+
+        response = json.loads(line.decode("utf-8"))
+        if 'error' in response:
+            _raise_error(response['error'])
+        return response.get('result')
+
+    def transpile(self, source: str, **options: typ.Any) -> str:
+        result = self.request('transpile', dict(options, source=source))
+        return typ.cast(str, result['source'])
+
+
+_local_handler: typ.Optional[Handler] = None
+
+
+def transpile_source(source: str, socket_path: typ.Optional[str] = None, **options: typ.Any) -> str:
+    """Transpile source with a server if one is running, in process otherwise.
+
+    The socket_path defaults to $LIB3TO6_SOCKET. The options are those
+    of TRANSPILE_OPTIONS and filepath (used in error messages).
+    """
+    # pylint:disable=global-statement ; lazily initialized
+    global _local_handler
+
+    socket_path = socket_path or os.environ.get(ENV_SOCKET)
+    if socket_path:
+        try:
+            with Client(socket_path) as client:
+                return client.transpile(source, **options)
+        except OSError as err:
+            logger.debug(f"No server on {socket_path} ({err}), transpiling in process")
+
+    if _local_handler is None:
+        _local_handler = Handler()
+
+    request  = {'method': 'transpile', 'params': dict(options, source=source)}
+    response = _local_handler.handle(request)
+    if 'error' in response:
+        _raise_error(response['error'])
+    return typ.cast(str, response['result']['source'])
@@ -0,0 +1,212 @@
+# This file is part of the lib3to6 project
+# https://github.com/mbarkhau/lib3to6
+#
+# Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+
+import os
+import time
+import shutil
+import typing as typ
+import logging
+import pathlib as pl
+
+from . import cache
+
+logger = logging.getLogger(__name__)
+
+
+ENV_LINK_MODE = 'LIB3TO6_LINK_MODE'
+
+# hardlink: share the file with the source (no data is copied)
+# reflink : copy on write clone, on file systems which support it
+# copy    : always copy the data
+LINK_MODES = ('hardlink', 'reflink', 'copy')
+
+DEFAULT_LINK_MODE = 'hardlink'
+
+# from linux/fs.h
+FICLONE = 0x40049409
+
+
+IgnoreFn = typ.Callable[[str, typ.List[str]], typ.List[str]]
+
+
+def get_link_mode() -> str:
+    link_mode = os.environ.get(ENV_LINK_MODE) or DEFAULT_LINK_MODE
+    if link_mode not in LINK_MODES:
+        raise ValueError(f"Invalid ${ENV_LINK_MODE}={link_mode}, must be one of {LINK_MODES}")
+    return link_mode
+
+
+def reflink(src: pl.Path, dst: pl.Path) -> None:
+    """Clone src to the new file dst, raises OSError if not supported."""
+    try:
+        # pylint: disable=import-outside-toplevel; only available on unix
+        import fcntl
+    except ImportError:
+        raise OSError("reflink not supported on this platform")
+
+    with src.open(mode="rb") as src_fobj:
+        with dst.open(mode="xb") as dst_fobj:
+            fcntl.ioctl(dst_fobj.fileno(), FICLONE, src_fobj.fileno())
+    shutil.copystat(str(src), str(dst))
+
+
+def _replace_with(dst: pl.Path, make_tmp_file: typ.Callable[[pl.Path], None]) -> None:
+    tmp_path = cache.tmp_path_for(dst)
+    try:
+        make_tmp_file(tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+
+def _copy(src: pl.Path, dst: pl.Path) -> None:
+    shutil.copy2(str(src), str(dst))
+
+
+def link_file(src: pl.Path, dst: pl.Path, link_mode: str) -> bool:
+    """Make dst a hardlink or reflink of src.
+
+    Returns False if link_mode is 'copy' or if the link could not be
+    created, e.g. because src and dst are on different devices.
+    """
+    if link_mode == 'hardlink':
+        make_link = os.link
+    elif link_mode == 'reflink':
+        make_link = reflink
+    else:
+        return False
+
+    try:
+        _replace_with(dst, lambda tmp_path: make_link(src, tmp_path))
+        return True
+    except OSError:
+        return False
+
+
+def place_file(src: pl.Path, dst: pl.Path, link_mode: str = 'copy') -> None:
+    """Make dst a copy (or link) of src.
+
+    The previous dst is replaced rather than written to, so that files
+    to which dst may have been linked are never modified.
+    """
+    if not link_file(src, dst, link_mode):
+        _replace_with(dst, lambda tmp_path: _copy(src, tmp_path))
+
+
+# (size, mtime_ns, inode)
+FileSignature = typ.List[int]
+
+
+def file_signature(stat: os.stat_result) -> FileSignature:
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+class SyncManifest(cache.PathIndex):
+    """Index from a destination file to the signatures of the source
+    it was synced from and of the destination itself.
+    """
+
+    def is_unchanged(self, dst: pl.Path, src_signature: FileSignature) -> bool:
+        entry = self.get(dst)
+        if entry is None or len(entry) != 2 or entry[0] != src_signature:
+            return False
+
+        try:
+            dst_stat = os.stat(dst)
+        except FileNotFoundError:
+            return False
+        return bool(entry[1] == file_signature(dst_stat))
+
+    def update(self, dst: pl.Path, src_signature: FileSignature) -> None:
+        _, mtime_ns, _ = src_signature
+        if time.time() - mtime_ns / 1e9 < cache.MANIFEST_MIN_AGE:
+            # racy, see cache.MANIFEST_MIN_AGE
+            self.set(dst, [])
+        else:
+            self.set(dst, [src_signature, file_signature(os.stat(dst))])
+
+
+class SyncStats(typ.NamedTuple):
+
+    placed   : int
+    unchanged: int
+    removed  : int
+
+
+def _remove_stale(
+    dst_dir: pl.Path, expected_files: typ.Set[pl.Path], expected_dirs: typ.Set[pl.Path]
+) -> int:
+    removed = 0
+    for root, dirs, files in os.walk(dst_dir, topdown=False):
+        root_path = pl.Path(root)
+        for name in files:
+            path = root_path / name
+            if path not in expected_files:
+                path.unlink()
+                removed += 1
+        for name in dirs:
+            path = root_path / name
+            if path in expected_dirs:
+                continue
+            if path.is_symlink():
+                path.unlink()
+            else:
+                path.rmdir()
+    return removed
+
+
+def sync_tree(
+    src_dir  : pl.Path,
+    dst_dir  : pl.Path,
+    manifest : SyncManifest,
+    ignore   : typ.Optional[IgnoreFn] = None,
+    link_mode: typ.Optional[str] = None,
+) -> SyncStats:
+    """Make dst_dir a copy of src_dir, only placing files that changed.
+
+    Files and directories in dst_dir which are not in src_dir are
+    removed. The ignore function has the same semantics as for
+    shutil.copytree.
+    """
+    if link_mode is None:
+        link_mode = get_link_mode()
+
+    placed    = 0
+    unchanged = 0
+
+    expected_files: typ.Set[pl.Path] = set()
+    expected_dirs : typ.Set[pl.Path] = set()
+
+    for root, dirs, files in os.walk(src_dir, followlinks=True):
+        ignored = set(ignore(root, dirs + files)) if ignore else set()
+        dirs[:] = sorted(name for name in dirs if name not in ignored)
+
+        dst_root = dst_dir / os.path.relpath(root, src_dir)
+        dst_root.mkdir(parents=True, exist_ok=True)
+        expected_dirs.add(dst_root)
+
+        for name in sorted(files):
+            if name in ignored:
+                continue
+
+            src_path = pl.Path(root) / name
+            dst_path = dst_root / name
+            expected_files.add(dst_path)
+
+            src_signature = file_signature(os.stat(src_path))
+            if manifest.is_unchanged(dst_path, src_signature):
+                unchanged += 1
+            else:
+                place_file(src_path, dst_path, link_mode)
+                manifest.update(dst_path, src_signature)
+                placed += 1
+
+    removed = _remove_stale(dst_dir, expected_files, expected_dirs)
+    stats   = SyncStats(placed, unchanged, removed)
+    logger.debug(f"synced {src_dir} -> {dst_dir}: {stats}")
+    return stats
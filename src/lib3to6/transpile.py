@@ -4,20 +4,25 @@
 # Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
 # SPDX-License-Identifier: MIT
 
+import io
 import re
 import ast
 import sys
+import copy
 import typing as typ
-
-import astor
+import logging
+import tokenize
+import functools
+import itertools
 
 from . import utils
 from . import common
-from . import fixers
-from . import checkers
+from . import codegen
 from . import fixer_base as fb
 from . import checker_base as cb
 
+logger = logging.getLogger(__name__)
+
 DEFAULT_SOURCE_ENCODING_DECLARATION = "# -*- coding: {} -*-"
 
 DEFAULT_SOURCE_ENCODING = "utf-8"
@@ -40,6 +45,34 @@ MODE_MARKER_PATTERN = r"#\s*lib3to6:\s*(?P<mode>disabled|enabled)"
 MODE_MARKER_RE = re.compile(MODE_MARKER_PATTERN, flags=re.MULTILINE)
 
 
+# NOTE (mb 2021-10-17): Source which is reused without codegen must
+#   be valid syntax for the target version. This is checked by parsing
+#   it with the target as the feature_version, which ast.parse only
+#   supports on a best-effort basis. Some newer syntax is accepted,
+#   which codegen would have normalized to syntax that the target does
+#   support. Such syntax is checked separately (see _iter_newer_syntax).
+#   The checks were compared against interpreters since python 3.6, for
+#   older targets, source is always regenerated.
+
+if sys.version_info < (3, 13):
+    FEATURE_VERSION_SINCE = (3, 6)
+else:
+    # lowest feature_version supported by ast.parse
+    FEATURE_VERSION_SINCE = (3, 7)
+
+# Versions since which syntax is supported, which ast.parse doesn't check.
+RELAXED_DECORATORS_SINCE          = (3, 9)
+UNPARENTHESIZED_FOR_STARRED_SINCE = (3, 9)
+PARENTHESIZED_WITH_ITEMS_SINCE    = (3, 9)
+UNPARENTHESIZED_WALRUS_SINCE      = (3, 10)
+# f"{x=}"
+SELF_DOCUMENTING_FSTRING_SINCE = (3, 8)
+# quotes, backslashes, comments and newlines in f-string expressions
+FSTRING_GRAMMAR_SINCE = (3, 12)
+
+DOTTED_NAME_RE = re.compile(r"[^\W\d]\w*(\s*\.\s*[^\W\d]\w*)*")
+
+
 class ModuleHeader(typ.NamedTuple):
 
     coding: str
@@ -131,17 +164,41 @@ def get_available_classes(module: object, clazz: CheckerOrFixer) -> typ.Dict[str
 FuzzyNames = typ.Union[str, typ.List[str]]
 
 
-def get_selected_names(names: FuzzyNames, available_names: typ.Set[str]) -> typ.List[str]:
+def get_selected_names(
+    names           : FuzzyNames,
+    available_names : typ.Set[str],
+    deprecated_names: typ.Optional[typ.Set[str]] = None,
+) -> typ.List[str]:
+    """Normalized names which are selected, all available names if none are.
+
+    >>> get_selected_names("foo_fixer,Bar", {"foo", "bar", "baz"})
+    ['foo', 'bar']
+    >>> get_selected_names("", {"foo", "bar"})
+    ['bar', 'foo']
+    >>> get_selected_names("qux", {"foo", "bar"})
+    Traceback (most recent call last):
+    ...
+    ValueError: Unknown names: qux (available: bar, foo)
+    """
     if isinstance(names, str):
         names_list = names.split(",")
     else:
         names_list = names
 
     selected_names = [normalize_name(name) for name in names_list if name.strip()]
-
     if selected_names:
-        for name in selected_names:
-            assert name in available_names
+        known_names   = available_names | (deprecated_names or set())
+        unknown_names = [
+            name.strip()
+            for name in names_list
+            if name.strip() and normalize_name(name) not in known_names
+        ]
+        if unknown_names:
+            msg = (
+                f"Unknown names: {', '.join(unknown_names)} "
+                f"(available: {', '.join(sorted(available_names))})"
+            )
+            raise ValueError(msg)
     else:
         # Nothing explicitly selected -> all selected
         selected_names = sorted(available_names)
@@ -151,20 +208,86 @@ def get_selected_names(names: FuzzyNames, available_names: typ.Set[str]) -> typ.
     return selected_names
 
 
-def iter_fuzzy_selected_checkers(names: FuzzyNames) -> typ.Iterable[cb.CheckerBase]:
-    available_classes = get_available_classes(checkers, cb.CheckerBase)
-    selected_names    = get_selected_names(names, set(available_classes))
-    for name in selected_names:
-        checker_type = typ.cast(CheckerType, available_classes[name])
-        yield checker_type()
+class TranspilePlan(typ.NamedTuple):
+    """Checker and fixer classes to apply for a build configuration.
+
+    The classes are in the order in which they are applied, selection
+    and version checks have already been done.
+    """
+
+    source_version: str
+    target_version: str
+    checker_types : typ.Tuple[CheckerType, ...]
+    fixer_types   : typ.Tuple[FixerType  , ...]
 
 
-def iter_fuzzy_selected_fixers(names: FuzzyNames) -> typ.Iterable[fb.FixerBase]:
-    available_classes = get_available_classes(fixers, fb.FixerBase)
-    selected_names    = get_selected_names(names, set(available_classes))
+def _fuzzy_names_key(names: FuzzyNames) -> typ.Tuple[str, ...]:
+    if isinstance(names, str):
+        names_list = names.split(",")
+    else:
+        names_list = names
+    return tuple(name.strip() for name in names_list if name.strip())
+
+
+def _iter_selected_types(
+    module          : object,
+    clazz           : CheckerOrFixer,
+    names           : typ.Tuple[str, ...],
+    deprecated_types: typ.Optional[typ.Mapping[str, CheckerOrFixer]] = None,
+) -> typ.Iterable[CheckerOrFixer]:
+    available_classes = get_available_classes(module, clazz)
+    # NOTE (mb 2021-10-17): Deprecated classes are only used if they are
+    #   selected by name, they are not part of the default selection.
+    deprecated_names = {normalize_name(name): name for name in deprecated_types or {}}
+    selected_names   = get_selected_names(
+        list(names), set(available_classes), set(deprecated_names)
+    )
     for name in selected_names:
-        fixer_type = typ.cast(FixerType, available_classes[name])
-        yield fixer_type()
+        if name in available_classes:
+            yield available_classes[name]
+        else:
+            yield getattr(module, deprecated_names[name])
+
+
+@functools.lru_cache(maxsize=64)
+def _init_transpile_plan(
+    source_version: str,
+    target_version: str,
+    fixer_names   : typ.Tuple[str, ...],
+    checker_names : typ.Tuple[str, ...],
+) -> TranspilePlan:
+    # pylint: disable=import-outside-toplevel; lazy import to speed up import lib3to6
+    from . import fixers
+    from . import checkers
+
+    checker_types = tuple(
+        typ.cast(CheckerType, checker_type)
+        for checker_type in _iter_selected_types(checkers, cb.CheckerBase, checker_names)
+        if checker_type.version_info.is_applicable_to(source_version, target_version)
+    )
+    fixer_types = tuple(
+        typ.cast(FixerType, fixer_type)
+        for fixer_type in _iter_selected_types(
+            fixers, fb.FixerBase, fixer_names, fixers.DEPRECATED_FIXERS
+        )
+        if fixer_type.version_info.is_applicable_to(source_version, target_version)
+    )
+    return TranspilePlan(source_version, target_version, checker_types, fixer_types)
+
+
+def get_transpile_plan(cfg: common.BuildConfig) -> TranspilePlan:
+    """Get the (memoized) plan for cfg.
+
+    Plans are cached by (source_version, target_version, fixers,
+    checkers), so that the registry of available classes is only
+    scanned once, rather than for every module of a package.
+    """
+    return _init_transpile_plan(
+        common.get_source_version(),
+        cfg.target_version,
+        _fuzzy_names_key(cfg.fixers),
+        _fuzzy_names_key(cfg.checkers),
+    )
 
 
 def find_import_decls(node: ast.AST) -> typ.Iterable[common.ImportDecl]:
@@ -258,7 +381,7 @@ def parse_imports(tree: ast.Module) -> typ.Tuple[int, int, typ.Set[common.Import
     return (future_imports_offset, imports_end_offset, import_decls)
 
 
-def add_required_imports(tree: ast.Module, required_imports: typ.Set[common.ImportDecl]) -> None:
+def add_required_imports(tree: ast.Module, required_imports: typ.Set[common.ImportDecl]) -> bool:
     """Add imports required by fixers.
 
     Some fixers depend on modules which may not be imported in
@@ -271,6 +394,8 @@ def add_required_imports(tree: ast.Module, required_imports: typ.Set[common.Impo
     could be subject to the fix which requires the import. As
     a side effect, a module may end up being imported twice, if
     the module is imported after some statement.
+
+    Returns True if any imports were added.
     """
     (future_imports_offset, imports_end_offset, found_imports) = parse_imports(tree)
 
@@ -313,6 +438,8 @@ def add_required_imports(tree: ast.Module, required_imports: typ.Set[common.Impo
             tree.body.insert(imports_end_offset, import_node)
             imports_end_offset += 1
 
+    return len(missing_imports) > 0
+
 
 def add_module_declarations(tree: ast.Module, module_declarations: typ.Set[str]) -> None:
     """Add global declarations required by fixers.
@@ -331,54 +458,605 @@ def add_module_declarations(tree: ast.Module, module_declarations: typ.Set[str])
         imports_end_offset += 1
 
 
-def transpile_module(ctx: common.BuildContext, module_source: str) -> str:
+def select_triggered_fixers(
+    ctx: common.BuildContext, fixers: typ.Sequence[fb.FixerBase], facts: cb.ModuleFacts
+) -> typ.List[fb.FixerBase]:
+    """Select the fixers for which the module has any trigger features."""
+    triggered_fixers: typ.List[fb.FixerBase] = []
+    skipped_names   : typ.List[str         ] = []
+    for fixer in fixers:
+        trigger_features = fixer.get_trigger_features()
+        if trigger_features and trigger_features.isdisjoint(facts.features):
+            skipped_names.append(type(fixer).__name__)
+        else:
+            triggered_fixers.append(fixer)
+
+    if skipped_names and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"{ctx.filepath}: skipped fixers {', '.join(skipped_names)}")
+
+    return triggered_fixers
+
+
+SourceLines = typ.List[str]
+
+AnyNode = typ.Union[ast.expr, ast.stmt]
+
+WithNode = typ.Union[ast.With, ast.AsyncWith]
+
+
+def _source_text(lines: SourceLines, start: typ.Tuple[int, int], end: typ.Tuple[int, int]) -> str:
+    # NOTE (mb 2021-10-17): col_offset is the offset in utf-8 bytes
+    (lineno, col_offset), (end_lineno, end_col_offset) = start, end
+    if lineno == end_lineno:
+        line_data = lines[lineno - 1].encode("utf-8")
+        return line_data[col_offset:end_col_offset].decode("utf-8")
+    else:
+        first_line = lines[lineno     - 1].encode("utf-8")[col_offset:].decode("utf-8")
+        last_line  = lines[end_lineno - 1].encode("utf-8")[:end_col_offset].decode("utf-8")
+        return first_line + "".join(lines[lineno : end_lineno - 1]) + last_line
+
+
+def _node_start(node: AnyNode) -> typ.Tuple[int, int]:
+    return (node.lineno, node.col_offset)
+
+
+def _node_end(node: AnyNode) -> typ.Tuple[int, int]:
+    return (typ.cast(int, node.end_lineno), typ.cast(int, node.end_col_offset))
+
+
+def _node_text(lines: SourceLines, node: AnyNode) -> str:
+    return _source_text(lines, _node_start(node), _node_end(node))
+
+
+def _is_preceded_by_paren(lines: SourceLines, node: ast.expr) -> bool:
+    line_prefix = _source_text(lines, (node.lineno, 0), _node_start(node))
+    return line_prefix.rstrip().endswith("(")
+
+
+# Tokens which don't affect the syntax of the tokens around them.
+_IGNORED_TOKEN_TYPES = {
+    tokenize.NL,
+    tokenize.NEWLINE,
+    tokenize.COMMENT,
+    tokenize.INDENT,
+    tokenize.DEDENT,
+    tokenize.ENDMARKER,
+}
+
+
+def _iter_tokens(text: str) -> typ.Iterable[tokenize.TokenInfo]:
+    tokens = tokenize.generate_tokens(io.StringIO(text).readline)
+    return (token for token in tokens if token.type not in _IGNORED_TOKEN_TYPES)
+
+
+def _iter_group_ends(text: str) -> typ.Iterable[str]:
+    """Tokens of text at the outermost level, groups are reduced to their closing bracket.
+
+    >>> list(_iter_group_ends("(a), *b"))
+    [')', ',', '*', 'b']
+    >>> list(_iter_group_ends("(a, (b)) :"))
+    [')', ':']
+    """
+    depth = 0
+    for token in _iter_tokens(text):
+        if token.type == tokenize.OP and token.string in "([{":
+            depth += 1
+        elif token.type == tokenize.OP and token.string in ")]}":
+            depth -= 1
+            if depth == 0:
+                yield token.string
+        elif depth == 0:
+            yield token.string
+
+
+def _is_parenthesized(text: str) -> bool:
+    """Check if text is a single group of parentheses.
+
+    >>> _is_parenthesized("(a, *b)")
+    True
+    >>> _is_parenthesized("(a), *b")
+    False
+    """
+    if not text.startswith("("):
+        return False
+    try:
+        return list(_iter_group_ends(text)) == [")"]
+    except (tokenize.TokenError, SyntaxError):
+        return False
+
+
+def _is_dotted_name_decorator(lines: SourceLines, decorator: ast.expr) -> bool:
+    # before python 3.9: '@' dotted_name [ '(' [arglist] ')' ] NEWLINE
+    if isinstance(decorator, ast.Call):
+        name_node = decorator.func
+    else:
+        name_node = decorator
+
+    line_prefix = _source_text(lines, (decorator.lineno, 0), _node_start(decorator))
+    return (
+        line_prefix.rstrip().endswith("@")
+        and _node_start(name_node) == _node_start(decorator)
+        and DOTTED_NAME_RE.fullmatch(_node_text(lines, name_node)) is not None
+    )
+
+
+def _has_parenthesized_items(lines: SourceLines, node: WithNode) -> bool:
+    if len(node.items) == 1 and node.items[0].optional_vars is None:
+        return False
+
+    # the text after "with", up to the first statement of the body
+    header_text = _source_text(lines, _node_start(node), _node_start(node.body[0]))
+    items_text  = header_text.split("with", 1)[1].lstrip()
+    if not items_text.startswith("("):
+        return False
+    try:
+        return list(itertools.islice(_iter_group_ends(items_text), 2)) == [")", ":"]
+    except (tokenize.TokenError, SyntaxError):
+        return True
+
+
+def _is_unparenthesized_walrus(lines: SourceLines, node: ast.expr) -> bool:
+    return isinstance(node, ast.NamedExpr) and not _is_preceded_by_paren(lines, node)
+
+
+def _iter_newer_syntax(tree: ast.Module, lines: SourceLines) -> typ.Iterable[common.VersionTuple]:
+    """Versions since which syntax in tree is supported, that ast.parse doesn't check."""
+    for node in ast.walk(tree):
+        if isinstance(node, DefNodeTypes):
+            for decorator in node.decorator_list:
+                if not _is_dotted_name_decorator(lines, decorator):
+                    yield RELAXED_DECORATORS_SINCE
+        elif isinstance(node, (ast.For, ast.AsyncFor)):
+            iter_node     = node.iter
+            is_starred    = isinstance(iter_node, ast.Tuple) and any(
+                isinstance(elt, ast.Starred) for elt in iter_node.elts
+            )
+            if is_starred and not _is_parenthesized(_node_text(lines, iter_node)):
+                yield UNPARENTHESIZED_FOR_STARRED_SINCE
+        elif isinstance(node, (ast.With, ast.AsyncWith)):
+            if _has_parenthesized_items(lines, node):
+                yield PARENTHESIZED_WITH_ITEMS_SINCE
+        elif isinstance(node, ast.Subscript):
+            slice_node = node.slice
+            if isinstance(slice_node, ast.Tuple):
+                elts = slice_node.elts
+            else:
+                elts = [slice_node]
+            if any(_is_unparenthesized_walrus(lines, elt) for elt in elts):
+                yield UNPARENTHESIZED_WALRUS_SINCE
+        elif isinstance(node, (ast.Set, ast.SetComp)):
+            elts = node.elts if isinstance(node, ast.Set) else [node.elt]
+            if any(_is_unparenthesized_walrus(lines, elt) for elt in elts):
+                yield UNPARENTHESIZED_WALRUS_SINCE
+
+
+def _fstring_quote(fstring_start: str) -> str:
+    """
+    >>> _fstring_quote("Rf'")
+    "'"
+    """
+    return fstring_start.lstrip("rRbBfFuU")
+
+
+def _iter_newer_fstring_syntax(module_source: str) -> typ.Iterable[common.VersionTuple]:
+    """Versions since which syntax of f-strings in module_source is supported.
+
+    Only the tokenizer of python 3.12+ (PEP 701) has tokens for the
+    parts of an f-string, older versions don't accept the syntax.
+    """
+    # pylint: disable=no-member; only available since python 3.12
+    if not hasattr(tokenize, 'FSTRING_START'):
+        return
+
+    depth = 0   # of nested f-strings
+    quote = ""  # of the outermost f-string
+
+    prev_token: typ.Optional[tokenize.TokenInfo] = None
+    for token in tokenize.generate_tokens(io.StringIO(module_source).readline):
+        if token.type == tokenize.FSTRING_START:
+            depth += 1
+            is_literal = depth == 1
+            if is_literal:
+                quote = _fstring_quote(token.string)
+        elif token.type == tokenize.FSTRING_END:
+            depth -= 1
+            is_literal = depth == 0
+        else:
+            is_literal = depth == 0 or (depth == 1 and token.type == tokenize.FSTRING_MIDDLE)
+
+        if not is_literal and prev_token:
+            # expressions of an f-string, before python 3.12 they were
+            # part of the string token, which restricts their chars
+            if quote in token.string or "\\" in token.string or "#" in token.string:
+                yield FSTRING_GRAMMAR_SINCE
+            elif token.type == tokenize.NL and len(quote) == 1:
+                yield FSTRING_GRAMMAR_SINCE
+            elif token.start[0] > prev_token.end[0] and prev_token.type != tokenize.NL:
+                # line continuation
+                yield FSTRING_GRAMMAR_SINCE
+            elif prev_token.string == "=" and token.string in ("}", "!", ":"):
+                yield SELF_DOCUMENTING_FSTRING_SINCE
+        prev_token = token
+
+
+def is_passthrough_safe(module_source: str, target_version: str) -> bool:
+    """Check if source can be used for the target without regenerating it.
+
+    This is the case if the grammar of the running interpreter is not
+    newer than that of the target, or if it is shown that the target
+    can parse the source. Otherwise the source might contain syntax
+    which the target can't parse, but which codegen would normalize.
+
+    >>> is_passthrough_safe("x = 1_000", "3.10")
+    True
+    >>> is_passthrough_safe("x = 1_000", "2.7")
+    False
+    >>> is_passthrough_safe("with (a as b,\\n      c as d):\\n    pass", "3.8")
+    False
+    >>> is_passthrough_safe("for x in *a, 1:\\n    pass", "3.8")
+    False
+    >>> is_passthrough_safe("for x in (*a, 1):\\n    pass", "3.8")
+    True
+    """
+    version = common.parse_version(target_version)
+    if version >= common.parse_version(common.get_source_version()):
+        return True
+    if version < FEATURE_VERSION_SINCE or sys.version_info < (3, 8):
+        return False
+
+    try:
+        tree = ast.parse(module_source, feature_version=(version + (0,))[:2])
+    except (SyntaxError, ValueError):
+        # NOTE (mb 2021-10-17): ast.parse of python 3.12.1 can raise a
+        #   ValueError for some f-strings with a feature_version.
+        return False
+
+    lines        = io.StringIO(module_source, newline="").readlines()
+    newer_syntax = itertools.chain(
+        _iter_newer_syntax(tree, lines), _iter_newer_fstring_syntax(module_source)
+    )
+    return all(since <= version for since in newer_syntax)
+
+
+def passthrough_module(module_source: str, target_version: str) -> str:
+    """Source of a module which was not modified by any fixer.
+
+    The source is returned as is, except that a coding declaration
+    is added if the target version requires one.
+    """
+    header      = parse_module_header(module_source, target_version)
+    coding_decl = DEFAULT_SOURCE_ENCODING_DECLARATION.format(header.coding)
+
+    header_lines = header.text.splitlines()[:2]
+    if coding_decl not in header_lines:
+        return module_source
+
+    source_lines = module_source.splitlines(True)
+    if any(line.rstrip() == coding_decl for line in source_lines[:2]):
+        return module_source
+
+    if source_lines and source_lines[0].endswith("\r\n"):
+        newline = "\r\n"
+    else:
+        newline = "\n"
+
+    source_lines.insert(header_lines.index(coding_decl), coding_decl + newline)
+    return "".join(source_lines)
+
+
+ModifiedStmts = typ.Optional[typ.List[ast.stmt]]
+
+DefNodeTypes = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def _stmt_span(stmt: ast.stmt) -> typ.Tuple[int, int]:
+    start_lineno = stmt.lineno
+    if isinstance(stmt, DefNodeTypes):
+        for decorator in stmt.decorator_list:
+            start_lineno = min(start_lineno, decorator.lineno)
+    return (start_lineno, typ.cast(int, stmt.end_lineno))
+
+
+def splice_module(
+    module_source : str,
+    module_tree   : ast.Module,
+    original_stmts: typ.List[ast.stmt],
+    modified_stmts: typ.List[ast.stmt],
+    target_version: str,
+    to_source     : codegen.CodegenBackend = codegen.astor_to_source,
+) -> str:
+    """Generate the source of a module, reusing unmodified statements.
+
+    The source text of a top level statement is reused if it is one of
+    the original_stmts, was not modified in place and doesn't share a
+    line with another statement. Comments and blank lines before such
+    a statement are kept with it. Any other statement is regenerated.
+
+    The module header (see parse_module_header) is not included.
+    """
+    # NOTE (mb 2021-10-17): splitlines would also split on characters
+    #   such as form feeds, which don't end a line for the tokenizer.
+    lines = io.StringIO(module_source, newline="").readlines()
+
+    spans          = [_stmt_span(stmt) for stmt in original_stmts]
+    original_index = {id(stmt): i for i, stmt in enumerate(original_stmts)}
+    is_reusable    = [True] * len(original_stmts)
+    for i in range(1, len(spans)):
+        if spans[i][0] <= spans[i - 1][1]:
+            is_reusable[i - 1] = False
+            is_reusable[i    ] = False
+    for stmt in modified_stmts:
+        if id(stmt) in original_index:
+            is_reusable[original_index[id(stmt)]] = False
+
+    chunks   : typ.List[str] = []
+    prev_stmt: typ.Optional[ast.stmt] = None
+    for stmt in module_tree.body:
+        i = original_index.get(id(stmt), -1)
+        if i >= 0:
+            # comments and blank lines since the previous statement,
+            # for the first statement these are part of the header
+            start_lineno, end_lineno = spans[i]
+            gap_lineno = spans[i - 1][1] + 1 if i > 0 else start_lineno
+            gap_text   = "".join(lines[gap_lineno - 1 : start_lineno - 1])
+            stmt_text  = "".join(lines[start_lineno - 1 : end_lineno])
+            if not (is_reusable[i] and is_passthrough_safe(stmt_text, target_version)):
+                stmt_text = to_source(stmt)
+        else:
+            gap_text  = ""
+            stmt_text = to_source(stmt)
+
+        # statements without an original gap are separated like
+        # top level statements by codegen
+        is_def = isinstance(stmt, DefNodeTypes) or isinstance(prev_stmt, DefNodeTypes)
+        if is_def and prev_stmt and i <= 0:
+            gap_text = "\n\n"
+
+        if not stmt_text.endswith("\n"):
+            stmt_text += "\n"
+        chunks.append(gap_text)
+        chunks.append(stmt_text)
+        prev_stmt = stmt
+
+    if spans:
+        # trailing comments
+        chunks.append("".join(lines[spans[-1][1] :]))
+
+    return "".join(chunks)
+
+
+def _module_mode(ctx: common.BuildContext, module_source: str) -> str:
     _module_header = module_source.split("import", 1)[0]
     _module_header = _module_header.split("'''", 1)[0]
     _module_header = _module_header.split('"""', 1)[0]
 
     lib3to6_mode_marker = MODE_MARKER_RE.search(_module_header)
     if lib3to6_mode_marker:
-        mode = lib3to6_mode_marker.group('mode')
+        return lib3to6_mode_marker.group('mode')
     else:
-        mode = ctx.cfg.default_mode
+        return ctx.cfg.default_mode
 
-    if mode == 'disabled':
-        return module_source
 
-    checker_names: FuzzyNames = ctx.cfg.checkers
-    fixer_names  : FuzzyNames = ctx.cfg.fixers
-    module_tree = ast.parse(module_source)
+def check_module_targets(
+    ctxs       : typ.Sequence[common.BuildContext],
+    plans      : typ.Sequence[TranspilePlan],
+    module_tree: ast.Module,
+) -> cb.ModuleFacts:
+    """Run the checkers of multiple targets with a single walk.
+
+    Checkers which are target_independent are only run once. If there
+    are errors, the first error of the first target is raised, which
+    is the same error as if the targets were checked one after another.
+    """
+    shared_checkers: typ.Dict[CheckerType, cb.CheckerBase] = {}
+    target_checkers: typ.List[typ.List[cb.CheckerBase]] = []
+    all_checkers   : typ.List[cb.CheckerBase] = []
+    contexts       : typ.Dict[int, common.BuildContext] = {}
+
+    for ctx, plan in zip(ctxs, plans):
+        checker_list: typ.List[cb.CheckerBase] = []
+        for checker_type in plan.checker_types:
+            checker = shared_checkers.get(checker_type)
+            if checker is None:
+                checker = checker_type()
+                all_checkers.append(checker)
+                contexts[id(checker)] = ctx
+                if checker_type.target_independent:
+                    shared_checkers[checker_type] = checker
+            checker_list.append(checker)
+        target_checkers.append(checker_list)
+
+    facts, errors = cb.CheckerDispatcher(all_checkers).collect(ctxs[0], module_tree, contexts)
+    for checker_list in target_checkers:
+        for checker in checker_list:
+            err = errors.get(id(checker))
+            if err:
+                raise err
+    return facts
+
+
+class FixedModule(typ.NamedTuple):
+
+    tree          : ast.Module
+    original_stmts: typ.List[ast.stmt]
+    modified_stmts: ModifiedStmts
+    is_modified   : bool
+
+
+def fix_module(
+    ctx           : common.BuildContext,
+    fixers        : typ.Sequence[fb.FixerBase],
+    module_tree   : ast.Module,
+    original_stmts: typ.List[ast.stmt],
+) -> FixedModule:
+    """Apply fixers to module_tree (which is modified in place)."""
     required_imports   : typ.Set[common.ImportDecl] = set()
     module_declarations: typ.Set[str              ] = set()
 
-    ver            = sys.version_info
-    source_version = f"{ver.major}.{ver.minor}"
-    target_version = ctx.cfg.target_version
+    modified_stmts: ModifiedStmts = []
+
+    for fixer_pass in fb.iter_fixer_passes(fixers):
+        maybe_fixed_module = fixer_pass(ctx, module_tree)
+        if maybe_fixed_module is None:
+            raise Exception(f"Error running fixer {type(fixer_pass).__name__}")
+        module_tree = maybe_fixed_module
 
-    for checker in iter_fuzzy_selected_checkers(checker_names):
-        if checker.version_info.is_applicable_to(source_version, target_version):
-            checker(ctx, module_tree)
+        if fixer_pass.modified_stmts is None:
+            modified_stmts = None
+        elif modified_stmts is not None:
+            modified_stmts.extend(fixer_pass.modified_stmts)
 
-    for fixer in iter_fuzzy_selected_fixers(fixer_names):
-        if fixer.version_info.is_applicable_to(source_version, target_version):
-            maybe_fixed_module = fixer(ctx, module_tree)
-            if maybe_fixed_module is None:
-                raise Exception(f"Error running fixer {type(fixer).__name__}")
-            required_imports.update(fixer.required_imports)
-            module_declarations.update(fixer.module_declarations)
-            module_tree = maybe_fixed_module
+    for fixer in fixers:
+        required_imports.update(fixer.required_imports)
+        module_declarations.update(fixer.module_declarations)
+
+    is_modified = any(fixer.is_modified for fixer in fixers)
 
     if any(required_imports):
-        add_required_imports(module_tree, required_imports)
+        is_modified = add_required_imports(module_tree, required_imports) or is_modified
     if any(module_declarations):
         add_module_declarations(module_tree, module_declarations)
+        is_modified = True
+
+    return FixedModule(module_tree, original_stmts, modified_stmts, is_modified)
+
+
+def _memoized_to_source(to_source: codegen.CodegenBackend) -> codegen.CodegenBackend:
+    # NOTE (mb 2021-10-17): Nodes are kept alive by the fixed module,
+    #   so their ids are not reused while the memo is in use.
+    memo: typ.Dict[int, str] = {}
+
+    def _to_source(node: ast.AST) -> str:
+        source = memo.get(id(node))
+        if source is None:
+            source = memo[id(node)] = to_source(node)
+        return source
+
+    return _to_source
+
+
+def fixed_module_source(
+    module_source : str,
+    fixed         : FixedModule,
+    target_version: str,
+    to_source     : codegen.CodegenBackend,
+) -> str:
+    if not fixed.is_modified and is_passthrough_safe(module_source, target_version):
+        return passthrough_module(module_source, target_version)
+
     header = parse_module_header(module_source, target_version)
-    return header.text + "".join(astor.to_source(module_tree))
+
+    # NOTE (mb 2021-10-17): end_lineno is only available since python 3.8
+    is_spliceable = fixed.modified_stmts is not None and all(
+        getattr(stmt, 'end_lineno', None) for stmt in fixed.original_stmts
+    )
+    if is_spliceable:
+        assert fixed.modified_stmts is not None
+        fixed_source = splice_module(
+            module_source,
+            fixed.tree,
+            fixed.original_stmts,
+            fixed.modified_stmts,
+            target_version,
+            to_source,
+        )
+        return header.text + fixed_source
+    else:
+        return header.text + to_source(fixed.tree)
+
+
+FixerGroupKey = typ.Tuple[typ.Tuple[FixerType, ...], str]
+
+
+def transpile_module_targets(
+    ctx: common.BuildContext, module_source: str, target_versions: typ.Sequence[str]
+) -> typ.List[str]:
+    """Transpile the source of a module for multiple target versions.
+
+    The module is parsed and checked once. Targets for which the same
+    fixers apply share the fixed tree, it is only copied for targets
+    with different fixers. Otherwise this is the same as calling
+    transpile_module with ctx.cfg.target_version set to each of the
+    target_versions.
+    """
+    if _module_mode(ctx, module_source) == 'disabled':
+        return [module_source] * len(target_versions)
+
+    ctxs = [
+        ctx._replace(cfg=ctx.cfg._replace(target_version=target_version))
+        for target_version in target_versions
+    ]
+    plans        = [get_transpile_plan(target_ctx.cfg) for target_ctx in ctxs]
+    to_source    = codegen.get_backend(ctx.cfg.codegen)
+    module_tree  = ast.parse(module_source)
+    module_facts = check_module_targets(ctxs, plans, module_tree)
+
+    groups: typ.Dict[FixerGroupKey, typ.List[int]] = {}
+    target_fixers: typ.List[typ.List[fb.FixerBase]] = []
+    for i, (target_ctx, plan) in enumerate(zip(ctxs, plans)):
+        fixers = [fixer_type.from_config(target_ctx.cfg) for fixer_type in plan.fixer_types]
+        fixers = select_triggered_fixers(target_ctx, fixers, module_facts)
+        target_fixers.append(fixers)
+
+        fixer_types = tuple(type(fixer) for fixer in fixers)
+        if all(fixer_type.target_independent for fixer_type in fixer_types):
+            key = (fixer_types, "")
+        else:
+            key = (fixer_types, target_ctx.cfg.target_version)
+        groups.setdefault(key, []).append(i)
+
+    # Fixers modify the tree, so each group needs its own copy, except
+    # for the last group which is given the parsed tree itself.
+    original_stmts = list(module_tree.body)
+    fixing_groups  = [indexes for (fixer_types, _), indexes in groups.items() if fixer_types]
+
+    results: typ.List[str] = [""] * len(ctxs)
+    for indexes in groups.values():
+        first  = indexes[0]
+        fixers = target_fixers[first]
+        if not fixers:
+            fixed = FixedModule(module_tree, original_stmts, [], is_modified=False)
+        elif indexes is fixing_groups[-1]:
+            fixed = fix_module(ctxs[first], fixers, module_tree, original_stmts)
+        else:
+            memo: typ.Dict[int, typ.Any] = {}
+            tree_copy  = copy.deepcopy(module_tree, memo)
+            stmts_copy = [memo[id(stmt)] for stmt in original_stmts]
+            fixed      = fix_module(ctxs[first], fixers, tree_copy, stmts_copy)
+
+        group_to_source = _memoized_to_source(to_source) if len(indexes) > 1 else to_source
+        for i in indexes:
+            target_version = ctxs[i].cfg.target_version
+            results[i] = fixed_module_source(module_source, fixed, target_version, group_to_source)
+
+    return results
+
+
+def transpile_module(ctx: common.BuildContext, module_source: str) -> str:
+    """Transpile the source of a module for ctx.cfg.target_version.
+
+    If none of the fixers modify the module, the source is returned
+    verbatim (with the same identity), so formatting and comments are
+    preserved. Otherwise, only the modified top level statements are
+    regenerated (see splice_module).
+    """
+    return transpile_module_targets(ctx, module_source, [ctx.cfg.target_version])[0]
 
 
 def transpile_module_data(ctx: common.BuildContext, module_source_data: bytes) -> bytes:
-    target_version      = ctx.cfg.target_version
-    header              = parse_module_header(module_source_data, target_version)
-    module_source       = module_source_data.decode(header.coding)
-    fixed_module_source = transpile_module(ctx, module_source)
-    return fixed_module_source.encode(header.coding)
+    return transpile_module_data_targets(ctx, module_source_data, [ctx.cfg.target_version])[0]
+
+
+def transpile_module_data_targets(
+    ctx: common.BuildContext, module_source_data: bytes, target_versions: typ.Sequence[str]
+) -> typ.List[bytes]:
+    # NOTE (mb 2021-10-17): The coding of the source doesn't depend on
+    #   the target version, only the declaration that may be added.
+    header        = parse_module_header(module_source_data, target_versions[0])
+    module_source = module_source_data.decode(header.coding)
+    return [
+        module_source_data
+        if fixed_module_source is module_source
+        else fixed_module_source.encode(header.coding)
+        for fixed_module_source in transpile_module_targets(ctx, module_source, target_versions)
+    ]
@@ -7,8 +7,6 @@
 import ast
 import typing as typ
 
-import astor
-
 from . import common
 from . import transpile
 
@@ -105,6 +103,9 @@ def parsedump_ast(code: str, mode: str = "exec", **kwargs) -> str:
 
 
 def parsedump_source(code: str, mode: str = "exec") -> str:
+    # pylint: disable=import-outside-toplevel; lazy import, astor is slow to import
+    import astor
+
     node = ast.parse(clean_whitespace(code), mode=mode)
     return astor.to_source(node)
 
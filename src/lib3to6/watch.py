@@ -0,0 +1,210 @@
+# This file is part of the lib3to6 project
+# https://github.com/mbarkhau/lib3to6
+#
+# Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+
+import os
+import time
+import typing as typ
+import hashlib
+import logging
+import pathlib as pl
+
+from . import sync
+from . import cache
+from . import common
+from . import transpile
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two scans of the source directory.
+DEFAULT_POLL_INTERVAL = 0.5
+
+
+class WatchStats(typ.NamedTuple):
+
+    transpiled: int
+    unchanged : int  # transpiled, but the output was already up to date
+    removed   : int
+    errors    : int
+
+
+def _is_ignored_dir(name: str) -> bool:
+    return name.startswith(".") or name == "__pycache__"
+
+
+class Watcher:
+    """Keep an output directory up to date with the modules of src.
+
+    Each call to poll scans src (a directory or a single file) and only
+    transpiles modules which are new or were modified since the last
+    poll. The plan of the configuration and the results of previous
+    polls are kept in memory.
+    """
+
+    cfg       : common.BuildConfig
+    src       : pl.Path
+    output_dir: pl.Path
+
+    def __init__(
+        self,
+        cfg         : common.BuildConfig,
+        src         : pl.Path,
+        output_dir  : pl.Path,
+        module_cache: typ.Optional[cache.Cache] = None,
+    ) -> None:
+        self.cfg          = cfg
+        self.src          = src
+        self.output_dir   = output_dir
+        self.module_cache = module_cache or cache.Cache.from_config(cfg)
+
+        self._key_hash   = hashlib.sha1(cache.cache_key_data(cfg))
+        self._signatures: typ.Dict[pl.Path, sync.FileSignature] = {}
+        self._outputs   : typ.Dict[pl.Path, pl.Path           ] = {}
+        # by source path, the cache key and result of its last transpile,
+        # the result is None if there was an error
+        self._results: typ.Dict[pl.Path, typ.Tuple[str, typ.Optional[bytes]]] = {}
+
+        # the plan is memoized, so it is only initialized once
+        transpile.get_transpile_plan(cfg)
+
+    def _iter_modules(self) -> typ.Iterable[typ.Tuple[pl.Path, pl.Path]]:
+        """Source path and output path of each module."""
+        if self.src.is_file():
+            yield (self.src, self.output_dir / self.src.name)
+            return
+
+        output_dir = self.output_dir.absolute()
+        for root, dirs, files in os.walk(self.src):
+            root_path = pl.Path(root)
+            dirs[:]   = [
+                name
+                for name in dirs
+                if not (_is_ignored_dir(name) or (root_path / name).absolute() == output_dir)
+            ]
+            for name in files:
+                if name.endswith(".py"):
+                    filepath = root_path / name
+                    yield (filepath, self.output_dir / filepath.relative_to(self.src))
+
+    def _transpile(self, filepath: pl.Path) -> typ.Optional[bytes]:
+        """Transpiled module or None if there was an error.
+
+        Errors are logged once for each version of a module.
+        """
+        module_source_data = filepath.read_bytes()
+
+        filehash = self._key_hash.copy()
+        filehash.update(module_source_data)
+        key = filehash.hexdigest()
+
+        prev_result = self._results.get(filepath)
+        if prev_result and prev_result[0] == key:
+            return prev_result[1]
+
+        fixed_module_source_data: typ.Optional[bytes]
+
+        cache_path = self.module_cache.get(key) if self.cfg.cache_enabled else None
+        if cache_path:
+            fixed_module_source_data = cache_path.read_bytes()
+        else:
+            ctx = common.BuildContext(self.cfg, str(filepath))
+            try:
+                fixed_module_source_data = transpile.transpile_module_data(ctx, module_source_data)
+                self.module_cache.put(key, fixed_module_source_data)
+            except common.CheckError as err:
+                err.add_location(str(filepath))
+                logger.error(str(err))
+                fixed_module_source_data = None
+            except (common.FixerError, SyntaxError) as err:
+                logger.error(f"{filepath} - {err}")
+                fixed_module_source_data = None
+
+        self._results[filepath] = (key, fixed_module_source_data)
+        return fixed_module_source_data
+
+    def _update_output(self, filepath: pl.Path, output_path: pl.Path) -> typ.Optional[bool]:
+        """Whether output_path was written, or None if filepath has errors."""
+        fixed_module_source_data = self._transpile(filepath)
+        if fixed_module_source_data is None:
+            return None
+
+        try:
+            is_unchanged = output_path.read_bytes() == fixed_module_source_data
+        except FileNotFoundError:
+            is_unchanged = False
+
+        if is_unchanged:
+            return False
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        cache.atomic_write(output_path, fixed_module_source_data)
+        logger.info(f"transpiled {filepath} -> {output_path}")
+        return True
+
+    def poll(self) -> WatchStats:
+        transpiled = 0
+        unchanged  = 0
+        errors     = 0
+
+        signatures: typ.Dict[pl.Path, sync.FileSignature] = {}
+        outputs   : typ.Dict[pl.Path, pl.Path           ] = {}
+        for filepath, output_path in self._iter_modules():
+            try:
+                signature = sync.file_signature(os.stat(filepath))
+            except FileNotFoundError:
+                continue  # removed during the scan
+
+            outputs[filepath] = output_path
+            if self._signatures.get(filepath) == signature:
+                signatures[filepath] = signature
+                continue
+
+            _, mtime_ns, _ = signature
+            if time.time() - mtime_ns / 1e9 < cache.MANIFEST_MIN_AGE:
+                # racy, see cache.MANIFEST_MIN_AGE, the file is read
+                # again on the next poll
+                signatures[filepath] = []
+            else:
+                signatures[filepath] = signature
+
+            # NOTE (mb 2021-10-17): An error for one module (undecodable
+            #   source, a file which can't be read or written, ...) is
+            #   reported, but must not stop the watcher.
+            try:
+                is_updated = self._update_output(filepath, output_path)
+            except Exception as err:
+                logger.error(f"{filepath} - {type(err).__name__}: {err}", exc_info=True)
+                is_updated = None
+
+            if is_updated is None:
+                errors += 1
+            elif is_updated:
+                transpiled += 1
+            else:
+                unchanged += 1
+
+        removed = 0
+        for filepath in set(self._signatures) - set(signatures):
+            output_path = self._outputs[filepath]
+            self._results.pop(filepath, None)
+            if output_path.exists():
+                output_path.unlink()
+                logger.info(f"removed {output_path}")
+                removed += 1
+
+        self._signatures = signatures
+        self._outputs    = outputs
+        return WatchStats(transpiled, unchanged, removed, errors)
+
+    def run(self, interval: float = DEFAULT_POLL_INTERVAL) -> None:
+        """Poll until interrupted."""
+        stats = self.poll()
+        logger.info(f"watching {self.src} ({len(self._signatures)} modules), {stats}")
+        try:
+            while True:
+                time.sleep(interval)
+                self.poll()
+        finally:
+            self.module_cache.record_build()
@@ -0,0 +1,444 @@
+# This file is part of the lib3to6 project
+# https://github.com/mbarkhau/lib3to6
+#
+# Copyright (c) 2019-2021 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+
+import io
+import os
+import re
+import csv
+import time
+import base64
+import struct
+import typing as typ
+import hashlib
+import pathlib as pl
+import zipfile
+
+from . import cache
+
+# Size of blocks when streaming files into a wheel.
+BLOCK_SIZE = 64 * 1024
+
+# Earliest timestamp that can be stored in a zip file.
+MIN_ZIP_TIMESTAMP = 315532800  # 1980-01-01
+
+ZipDateTime = typ.Tuple[int, int, int, int, int, int]
+
+RecordEntry = typ.Tuple[str, str, int]
+
+# Format of the local file header of a zip member, see APPNOTE.TXT 4.3.7
+LOCAL_HEADER_FORMAT = "<4sHHHHHLLLHH"
+LOCAL_HEADER_SIZE   = struct.calcsize(LOCAL_HEADER_FORMAT)
+LOCAL_HEADER_MAGIC  = b"PK\003\004"
+
+# General purpose flag bits of zip members
+FLAG_ENCRYPTED       = 0x01
+FLAG_DATA_DESCRIPTOR = 0x08
+
+WHEEL_FILENAME_RE = re.compile(
+    r"""
+    ^
+    (?P<name>[^-]+)
+    -(?P<version>[^-]+)
+    (?:-(?P<build>\d[^-]*))?
+    -(?P<pytag>[^-]+)
+    -(?P<abitag>[^-]+)
+    -(?P<plattag>[^-]+)
+    \.whl
+    $
+    """,
+    flags=re.VERBOSE,
+)
+
+
+def record_hash(digest: bytes) -> str:
+    """Hash in the format of RECORD files (PEP 376/427).
+
+    >>> record_hash(hashlib.sha256(b"").digest())
+    'sha256=47DEQpj8HBSa-_TImW-5JCeuQeRkm5NMpJWZG3hSuFU'
+    """
+    b64_digest = base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+    return "sha256=" + b64_digest
+
+
+def python_tag(target_version: str) -> str:
+    """Python tag of wheels for a target version.
+
+    Code that works with python 2.7 also works with python 3.
+
+    >>> python_tag("2.7")
+    'py2.py3'
+    >>> python_tag("3.6")
+    'py3'
+    """
+    if target_version.startswith("2"):
+        return "py2.py3"
+    else:
+        return "py3"
+
+
+def escape_name(name: str) -> str:
+    """Escape a name or version for use in a wheel filename (PEP 427).
+
+    >>> escape_name("my-package.name")
+    'my_package.name'
+    """
+    return re.sub(r"[^\w\d.]+", "_", name, flags=re.UNICODE)
+
+
+def wheel_filename(name: str, version: str, tag: str, build: str = "") -> str:
+    """Filename of a pure python wheel.
+
+    >>> wheel_filename("my-package", "1.0", "py3")
+    'my_package-1.0-py3-none-any.whl'
+    >>> wheel_filename("my-package", "1.0", "py2.py3", build="1")
+    'my_package-1.0-1-py2.py3-none-any.whl'
+    """
+    build_part = f"-{build}" if build else ""
+    return f"{escape_name(name)}-{escape_name(version)}{build_part}-{tag}-none-any.whl"
+
+
+def retag_wheel_filename(filename: str, tag: str) -> str:
+    """Filename of a wheel with its python tag replaced.
+
+    >>> retag_wheel_filename("my_package-1.0-py3-none-any.whl", "py2.py3")
+    'my_package-1.0-py2.py3-none-any.whl'
+    >>> retag_wheel_filename("my_package-1.0-2-cp36-none-any.whl", "py3")
+    'my_package-1.0-2-py3-none-any.whl'
+    """
+    match = WHEEL_FILENAME_RE.match(filename)
+    if match is None:
+        raise ValueError(f"Invalid wheel filename: {filename}")
+    if match.group('abitag') != "none" or match.group('plattag') != "any":
+        raise ValueError(f"Not a pure python wheel: {filename}")
+
+    return wheel_filename(match.group('name'), match.group('version'), tag, match.group('build'))
+
+
+def zip_date_time() -> ZipDateTime:
+    """Timestamp for members of a wheel, from $SOURCE_DATE_EPOCH if set."""
+    source_date_epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if source_date_epoch:
+        timestamp = max(int(source_date_epoch), MIN_ZIP_TIMESTAMP)
+    else:
+        timestamp = int(time.time())
+    return typ.cast(ZipDateTime, time.gmtime(timestamp)[:6])
+
+
+class WheelWriter:
+    """Write a wheel, computing the hashes for RECORD while writing.
+
+    Members are written in the order of the calls to write. On close,
+    RECORD is added and the wheel is renamed to its path, so a partial
+    wheel is never visible.
+    """
+
+    path     : pl.Path
+    dist_info: str
+    records  : typ.List[RecordEntry]
+
+    def __init__(
+        self, path: pl.Path, dist_info: str, date_time: typ.Optional[ZipDateTime] = None
+    ) -> None:
+        self.path      = path
+        self.dist_info = dist_info
+        self.records   = []
+
+        self._date_time = date_time or zip_date_time()
+        self._tmp_path  = cache.tmp_path_for(path)
+        self._zipfile   = zipfile.ZipFile(self._tmp_path, mode="w")
+
+    def __enter__(self) -> 'WheelWriter':
+        return self
+
+    def __exit__(self, exc_type: typ.Any, exc_value: typ.Any, traceback: typ.Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _zip_info(self, arcname: str, mode: int = 0o644) -> zipfile.ZipInfo:
+        zinfo = zipfile.ZipInfo(arcname, date_time=self._date_time)
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.external_attr = (0o100000 | (mode & 0o7777)) << 16
+        return zinfo
+
+    def write(self, arcname: str, data: bytes, mode: int = 0o644) -> None:
+        self._zipfile.writestr(self._zip_info(arcname, mode), data)
+        self.records.append((arcname, record_hash(hashlib.sha256(data).digest()), len(data)))
+
+    def write_path(self, arcname: str, path: pl.Path) -> None:
+        """Stream the content of path into the wheel."""
+        mode = os.stat(path).st_mode
+        with path.open(mode="rb") as in_fobj:
+            self._write_fobj(self._zip_info(arcname, mode), in_fobj)
+
+    def _write_fobj(self, zinfo: zipfile.ZipInfo, in_fobj: typ.IO[bytes]) -> None:
+        digest = hashlib.sha256()
+        size   = 0
+        with self._zipfile.open(zinfo, mode="w") as out_fobj:
+            while True:
+                block = in_fobj.read(BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                out_fobj.write(block)
+                size += len(block)
+        self.records.append((zinfo.filename, record_hash(digest.digest()), size))
+
+    def copy_member(
+        self,
+        in_zip : zipfile.ZipFile,
+        in_info: zipfile.ZipInfo,
+        record : typ.Optional[RecordEntry] = None,
+    ) -> bool:
+        """Copy a member of another zip file into the wheel.
+
+        If the RECORD entry of the member is known, the compressed data
+        is copied as is. Otherwise the member is recompressed, so that
+        its hash can be computed. Returns True if the data was copied
+        without recompression.
+        """
+        is_raw_copy = (
+            record is not None
+            and record[2] == in_info.file_size
+            and not in_info.flag_bits & FLAG_ENCRYPTED
+            and isinstance(in_zip.filename, str)
+        )
+        if is_raw_copy:
+            assert record is not None
+            self._copy_raw(in_zip, in_info)
+            self.records.append((in_info.filename, record[1], record[2]))
+        else:
+            mode  = (in_info.external_attr >> 16) or 0o644
+            zinfo = self._zip_info(in_info.filename, mode)
+            zinfo.date_time = in_info.date_time
+            with in_zip.open(in_info) as in_fobj:
+                self._write_fobj(zinfo, in_fobj)
+        return is_raw_copy
+
+    def _copy_raw(self, in_zip: zipfile.ZipFile, in_info: zipfile.ZipInfo) -> None:
+        zinfo = zipfile.ZipInfo(in_info.filename, date_time=in_info.date_time)
+        zinfo.compress_type = in_info.compress_type
+        zinfo.external_attr = in_info.external_attr
+        zinfo.create_system = in_info.create_system
+        zinfo.CRC           = in_info.CRC
+        zinfo.compress_size = in_info.compress_size
+        zinfo.file_size     = in_info.file_size
+        # the sizes are written to the local header, so the data
+        # descriptor that may follow the data is not needed
+        zinfo.flag_bits = in_info.flag_bits & ~FLAG_DATA_DESCRIPTOR
+
+        # NOTE (mb 2021-10-17): The zipfile module has no API to copy
+        #   compressed data, so the member is appended the same way as
+        #   ZipFile.write does it internally.
+        out_zip = self._zipfile
+        out_fp  = out_zip.fp
+        assert out_fp is not None
+        out_fp.seek(out_zip.start_dir)
+        zinfo.header_offset = out_zip.start_dir
+        out_fp.write(zinfo.FileHeader())
+        with open(typ.cast(str, in_zip.filename), mode="rb") as in_fobj:
+            in_fobj.seek(_data_offset(in_fobj, in_info))
+            remaining = in_info.compress_size
+            while remaining > 0:
+                block = in_fobj.read(min(remaining, BLOCK_SIZE))
+                if not block:
+                    raise zipfile.BadZipFile(f"Truncated member {in_info.filename}")
+                out_fp.write(block)
+                remaining -= len(block)
+
+        out_zip.start_dir = out_fp.tell()
+        out_zip.filelist.append(zinfo)
+        out_zip.NameToInfo[zinfo.filename] = zinfo
+        out_zip._didModify = True  # pylint:disable=protected-access
+
+    def record_text(self) -> str:
+        buf = io.StringIO()
+        for arcname, hash_str, size in self.records:
+            buf.write(f"{arcname},{hash_str},{size}\n")
+        buf.write(f"{self.dist_info}/RECORD,,\n")
+        return buf.getvalue()
+
+    def close(self) -> None:
+        record_data = self.record_text().encode("utf-8")
+        self._zipfile.writestr(self._zip_info(f"{self.dist_info}/RECORD"), record_data)
+        self._zipfile.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._zipfile.close()
+        if self._tmp_path.exists():
+            self._tmp_path.unlink()
+
+
+def _data_offset(fobj: typ.IO[bytes], zinfo: zipfile.ZipInfo) -> int:
+    fobj.seek(zinfo.header_offset)
+    header = fobj.read(LOCAL_HEADER_SIZE)
+    if len(header) != LOCAL_HEADER_SIZE:
+        raise zipfile.BadZipFile(f"Truncated header of {zinfo.filename}")
+
+    magic, *_, filename_len, extra_len = struct.unpack(LOCAL_HEADER_FORMAT, header)
+    if magic != LOCAL_HEADER_MAGIC:
+        raise zipfile.BadZipFile(f"Bad magic number for header of {zinfo.filename}")
+
+    return zinfo.header_offset + LOCAL_HEADER_SIZE + filename_len + extra_len
+
+
+def parse_record(record_text: str) -> typ.Dict[str, RecordEntry]:
+    """Parse the content of a RECORD file.
+
+    Entries without a hash (such as RECORD itself) are skipped.
+
+    >>> parse_record("a/b.py,sha256=abc,12\\na.dist-info/RECORD,,\\n")
+    {'a/b.py': ('a/b.py', 'sha256=abc', 12)}
+    """
+    records: typ.Dict[str, RecordEntry] = {}
+    for row in csv.reader(io.StringIO(record_text)):
+        if len(row) == 3 and row[1] and row[2].isdigit():
+            arcname, hash_str, size = row
+            records[arcname] = (arcname, hash_str, int(size))
+    return records
+
+
+def find_dist_info(arcnames: typ.Iterable[str]) -> str:
+    """Name of the .dist-info directory of a wheel.
+
+    >>> find_dist_info(["a/b.py", "a-1.0.dist-info/WHEEL"])
+    'a-1.0.dist-info'
+    """
+    dist_infos = {
+        arcname.split("/", 1)[0]
+        for arcname in arcnames
+        if arcname.split("/", 1)[0].endswith(".dist-info")
+    }
+    if len(dist_infos) != 1:
+        raise ValueError(f"Expected exactly one .dist-info directory, found {len(dist_infos)}")
+    return dist_infos.pop()
+
+
+def wheel_text(tag: str, generator: str) -> str:
+    """Content of the WHEEL file of a pure python wheel.
+
+    >>> print(wheel_text("py2.py3", "lib3to6"), end="")
+    Wheel-Version: 1.0
+    Generator: lib3to6
+    Root-Is-Purelib: true
+    Tag: py2-none-any
+    Tag: py3-none-any
+    """
+    lines = ["Wheel-Version: 1.0", f"Generator: {generator}", "Root-Is-Purelib: true"]
+    for pytag in tag.split("."):
+        lines.append(f"Tag: {pytag}-none-any")
+    return "\n".join(lines) + "\n"
+
+
+def retag_wheel_text(text: str, tag: str) -> str:
+    """Replace the Tag headers of a WHEEL file.
+
+    >>> text = "Wheel-Version: 1.0\\nRoot-Is-Purelib: true\\nTag: py3-none-any\\n"
+    >>> print(retag_wheel_text(text, "py2.py3"), end="")
+    Wheel-Version: 1.0
+    Root-Is-Purelib: true
+    Tag: py2-none-any
+    Tag: py3-none-any
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    if "Root-Is-Purelib: true" not in lines:
+        raise ValueError("Not a pure python wheel")
+
+    lines = [line for line in lines if not line.startswith("Tag:")]
+    for pytag in tag.split("."):
+        lines.append(f"Tag: {pytag}-none-any")
+    return "\n".join(lines) + "\n"
+
+
+def replace_header(text: str, name: str, value: str) -> str:
+    """Replace (or add) a header of a METADATA/PKG-INFO file.
+
+    >>> text = "Name: a\\nRequires-Python: >=3.6\\n\\nbody\\n"
+    >>> print(replace_header(text, "Requires-Python", ">=2.7"), end="")
+    Name: a
+    Requires-Python: >=2.7
+    <BLANKLINE>
+    body
+    """
+    headers, sep, body = text.partition("\n\n")
+    prefix = name.lower() + ":"
+    lines  = [line for line in headers.splitlines() if not line.lower().startswith(prefix)]
+    lines.append(f"{name}: {value}")
+    return "\n".join(lines) + "\n" + sep[1:] + body
+
+
+def requires_dist(requirement: str, extra: str = "", marker: str = "") -> str:
+    """Requires-Dist value for a requirement of install/extras_require.
+
+    >>> requires_dist("typing ; python_version < '3.5'")
+    "typing ; python_version < '3.5'"
+    >>> requires_dist("pytest>=6", extra="test")
+    'pytest>=6 ; extra == "test"'
+    >>> requires_dist('mock; python_version<"3"', extra="test")
+    'mock ; (python_version<"3") and extra == "test"'
+    """
+    req, _, req_marker = requirement.partition(";")
+    markers = [m.strip() for m in (req_marker, marker) if m.strip()]
+    if extra:
+        if markers:
+            markers = ["(" + " and ".join(markers) + ")"]
+        markers.append(f'extra == "{extra}"')
+
+    if markers:
+        return req.strip() + " ; " + " and ".join(markers)
+    else:
+        return req.strip()
+
+
+def iter_requires_dist(
+    install_requires: typ.Iterable[str],
+    extras_require  : typ.Dict[str, typ.Iterable[str]],
+) -> typ.Iterable[typ.Tuple[str, str]]:
+    """Metadata headers for the requirements of a distribution."""
+    for requirement in install_requires:
+        yield ("Requires-Dist", requires_dist(requirement))
+
+    for key, requirements in sorted(extras_require.items()):
+        extra, _, marker = key.partition(":")
+        if extra:
+            yield ("Provides-Extra", extra)
+        for requirement in requirements:
+            yield ("Requires-Dist", requires_dist(requirement, extra, marker))
+
+
+def entry_points_text(entry_points: typ.Dict[str, typ.Union[str, typ.Iterable[str]]]) -> str:
+    """Content of entry_points.txt.
+
+    >>> print(entry_points_text({'console_scripts': ["foo = foo.cli:main"]}), end="")
+    [console_scripts]
+    foo = foo.cli:main
+    <BLANKLINE>
+    """
+    buf = io.StringIO()
+    for group, entries in sorted(entry_points.items()):
+        if isinstance(entries, str):
+            entries = entries.splitlines()
+
+        buf.write(f"[{group}]\n")
+        for entry in entries:
+            if entry.strip():
+                buf.write(entry.strip() + "\n")
+        buf.write("\n")
+    return buf.getvalue()
+
+
+def metadata_text(pkg_info: str, extra_headers: typ.Iterable[typ.Tuple[str, str]]) -> str:
+    """Add headers to PKG-INFO, before the description in its body."""
+    headers, sep, body = pkg_info.partition("\n\n")
+    headers = headers.rstrip("\n") + "\n"
+    for name, value in extra_headers:
+        headers += f"{name}: {value}\n"
+    if sep:
+        return headers + "\n" + body
+    else:
+        return headers
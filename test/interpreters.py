@@ -0,0 +1,54 @@
+import os
+import json
+import functools
+import subprocess as sp
+
+import pytest
+
+# Compiles each of a json list of sources, the result is a json list
+# with the error message (or null) for each source.
+COMPILE_SCRIPT = """
+import sys, json
+errors = []
+for source in json.load(sys.stdin):
+    try:
+        compile(source.encode("utf-8"), "<source>", "exec", 0, True)
+        errors.append(None)
+    except SyntaxError as err:
+        errors.append(str(err))
+json.dump(errors, sys.stdout)
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def _python_env(version):
+    """Environment with which python<version> can be run, None if it's not installed."""
+    env = dict(os.environ)
+    cmd = [f"python{version}", "-c", "pass"]
+    try:
+        if sp.call(cmd, env=env, stdout=sp.DEVNULL, stderr=sp.DEVNULL) == 0:
+            return env
+        # with pyenv, the version has to be selected explicitly
+        versions = sp.check_output(["pyenv", "versions", "--bare"], env=env).decode("utf-8")
+    except (OSError, sp.CalledProcessError):
+        return None
+
+    for pyenv_version in versions.split():
+        if pyenv_version.startswith(version + "."):
+            env['PYENV_VERSION'] = pyenv_version
+            return env
+    return None
+
+
+def compile_errors(sources, version="2.7"):
+    """Compile each of sources with python<version> (skipping the test if it isn't installed)."""
+    env = _python_env(version)
+    if env is None:
+        pytest.skip(f"python{version} not installed")
+
+    output = sp.check_output(
+        [f"python{version}", "-c", COMPILE_SCRIPT],
+        input=json.dumps(sources).encode("utf-8"),
+        env=env,
+    )
+    return json.loads(output.decode("utf-8"))
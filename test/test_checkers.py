@@ -1,9 +1,12 @@
+import ast
 from collections import namedtuple
 
 import pytest
 
 from lib3to6 import utils
 from lib3to6 import common
+from lib3to6 import checkers
+from lib3to6 import checker_base as cb
 
 CheckFixture = namedtuple("CheckFixture", ["names", "test_source", 'expected_error_msg'])
 
@@ -298,6 +301,53 @@ def test_checkers(fixture):
             assert expected_error_msg in str(result_error)
 
 
+def test_checker_dispatcher_facts():
+    source = utils.clean_whitespace(
+        """
+        import os
+        from typing import NamedTuple
+
+        class Foo(NamedTuple):
+            bar: int
+
+        def baz(qux):
+            with open("x.txt") as fobj:
+                return fobj.read()
+        """
+    )
+    ctx   = common.init_build_context(checkers="", install_requires=set())
+    facts = cb.CheckerDispatcher([])(ctx, ast.parse(source))
+
+    scope_names = {name for name, _ in facts.scope_names}
+    assert scope_names >= {"os", "NamedTuple", "Foo", "bar", "baz", "qux", "fobj"}
+    assert [type(node) for node in facts.imports] == [ast.Import, ast.ImportFrom]
+    assert [node.name for node in facts.class_defs] == ["Foo"]
+    assert len(facts.open_calls) == 1
+
+
+def test_checker_dispatcher_error_order():
+    source = utils.clean_whitespace(
+        """
+        from os import *
+
+        def map(x):
+            yield from x
+        """
+    )
+    ctx          = common.init_build_context(target_version="2.7", install_requires=set())
+    checker_list = [
+        checkers.NoOverriddenBuiltinsChecker(),
+        checkers.NoStarImports(),
+        checkers.NoYieldFromChecker(),
+    ]
+    try:
+        cb.CheckerDispatcher(checker_list)(ctx, ast.parse(source))
+        assert False, "expected CheckError"
+    except common.CheckError as err:
+        # same error as if the checkers were called one after another
+        assert "Prohibited override of builtin 'map'" in str(err)
+
+
 def _test_unusable_imports(source, ver="2.7", req=None):
     ctx = common.init_build_context(
         checkers="no_unusable_imports",
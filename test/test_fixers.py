@@ -1,10 +1,15 @@
+import ast
 import collections
 
 import pytest
 
 from lib3to6 import utils
 from lib3to6 import common
+from lib3to6 import codegen
 from lib3to6 import transpile
+from lib3to6 import fixer_base as fb
+
+from . import interpreters
 
 FixerFixture = collections.namedtuple(
     "FixerFixture", ["names", "target_version", "test_source", 'expected_source']
@@ -256,7 +261,7 @@ FIXTURES = [
         """,
     ),
     make_fixture(
-        "itertools_builtins,print_function_future",
+        "builtin_rename,print_function_future",
         "2.7",
         """
         \"\"\"Module Docstring\"\"\"
@@ -281,7 +286,7 @@ FIXTURES = [
         """,
     ),
     make_fixture(
-        "itertools_builtins",
+        "builtin_rename",
         "2.7",
         """
         def fn(elem):
@@ -302,7 +307,7 @@ FIXTURES = [
         """,
     ),
     make_fixture(
-        "itertools_builtins",
+        "builtin_rename",
         "2.7",
         """
         def fn(elem):
@@ -711,7 +716,7 @@ FIXTURES = [
         """,
     ),
     make_fixture(
-        "xrange_to_range",
+        "builtin_rename",
         "2.7",
         """
         myrange = range
@@ -727,7 +732,7 @@ FIXTURES = [
         """,
     ),
     make_fixture(
-        "unicode_literals_future, unicode_to_str",
+        "unicode_literals_future, builtin_rename",
         "2.7",
         """
         assert isinstance("foobar", str)
@@ -743,7 +748,7 @@ FIXTURES = [
         """,
     ),
     make_fixture(
-        "xrange_to_range,unicode_to_str",
+        "builtin_rename",
         "2.7",
         """
         def foo():
@@ -849,7 +854,7 @@ FIXTURES = [
         """,
     ),
     make_fixture(
-        "config_parser_import_fallback",
+        "module_import_fallback",
         "2.7",
         """
         import configparser
@@ -866,7 +871,7 @@ FIXTURES = [
         """,
     ),
     make_fixture(
-        "config_parser_import_fallback",
+        "module_import_fallback",
         "2.7",
         """
         import configparser as cp
@@ -883,7 +888,7 @@ FIXTURES = [
         """,
     ),
     make_fixture(
-        "config_parser_import_fallback",
+        "module_import_fallback",
         "2.7",
         """
         from configparser import RawConfigParser
@@ -900,7 +905,7 @@ FIXTURES = [
         """,
     ),
     make_fixture(
-        "http_cookiejar_import_fallback",
+        "module_import_fallback",
         "2.7",
         """
         from http.cookiejar import CookieJar
@@ -1258,3 +1263,89 @@ def test_fixers(fixture):
 
     assert result_ast == expected_ast
     assert _normalized_source(result_source) == _normalized_source(expected_source)
+
+
+def _fix_tree(fixture, fused):
+    source_version = "3.9"
+    ctx            = common.init_build_context(
+        target_version=fixture.target_version, fixers=fixture.names, filepath="<testfile>"
+    )
+    fixer_names    = transpile._fuzzy_names_key(fixture.names)
+    plan           = transpile._init_transpile_plan(
+        source_version, fixture.target_version, fixer_names, ()
+    )
+    tree   = ast.parse(utils.clean_whitespace(fixture.test_source))
+    fixers = [fixer_type.from_config(ctx.cfg) for fixer_type in plan.fixer_types]
+    fixer_passes = fb.iter_fixer_passes(fixers) if fused else fixers
+    for fixer_pass in fixer_passes:
+        tree = fixer_pass(ctx, tree)
+
+    required_imports    = set()
+    module_declarations = set()
+    for fixer in fixers:
+        required_imports.update(fixer.required_imports)
+        module_declarations.update(fixer.module_declarations)
+    return ast.dump(tree), required_imports, module_declarations
+
+
+@pytest.mark.parametrize("fixture", FIXTURES)
+def test_fused_fixers(fixture):
+    assert _fix_tree(fixture, fused=True) == _fix_tree(fixture, fused=False)
+
+
+def test_fused_fixers_nested_nodes():
+    source = """
+    import queue
+    def outer(*, a=1):
+        def inner(*, b=2):
+            return f"{f'{b}'}"
+        from queue import Queue
+    """
+    ctx = common.init_build_context(filepath="<testfile>")
+    _, _, result_source = utils.transpile_and_dump(ctx, source)
+    assert "kwargs.get('b', 2)" in result_source
+    assert "JoinedStr" not in utils.parsedump_ast(result_source)
+    assert result_source.count("except ImportError") == 2
+
+
+@pytest.mark.parametrize("backend", sorted(codegen.BACKENDS))
+@pytest.mark.parametrize("fixture", FIXTURES)
+def test_codegen_backends(fixture, backend):
+    expected_source = utils.clean_whitespace(fixture.expected_source)
+    expected_ast    = utils.parsedump_ast(expected_source)
+
+    # full module
+    result_source = codegen.to_source(ast.parse(expected_source), backend)
+    assert utils.parsedump_ast(result_source) == expected_ast
+
+    # only modified statements
+    ctx = common.init_build_context(
+        target_version=fixture.target_version,
+        fixers=fixture.names,
+        filepath="<testfile>",
+        codegen=backend,
+    )
+    _, _, result_source = utils.transpile_and_dump(ctx, fixture.test_source)
+    assert utils.parsedump_ast(result_source) == expected_ast
+
+
+@pytest.mark.parametrize("backend", sorted(codegen.BACKENDS))
+def test_codegen_backends_py27(backend):
+    sources = []
+    for fixture in FIXTURES:
+        if not fixture.target_version.startswith("2."):
+            continue
+
+        ctx = common.init_build_context(target_version="2.7", codegen=backend)
+        try:
+            result_source = transpile.transpile_module(ctx, fixture.test_source)
+        except common.CheckError:
+            continue  # fixtures for a subset of the fixers may use prohibited syntax
+
+        sources.append(result_source)
+        # full module, with only the header of the transpiled source
+        module_header = transpile.parse_module_header(result_source, "2.7").text
+        sources.append(module_header + codegen.to_source(ast.parse(result_source), backend))
+
+    errors = interpreters.compile_errors(sources)
+    assert [(source, error) for source, error in zip(sources, errors) if error] == []
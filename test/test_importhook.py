@@ -0,0 +1,109 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+import lib3to6
+from lib3to6 import common
+from lib3to6 import transpile
+from lib3to6 import importhook
+
+MODULE_SOURCE = """
+def greet(name: str) -> str:
+    return f"hello {name}"
+
+if (n := 2) > 1:
+    GREETING = greet("world") * n
+"""
+
+
+@pytest.fixture
+def hooked_pkg(tmp_path, monkeypatch):
+    pkg_dir = tmp_path / "lib3to6_hooked_pkg"
+    pkg_dir.mkdir()
+    (pkg_dir / "__init__.py").write_text("")
+    (pkg_dir / "mod.py").write_text(MODULE_SOURCE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, 'dont_write_bytecode', False)
+
+    finder = lib3to6.install_import_hook(target_version="2.7", packages=["lib3to6_hooked_pkg"])
+    yield pkg_dir
+    sys.meta_path.remove(finder)
+    for name in list(sys.modules):
+        if name.startswith("lib3to6_hooked_pkg"):
+            del sys.modules[name]
+
+
+def _import_mod():
+    sys.modules.pop("lib3to6_hooked_pkg.mod", None)
+    importlib.invalidate_caches()
+    return importlib.import_module("lib3to6_hooked_pkg.mod")
+
+
+def test_import_hook(hooked_pkg, monkeypatch):
+    transpiled = []
+    orig_transpile_module_data = transpile.transpile_module_data
+
+    def _transpile_module_data(ctx, module_source_data):
+        if ctx.filepath.endswith("mod.py"):
+            transpiled.append(ctx.filepath)
+        return orig_transpile_module_data(ctx, module_source_data)
+
+    monkeypatch.setattr(transpile, 'transpile_module_data', _transpile_module_data)
+
+    mod = _import_mod()
+    assert mod.GREETING == "hello worldhello world"
+    assert isinstance(mod.__loader__, importhook.Lib3to6Loader)
+    assert transpiled == [str(hooked_pkg / "mod.py")]
+    # the annotations were removed by the transpiled code
+    assert mod.greet.__annotations__ == {}
+
+    pyc_paths = list((hooked_pkg / "__pycache__").glob("mod.*.opt-lib3to6*.pyc"))
+    assert len(pyc_paths) == 1
+
+    # the second import uses the cached code
+    mod = _import_mod()
+    assert mod.GREETING == "hello worldhello world"
+    assert len(transpiled) == 1
+
+    # a modified source is transpiled again
+    (hooked_pkg / "mod.py").write_text(MODULE_SOURCE.replace("world", "you"))
+    mod = _import_mod()
+    assert mod.GREETING == "hello youhello you"
+    assert len(transpiled) == 2
+
+
+def test_import_hook_stat(hooked_pkg, monkeypatch):
+    mod_path = hooked_pkg / "mod.py"
+    os.utime(mod_path, (1000, 1000))
+    mod = _import_mod()
+    assert mod.GREETING == "hello worldhello world"
+
+    read_paths = []
+    orig_get_data = importhook.Lib3to6Loader.get_data
+
+    def _get_data(self, path):
+        if path.endswith(".py"):
+            read_paths.append(path)
+        return orig_get_data(self, path)
+
+    monkeypatch.setattr(importhook.Lib3to6Loader, 'get_data', _get_data)
+
+    # unchanged size and mtime, the source is not read
+    mod = _import_mod()
+    assert mod.GREETING == "hello worldhello world"
+    assert read_paths == []
+
+    # a touched source is hashed, and the new stat is recorded
+    os.utime(mod_path, (2000, 2000))
+    _import_mod()
+    assert read_paths == [str(mod_path)]
+    _import_mod()
+    assert read_paths == [str(mod_path)]
+
+
+def test_import_hook_check_error(hooked_pkg):
+    (hooked_pkg / "bad.py").write_text("from os import *\n")
+    with pytest.raises(common.CheckError, match="bad.py@1"):
+        importlib.import_module("lib3to6_hooked_pkg.bad")
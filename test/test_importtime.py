@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import pathlib as pl
+import subprocess as sp
+
+import lib3to6
+
+# Modules which are slow to import and only needed for some commands.
+SLOW_MODULES = {"setuptools", "pkg_resources", "astor"}
+
+# Modules of lib3to6 which are only needed to transpile or build.
+LAZY_MODULES = {
+    "lib3to6.packaging",
+    "lib3to6.fixers",
+    "lib3to6.checkers",
+    "lib3to6.checkers_backports",
+}
+
+PRINT_MODULES = "import sys, json; print(json.dumps(sorted(sys.modules)))"
+
+RUN_CLI_HELP = """
+import sys, runpy
+sys.argv = ["lib3to6", "--help"]
+try:
+    runpy.run_module("lib3to6", run_name="__main__")
+except SystemExit:
+    pass
+"""
+
+
+def _run(code):
+    """Output of code run in a new interpreter, which imports lib3to6 from this tree."""
+    env      = dict(os.environ)
+    src_path = str(pl.Path(lib3to6.__file__).parent.parent)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [src_path, env.get('PYTHONPATH')]))
+    return sp.check_output([sys.executable, "-c", code], env=env).decode("utf-8")
+
+
+def _imported_modules(code):
+    output = _run(code + "\n" + PRINT_MODULES)
+    return set(json.loads(output.splitlines()[-1]))
+
+
+def test_import_lib3to6():
+    imported = _imported_modules("import lib3to6")
+    assert "lib3to6" in imported
+    assert not imported & (SLOW_MODULES | LAZY_MODULES | {"click"})
+
+
+def test_lazy_attributes():
+    code = (
+        "import sys, lib3to6;"
+        "assert 'setuptools' not in sys.modules;"
+        "assert lib3to6.Distribution.__module__ == 'lib3to6.packaging';"
+        "assert 'setuptools' in sys.modules;"
+        "assert callable(lib3to6.fix);"
+        "assert 'install_import_hook' in dir(lib3to6)"
+    )
+    _run(code)
+
+
+def test_cli_help():
+    imported = _imported_modules(RUN_CLI_HELP)
+    assert "click" in imported
+    assert not imported & (SLOW_MODULES | {"lib3to6.packaging"})
+
+
+def test_transpile_without_pkg_resources():
+    code = (
+        "from lib3to6 import common, transpile;"
+        "ctx = common.init_build_context(target_version='2.7');"
+        "transpile.transpile_module(ctx, 'import enum\\nimport typing\\n')"
+    )
+    imported = _imported_modules(code)
+    assert "lib3to6.checkers_backports" in imported
+    assert "pkg_resources" not in imported
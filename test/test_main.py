@@ -0,0 +1,85 @@
+import os
+import stat
+
+from click.testing import CliRunner
+
+from lib3to6 import wheels
+from lib3to6 import __main__
+
+
+def _write_tree(root):
+    (root / "pkg" / "sub").mkdir(parents=True)
+    (root / "pkg" / "a.py").write_text("a: int = 1\n")
+    (root / "pkg" / "sub" / "b.py").write_text("b: int = 2\n")
+    (root / "pkg" / "data.txt").write_text("not python\n")
+
+
+def test_expand_source_paths(tmp_path, monkeypatch):
+    _write_tree(tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    source_paths = __main__.expand_source_paths(["pkg", "pkg/*.py", "pkg/a.py"])
+    assert [str(sp.rel_path) for sp in source_paths] == ["a.py", "sub/b.py"]
+
+    source_paths = __main__.expand_source_paths(["pkg/**/b.py", "pkg/a.py"])
+    assert [str(sp.path) for sp in source_paths] == ["pkg/sub/b.py", "pkg/a.py"]
+    assert [str(sp.rel_path) for sp in source_paths] == ["sub/b.py", "a.py"]
+
+
+def test_transpile_output_dir(tmp_path, monkeypatch):
+    _write_tree(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LIB3TO6_CACHE_DIR", str(tmp_path / "cache"))
+
+    args   = ["--jobs", "2", "--output-dir", "out", "pkg"]
+    result = CliRunner().invoke(__main__.main, args)
+    assert result.exit_code == 0, result.output
+    assert "a = 1" in (tmp_path / "out" / "a.py").read_text()
+    assert "b = 2" in (tmp_path / "out" / "sub" / "b.py").read_text()
+    assert not (tmp_path / "out" / "data.txt").exists()
+
+
+def test_transpile_in_place(tmp_path, monkeypatch):
+    _write_tree(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LIB3TO6_CACHE_DIR", str(tmp_path / "cache"))
+
+    script_path = tmp_path / "pkg" / "a.py"
+    os.chmod(script_path, 0o755)
+    result = CliRunner().invoke(__main__.main, ["--in-place", "pkg"])
+    assert result.exit_code == 0, result.output
+    assert "a = 1" in script_path.read_text()
+    assert stat.S_IMODE(script_path.stat().st_mode) == 0o755
+    assert sorted(p.name for p in (tmp_path / "pkg").iterdir()) == ["a.py", "data.txt", "sub"]
+
+
+def test_transpile_output_order(tmp_path, monkeypatch):
+    monkeypatch.setenv("LIB3TO6_CACHE_DIR", str(tmp_path / "cache"))
+    for i in range(10):
+        (tmp_path / f"mod_{i}.py").write_text(f"x{i}: int = {i}\n")
+
+    result = CliRunner().invoke(__main__.main, ["-j", "3", str(tmp_path / "mod_*.py")])
+    assert result.exit_code == 0, result.output
+    positions = [result.output.index(f"x{i} = {i}") for i in range(10)]
+    assert positions == sorted(positions)
+
+
+def test_transpile_stdin(tmp_path, monkeypatch):
+    monkeypatch.setenv("LIB3TO6_CACHE_DIR", str(tmp_path / "cache"))
+    result = CliRunner().invoke(__main__.main, ["-"], input="x: int = 1\n")
+    assert result.exit_code == 0, result.output
+    assert "x = 1" in result.output
+
+
+def test_wheel(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LIB3TO6_CACHE_DIR", str(tmp_path / "cache"))
+    with wheels.WheelWriter(tmp_path / "pkg-1.0-py3-none-any.whl", "pkg-1.0.dist-info") as writer:
+        writer.write("pkg/__init__.py", b"x: int = 1\n")
+        writer.write("pkg-1.0.dist-info/WHEEL", wheels.wheel_text("py3", "test").encode())
+        writer.write("pkg-1.0.dist-info/METADATA", b"Name: pkg\nVersion: 1.0\n")
+
+    args   = ["wheel", "--target-version", "2.7", "-o", "out", "pkg-1.0-py3-none-any.whl"]
+    result = CliRunner().invoke(__main__.main, args)
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "out" / "pkg-1.0-py2.py3-none-any.whl").exists()
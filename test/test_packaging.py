@@ -0,0 +1,477 @@
+import os
+import sys
+import time
+import tempfile
+import pathlib as pl
+import subprocess as sp
+
+from click.testing import CliRunner
+
+from lib3to6 import sync
+from lib3to6 import cache
+from lib3to6 import common
+from lib3to6 import transpile
+from lib3to6 import packaging
+from lib3to6 import __main__
+
+# subprocesses import lib3to6 from this tree
+SRC_PATH = str(pl.Path(packaging.__file__).parent.parent)
+
+
+def _cfg(install_requires):
+    return packaging.eval_build_config(target_version="2.7", install_requires=install_requires)
+
+
+def test_cache_key_stable():
+    cfg_a = _cfg(["typing", "pathlib2", "enum34"])
+    cfg_b = _cfg(["enum34", "typing", "pathlib2"])
+    assert cache.cache_key(cfg_a, b"x = 1") == cache.cache_key(cfg_b, b"x = 1")
+    assert cache.cache_key(cfg_a, b"x = 1") != cache.cache_key(cfg_a, b"x = 2")
+
+    cfg_c = cfg_a._replace(cache_enabled=False)
+    assert cache.cache_key(cfg_a, b"x = 1") == cache.cache_key(cfg_c, b"x = 1")
+    cfg_d = cfg_a._replace(target_version="3.6")
+    assert cache.cache_key(cfg_a, b"x = 1") != cache.cache_key(cfg_d, b"x = 1")
+
+
+def test_cache_key_stable_across_processes():
+    code = (
+        "from lib3to6 import cache, packaging;"
+        "cfg = packaging.eval_build_config(install_requires='a b c d e f g');"
+        "print(cache.cache_key(cfg, b''))"
+    )
+    keys = set()
+    for seed in ("1", "2", "3"):
+        env    = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=SRC_PATH)
+        output = sp.check_output([sys.executable, "-c", code], env=env)
+        keys.add(output.strip())
+    assert len(keys) == 1
+
+
+def test_cache_key_data():
+    key_data = cache.cache_key_data(_cfg(None)).decode("utf-8")
+    assert '"lib3to6_version"' in key_data
+    assert '"source_version"' in key_data
+    assert '"cache_enabled"' not in key_data
+
+
+def test_atomic_write(tmp_path):
+    path = tmp_path / "entry.py"
+    cache.atomic_write(path, b"x = 1\n")
+    cache.atomic_write(path, b"x = 2\n")
+    assert path.read_bytes() == b"x = 2\n"
+    assert [p.name for p in tmp_path.iterdir()] == ["entry.py"]
+
+
+def test_transpile_path(tmp_path):
+    src_path = tmp_path / "mod.py"
+    src_path.write_text("x: int = 1\n")
+    cfg = _cfg(None)._replace(cache_dir=str(tmp_path / "cache"))
+
+    module_cache = cache.Cache.from_config(cfg)
+    cache_path   = packaging.transpile_path(cfg, src_path, module_cache)
+    assert cache_path.parent.parent == tmp_path / "cache"
+    assert "x = 1" in cache_path.read_text()
+    assert packaging.transpile_path(cfg, src_path, module_cache) == cache_path
+    assert (module_cache.hits, module_cache.misses) == (1, 1)
+
+
+def test_transpile_path_cache_disabled(tmp_path):
+    src_path = tmp_path / "mod.py"
+    src_path.write_text("x: int = 1\n")
+    cfg = _cfg(None)._replace(cache_dir=str(tmp_path / "cache"), cache_enabled=False)
+
+    module_cache = cache.Cache.from_config(cfg)
+    cache_path   = packaging.transpile_path(cfg, src_path, module_cache)
+    assert "x = 1" in cache_path.read_text()
+    assert not (tmp_path / "cache").exists()
+    assert tmp_path not in cache_path.parents
+
+
+def test_cache_config(tmp_path, monkeypatch):
+    monkeypatch.delenv(cache.ENV_CACHE_DIR, raising=False)
+    monkeypatch.delenv(cache.ENV_CACHE_SIZE, raising=False)
+    assert cache.get_cache_dir() == cache.DEFAULT_CACHE_DIR
+    assert cache.get_cache_size() == cache.DEFAULT_CACHE_SIZE
+
+    monkeypatch.setenv(cache.ENV_CACHE_DIR, str(tmp_path))
+    monkeypatch.setenv(cache.ENV_CACHE_SIZE, "1M")
+    assert cache.get_cache_dir() == tmp_path
+    assert cache.get_cache_size() == 1024 * 1024
+
+    cfg = packaging.eval_build_config(cache_dir=str(tmp_path / "cfg"), cache_size="2K")
+    assert cache.get_cache_dir(cfg) == tmp_path / "cfg"
+    assert cache.get_cache_size(cfg) == 2048
+
+
+def test_cache_gc_lru(tmp_path):
+    module_cache = cache.Cache(tmp_path, size_limit=150)
+    paths        = [module_cache.put(f"{i:02x}" * 20, b"x" * 100) for i in range(3)]
+    assert len({path.parent for path in paths}) == 3
+
+    # the first entry was used most recently
+    for atime, path in zip([300, 100, 200], paths):
+        os.utime(path, (atime, atime))
+
+    assert module_cache.gc() == (2, 200)
+    assert [entry.path for entry in module_cache.iter_entries()] == paths[:1]
+    assert module_cache.read_stats()['size_estimate'] == 100
+
+
+def test_cache_get_keeps_mtime(tmp_path):
+    module_cache = cache.Cache(tmp_path / "cache")
+    key          = "ab" * 20
+    entry_path   = module_cache.put(key, b"x = 1\n")
+    os.utime(entry_path, (100, 100))
+
+    # a build output which is a hardlink of the entry
+    out_path = tmp_path / "out.py"
+    os.link(entry_path, out_path)
+
+    assert module_cache.get(key) == entry_path
+    assert out_path.stat().st_mtime == 100
+    assert entry_path.stat().st_atime > 100
+
+
+def test_cache_record_build(tmp_path):
+    module_cache = cache.Cache(tmp_path)
+    key          = "ab" * 20
+    assert module_cache.get(key) is None
+    module_cache.put(key, b"x = 1\n")
+    assert module_cache.get(key) == module_cache.entry_path(key)
+    module_cache.record_build()
+
+    builds = module_cache.build_stats()
+    assert [(b.hits, b.misses) for b in builds] == [(1, 1)]
+    assert module_cache.read_stats()['size_estimate'] == 6
+
+    module_cache.clear()
+    assert not tmp_path.exists()
+    assert module_cache.build_stats() == []
+
+
+def test_cache_cli(tmp_path):
+    module_cache = cache.Cache(tmp_path)
+    module_cache.put("ab" * 20, b"x = 1\n")
+    module_cache.record_build()
+
+    runner = CliRunner()
+    result = runner.invoke(__main__.main, ["cache", "stats", "--cache-dir", str(tmp_path)])
+    assert result.exit_code == 0
+    assert "entries" in result.output
+    assert "hits" in result.output
+
+    result = runner.invoke(__main__.main, ["cache", "clear", "--cache-dir", str(tmp_path)])
+    assert result.exit_code == 0
+    assert not tmp_path.exists()
+
+
+def test_manifest_fast_path(tmp_path, monkeypatch):
+    src_path = tmp_path / "mod.py"
+    src_path.write_text("x: int = 1\n")
+    os.utime(src_path, (1000, 1000))
+    cfg = _cfg(None)._replace(cache_dir=str(tmp_path / "cache"))
+
+    module_cache = cache.Cache.from_config(cfg)
+    cache_path   = packaging.transpile_path(cfg, src_path, module_cache)
+    module_cache.record_build()
+    assert (tmp_path / "cache" / cache.MANIFEST_FILENAME).exists()
+
+    def _cache_key(*args):
+        raise AssertionError("file was hashed")
+
+    module_cache = cache.Cache.from_config(cfg)
+    with monkeypatch.context() as mp:
+        mp.setattr(cache, 'cache_key', _cache_key)
+        assert packaging.transpile_path(cfg, src_path, module_cache) == cache_path
+
+        # a different config doesn't use the same entry
+        other_cfg = cfg._replace(target_version="3.6")
+        try:
+            packaging.transpile_path(other_cfg, src_path, module_cache)
+            assert False, "expected AssertionError"
+        except AssertionError as err:
+            assert str(err) == "file was hashed"
+
+    # the entries of both configs are kept
+    other_cache_path = packaging.transpile_path(other_cfg, src_path, module_cache)
+    module_cache.record_build()
+
+    module_cache = cache.Cache.from_config(cfg)
+    with monkeypatch.context() as mp:
+        mp.setattr(cache, 'cache_key', _cache_key)
+        assert packaging.transpile_path(cfg, src_path, module_cache) == cache_path
+        assert packaging.transpile_path(other_cfg, src_path, module_cache) == other_cache_path
+
+    src_path.write_text("x: int = 22\n")
+    os.utime(src_path, (1000, 1000))
+    assert "x = 22" in packaging.transpile_path(cfg, src_path, module_cache).read_text()
+
+
+def test_manifest_corrupt(tmp_path):
+    manifest_path = tmp_path / cache.MANIFEST_FILENAME
+    manifest_path.write_bytes(b"{not json")
+
+    manifest  = cache.Manifest(manifest_path)
+    signature = (1, 1000, 2, "cfgkey")
+    assert manifest.lookup(tmp_path / "mod.py", signature) is None
+
+    manifest.update(tmp_path / "mod.py", signature, "abcd")
+    manifest.save()
+    assert cache.Manifest(manifest_path).lookup(tmp_path / "mod.py", signature) == "abcd"
+
+    # recently modified files are not recorded
+    recent_signature = (1, time.time_ns(), 2, "cfgkey")
+    manifest.update(tmp_path / "new.py", recent_signature, "abcd")
+    assert manifest.lookup(tmp_path / "new.py", recent_signature) is None
+
+
+def test_get_jobs(monkeypatch):
+    monkeypatch.delenv(packaging.ENV_JOBS, raising=False)
+    assert packaging.get_jobs(_cfg(None)) == 1
+
+    monkeypatch.setenv(packaging.ENV_JOBS, "3")
+    assert packaging.get_jobs(_cfg(None)) == 3
+    assert packaging.get_jobs(_cfg(None)._replace(jobs=2)) == 2
+    assert packaging.get_jobs(_cfg(None)._replace(jobs=0)) == os.cpu_count()
+
+
+def _write_modules(tmp_path, count):
+    filepaths = []
+    for i in range(count):
+        filepath = tmp_path / f"mod_{i:02}.py"
+        filepath.write_text(f"x: int = {i}\n")
+        os.utime(filepath, (1000, 1000))
+        filepaths.append(filepath)
+    return filepaths
+
+
+def test_transpile_paths_parallel(tmp_path, monkeypatch):
+    # each worker handles a single chunk before the pool is replaced
+    monkeypatch.setattr(packaging, 'MAX_TASKS_PER_CHILD', 1)
+
+    filepaths = _write_modules(tmp_path, 12)
+    cfg       = _cfg(None)._replace(cache_dir=str(tmp_path / "cache"), jobs=2)
+
+    module_cache = cache.Cache.from_config(cfg)
+    cache_paths  = packaging.transpile_paths(cfg, filepaths, module_cache)
+    assert [f"x = {i}" in path.read_text() for i, path in enumerate(cache_paths)] == [True] * 12
+    assert module_cache.misses == 12
+
+    # manifest entries of the workers are merged
+    module_cache.record_build()
+    manifest = cache.Manifest(tmp_path / "cache" / cache.MANIFEST_FILENAME)
+    assert len(manifest.entries) == 12
+
+    serial_cfg = cfg._replace(jobs=1)
+    assert packaging.transpile_paths(serial_cfg, filepaths, module_cache) == cache_paths
+    assert module_cache.hits == 12
+
+
+def test_transpile_paths_parallel_cache_disabled(tmp_path, monkeypatch):
+    tmp_dir = tmp_path / "tmp"
+    tmp_dir.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_dir))
+
+    filepaths = _write_modules(tmp_path, 12)
+    cfg       = _cfg(None)._replace(cache_dir=str(tmp_path / "cache"), jobs=2, cache_enabled=False)
+
+    module_cache = cache.Cache.from_config(cfg)
+    cache_paths  = packaging.transpile_paths(cfg, filepaths, module_cache)
+    assert [f"x = {i}" in path.read_text() for i, path in enumerate(cache_paths)] == [True] * 12
+
+    # workers write to the temporary cache directory of the parent
+    assert list(tmp_dir.iterdir()) == [module_cache.cache_dir]
+    assert all(module_cache.cache_dir in path.parents for path in cache_paths)
+
+
+def test_transpile_paths_error_order(tmp_path, caplog):
+    filepaths = _write_modules(tmp_path, 12)
+    filepaths[3].write_text("from os import *\n")
+    filepaths[9].write_text("from sys import *\n")
+    cfg = _cfg(None)._replace(cache_dir=str(tmp_path / "cache"), jobs=2)
+
+    try:
+        packaging.transpile_paths(cfg, filepaths)
+        assert False, "expected CheckError"
+    except common.CheckError as err:
+        assert str(filepaths[3]) in str(err)
+
+    error_messages = [rec.getMessage() for rec in caplog.records if rec.levelname == "ERROR"]
+    assert len(error_messages) == 2
+    assert str(filepaths[3]) in error_messages[0]
+    assert str(filepaths[9]) in error_messages[1]
+
+
+def test_timings_estimate(tmp_path):
+    timings = cache.Timings(tmp_path / cache.TIMINGS_FILENAME)
+    assert timings.seconds_per_byte() == cache.DEFAULT_SECONDS_PER_BYTE
+
+    timings.record(tmp_path / "a.py", 1000, 0.5)
+    timings.save()
+
+    timings = cache.Timings(tmp_path / cache.TIMINGS_FILENAME)
+    assert timings.seconds_per_byte() == 0.5 / 1000
+    assert timings.estimate(tmp_path / "a.py", 1000, 0.5 / 1000) == 0.5
+    # size based estimate for unknown or modified files
+    assert timings.estimate(tmp_path / "b.py", 2000, 0.5 / 1000) == 1.0
+    assert timings.estimate(tmp_path / "a.py", 3000, 0.5 / 1000) == 1.5
+
+
+def test_schedule_chunks():
+    costs  = [1.0, 8.0, 1.0, 1.0, 4.0, 1.0, 1.0, 1.0]
+    chunks = packaging._schedule_chunks(costs, jobs=1)
+    # longest first, each chunk has at least a quarter of the total cost
+    assert chunks == [[1], [4, 0], [2, 3, 5, 6, 7]]
+    assert sorted(idx for chunk in chunks for idx in chunk) == list(range(len(costs)))
+
+
+def test_build_timings_report(tmp_path, caplog):
+    filepaths = _write_modules(tmp_path, 3)
+    cfg       = _cfg(None)._replace(cache_dir=str(tmp_path / "cache"), jobs=2)
+
+    module_cache = cache.Cache.from_config(cfg)
+    packaging.transpile_paths(cfg, filepaths, module_cache)
+    assert len(module_cache.timings.updated()) == 3
+
+    caplog.set_level("INFO")
+    packaging.log_slowest_files(module_cache)
+    assert "transpiled 3 files" in caplog.text
+
+    module_cache.record_build()
+    timings = cache.Timings(tmp_path / "cache" / cache.TIMINGS_FILENAME)
+    assert sorted(timings.entries) == sorted(str(filepath) for filepath in filepaths)
+
+
+def _old_file(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    os.utime(path, (1000, 1000))
+
+
+def test_sync_tree(tmp_path):
+    src_dir = tmp_path / "src"
+    dst_dir = tmp_path / "dst"
+    _old_file(src_dir / "mod.py", "x = 1\n")
+    _old_file(src_dir / "data" / "blob.bin", "data")
+    _old_file(src_dir / "mod.pyc", "ignored")
+    _old_file(dst_dir / "stale" / "old.py", "x = 0\n")
+
+    manifest = sync.SyncManifest(tmp_path / "sync.json")
+    stats    = sync.sync_tree(src_dir, dst_dir, manifest, packaging._ignore_tmp_files, 'hardlink')
+    assert stats == sync.SyncStats(placed=2, unchanged=0, removed=1)
+    assert sorted(str(p.relative_to(dst_dir)) for p in dst_dir.rglob("*")) == [
+        "data",
+        "data/blob.bin",
+        "mod.py",
+    ]
+    src_stat = (src_dir / "data" / "blob.bin").stat()
+    assert (dst_dir / "data" / "blob.bin").stat().st_ino == src_stat.st_ino
+
+    # files are replaced, never written to, so the source is unchanged
+    sync.place_file(src_dir / "data" / "blob.bin", dst_dir / "mod.py")
+    assert (src_dir / "mod.py").read_text() == "x = 1\n"
+
+    manifest.save()
+    manifest = sync.SyncManifest(tmp_path / "sync.json")
+    stats    = sync.sync_tree(src_dir, dst_dir, manifest, packaging._ignore_tmp_files, 'copy')
+    assert stats == sync.SyncStats(placed=1, unchanged=1, removed=0)
+    assert (dst_dir / "mod.py").read_text() == "x = 1\n"
+
+    _old_file(src_dir / "data" / "blob.bin", "new data")
+    (src_dir / "mod.py").unlink()
+    stats = sync.sync_tree(src_dir, dst_dir, manifest, packaging._ignore_tmp_files, 'reflink')
+    assert stats == sync.SyncStats(placed=1, unchanged=0, removed=1)
+    assert (dst_dir / "data" / "blob.bin").read_text() == "new data"
+
+
+def test_init_build_package_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _old_file(tmp_path / "src" / "pkg" / "mod.py", "x: int = 1\n")
+    _old_file(tmp_path / "src" / "pkg" / "data.txt", "data")
+
+    build_package_dir = packaging.init_build_package_dir({"pkg": "src/pkg"})
+    cfg = _cfg(None)._replace(cache_dir=str(tmp_path / "cache"))
+    packaging.build_packages(cfg, build_package_dir)
+
+    build_dir = pl.Path(build_package_dir["pkg"])
+    assert "x = 1" in (build_dir / "mod.py").read_text()
+    assert (build_dir / "data.txt").read_text() == "data"
+    assert (tmp_path / "src" / "pkg" / "mod.py").read_text() == "x: int = 1\n"
+    assert (tmp_path / "build" / packaging.SYNC_MANIFEST_FILENAME).exists()
+
+
+def test_transpile_path_dest(tmp_path, monkeypatch):
+    src_path = tmp_path / "mod.py"
+    _old_file(src_path, "x: int = 1\n")
+    cfg          = _cfg(None)._replace(cache_dir=str(tmp_path / "cache"))
+    module_cache = cache.Cache.from_config(cfg)
+
+    def _place_file(*args, **kwargs):
+        raise AssertionError("cache entry was copied")
+
+    # on a miss, the result is written directly
+    dest = tmp_path / "out_copy.py"
+    with monkeypatch.context() as mp:
+        mp.setattr(sync, 'place_file', _place_file)
+        cache_path = packaging.transpile_path(cfg, src_path, module_cache, dest, 'copy')
+    assert dest.read_bytes() == cache_path.read_bytes()
+    assert dest.stat().st_ino != cache_path.stat().st_ino
+
+    dest = tmp_path / "out_link.py"
+    packaging.transpile_path(cfg, src_path, module_cache, dest, 'hardlink')
+    assert dest.stat().st_ino == cache_path.stat().st_ino
+
+    # the link is replaced, the cache entry is never written to
+    packaging.transpile_path(cfg, src_path, module_cache, dest, 'copy')
+    assert dest.stat().st_ino != cache_path.stat().st_ino
+    assert "x = 1" in cache_path.read_text()
+
+
+def test_build_packages_targets(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _old_file(tmp_path / "src" / "pkg" / "mod.py", "x: int = 1\nprint(f'{x}')\n")
+    _old_file(tmp_path / "src" / "pkg" / "sub" / "__init__.py", "y: int = 2\n")
+    _old_file(tmp_path / "src" / "pkg" / "data.txt", "data")
+
+    parse_calls = []
+    orig_parse  = transpile.ast.parse
+
+    def _parse(*args, **kwargs):
+        # parsing with a feature_version is only a check of the syntax
+        if 'feature_version' not in kwargs:
+            parse_calls.append(args[0])
+        return orig_parse(*args, **kwargs)
+
+    monkeypatch.setattr(transpile.ast, 'parse', _parse)
+
+    build_package_dir = packaging.init_build_package_dir({"pkg": "src/pkg"})
+    for jobs in [1, 2]:
+        cfg = _cfg(None)._replace(cache_dir=str(tmp_path / f"cache_{jobs}"), jobs=jobs)
+        package_dirs = packaging.build_packages(cfg, build_package_dir, ["2.7", "3.6"])
+        assert package_dirs == {
+            "2.7": {"pkg": "build/lib3to6_out/src/pkg_py27"},
+            "3.6": {"pkg": "build/lib3to6_out/src/pkg_py36"},
+        }
+
+        py27_dir = tmp_path / package_dirs["2.7"]["pkg"]
+        py36_dir = tmp_path / package_dirs["3.6"]["pkg"]
+        assert ".format(" in (py27_dir / "mod.py").read_text()
+        assert "coding: utf-8" in (py27_dir / "sub" / "__init__.py").read_text()
+        assert "x: int = 1\nprint(f'{x}')\n" in (py36_dir / "mod.py").read_text()
+        assert (py36_dir / "data.txt").read_text() == "data"
+        # the shared build tree is not transpiled
+        build_dir = tmp_path / build_package_dir["pkg"]
+        assert (build_dir / "mod.py").read_text() == "x: int = 1\nprint(f'{x}')\n"
+
+        if jobs == 1:
+            # each module is parsed once, not once per target
+            assert len(parse_calls) == 2
+
+
+def test_target_package_dirs():
+    build_package_dir = {"": "build/lib3to6_out", "pkg.sub": "build/lib3to6_out/pkg/sub"}
+    package_dirs      = packaging.target_package_dirs(build_package_dir, ["2.7"])
+    assert package_dirs == {
+        "2.7": {"": "build/lib3to6_out_py27", "pkg.sub": "build/lib3to6_out_py27/pkg/sub"}
+    }
@@ -0,0 +1,98 @@
+import io
+import json
+import threading
+
+import pytest
+
+from lib3to6 import common
+from lib3to6 import server
+
+
+def _request(handler, method, **params):
+    return handler.handle({'id': 1, 'method': method, 'params': params})
+
+
+def test_handler_transpile():
+    handler  = server.Handler(memory_cache_size=2)
+    response = _request(handler, 'transpile', source="x: int = 1\n", target_version="2.7")
+    assert response['id'] == 1
+    assert "x = 1" in response['result']['source']
+
+    response = _request(handler, 'transpile', source="x: int = 1\n", target_version="3.6")
+    assert "x: int = 1" in response['result']['source']
+
+    for i in range(3):
+        _request(handler, 'transpile', source=f"x{i}: int = 1\n")
+    assert len(handler._results) == 2
+
+
+def test_handler_errors():
+    handler = server.Handler()
+
+    response = _request(handler, 'transpile', source="\nfrom os import *\n", filepath="mod.py")
+    assert response['error']['type'] == "CheckError"
+    assert response['error']['lineno'] == 2
+    assert response['error']['message'].startswith("mod.py@2 - ")
+
+    response = _request(handler, 'transpile', source="x = (\n")
+    assert response['error']['type'] == "SyntaxError"
+
+    response = _request(handler, 'transpile')
+    assert response['error']['type'] == "RequestError"
+
+    response = _request(handler, 'transpile', source="x = 1\n", target_version="latest")
+    assert response['error']['type'] == "RequestError"
+    assert "Invalid version 'latest'" in response['error']['message']
+
+    response = _request(handler, 'transpile', source="x: int = 1\n", target_version="3.7rc1")
+    assert "x: int = 1" in response['result']['source']
+
+    response = _request(handler, 'frobnicate')
+    assert response['error']['type'] == "RequestError"
+
+    assert json.loads(handler.handle_line(b"{not json"))['error']['type'] == "RequestError"
+
+
+def test_serve_stream():
+    requests = [
+        {'id': 1, 'method': 'transpile', 'params': {'source': "x: int = 1\n"}},
+        {'id': 2, 'method': 'shutdown'},
+        {'id': 3, 'method': 'ping'},
+    ]
+    in_fobj  = io.BytesIO(b"".join(json.dumps(r).encode("utf-8") + b"\n" for r in requests))
+    out_fobj = io.BytesIO()
+    server.serve_stream(in_fobj, out_fobj, server.Handler())
+
+    responses = [json.loads(line) for line in out_fobj.getvalue().splitlines()]
+    assert [response['id'] for response in responses] == [1, 2]
+    assert "x = 1" in responses[0]['result']['source']
+
+
+def test_serve_unix(tmp_path):
+    socket_path = str(tmp_path / "lib3to6.sock")
+    ready       = threading.Event()
+    thread      = threading.Thread(
+        target=server.serve_unix, args=(socket_path, server.Handler(), ready), daemon=True
+    )
+    thread.start()
+    assert ready.wait(5)
+
+    with server.Client(socket_path, timeout=5) as client:
+        assert "x = 1" in client.transpile("x: int = 1\n", target_version="2.7")
+        with pytest.raises(common.CheckError) as excinfo:
+            client.transpile("from os import *\n")
+        assert excinfo.value.lineno == 1
+
+    assert "y = 2" in server.transpile_source("y: int = 2\n", socket_path=socket_path)
+
+    with server.Client(socket_path, timeout=5) as client:
+        client.request('shutdown')
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_transpile_source_fallback(tmp_path):
+    socket_path = str(tmp_path / "missing.sock")
+    assert "x = 1" in server.transpile_source("x: int = 1\n", socket_path=socket_path)
+    with pytest.raises(common.CheckError):
+        server.transpile_source("from os import *\n", socket_path=socket_path)
@@ -1,6 +1,18 @@
+import ast
+import logging
+
+import pytest
+
+from lib3to6 import common
+from lib3to6 import codegen
+from lib3to6 import fixers
 from lib3to6 import transpile
+from lib3to6 import fixer_base as fb
+from lib3to6 import checker_base as cb
 from lib3to6.utils import clean_whitespace
 
+from . import interpreters
+
 
 def test_parse_header_simple():
     source = clean_whitespace(
@@ -31,3 +43,348 @@ def test_parse_header_coding():
     header      = transpile.parse_module_header(source_data, "2.7")
     assert header.coding == "shift_jis"
     assert header.text   == "# coding: shift_jis\n# 今日は\n"
+
+
+def test_transpile_plan_cached():
+    ctx_a = common.init_build_context(target_version="2.7", fixers="new_style_classes")
+    ctx_b = common.init_build_context(target_version="2.7", fixers=["new_style_classes"])
+    ctx_c = common.init_build_context(target_version="3.6")
+
+    plan_a = transpile.get_transpile_plan(ctx_a.cfg)
+    assert plan_a is transpile.get_transpile_plan(ctx_b.cfg)
+    assert plan_a is not transpile.get_transpile_plan(ctx_c.cfg)
+    assert [fixer_type.__name__ for fixer_type in plan_a.fixer_types] == ["NewStyleClassesFixer"]
+
+    plan_c = transpile.get_transpile_plan(ctx_c.cfg)
+    assert fixers.NewStyleClassesFixer not in plan_c.fixer_types
+    assert fixers.FStringToStrFormatFixer not in plan_c.fixer_types
+    assert fixers.NamedExprFixer in plan_c.fixer_types
+
+
+def test_deprecated_fixer_names():
+    module_source = "import queue\nimport socketserver\n"
+    ctx           = common.init_build_context(target_version="2.7", fixers="queue_import_fallback")
+    with pytest.warns(DeprecationWarning, match="ModuleImportFallbackFixer"):
+        plan = transpile.get_transpile_plan(ctx.cfg)
+    assert [fixer_type.__name__ for fixer_type in plan.fixer_types] == ["QueueImportFallbackFixer"]
+
+    result = transpile.transpile_module(ctx, module_source)
+    assert "import Queue as queue" in result
+    assert "import SocketServer" not in result
+
+    with pytest.warns(DeprecationWarning):
+        assert fixers.QueueImportFallbackFixer in plan.fixer_types
+    assert "QueueImportFallbackFixer" not in dir(fixers)
+
+    ctx = common.init_build_context(target_version="2.7", fixers="new_style_classes,no_such")
+    with pytest.raises(ValueError, match="Unknown names: no_such"):
+        transpile.get_transpile_plan(ctx.cfg)
+
+
+def test_deprecated_builtin_rename_fixer_names():
+    module_source = "x = range(3)\ny = map(str, x)\n"
+    ctx           = common.init_build_context(target_version="2.7", fixers="xrange_to_range")
+    with pytest.warns(DeprecationWarning, match="BuiltinRenameFixer"):
+        result = transpile.transpile_module(ctx, module_source)
+    assert "range = getattr(builtins, 'xrange', range)" in result
+    assert "imap" not in result
+    assert "unicode" not in result
+
+    ctx = common.init_build_context(target_version="2.7", fixers="itertools_builtins")
+    with pytest.warns(DeprecationWarning):
+        result = transpile.transpile_module(ctx, module_source)
+    assert "map = getattr(itertools, 'imap', map)" in result
+    assert "xrange" not in result
+
+
+def test_select_triggered_fixers(caplog):
+    module_source = clean_whitespace(
+        """
+        import queue
+
+        def foo(a, *, b=1):
+            return f"{a}{b}"
+        """
+    )
+    ctx   = common.init_build_context(target_version="2.7")
+    plan  = transpile.get_transpile_plan(ctx.cfg)
+    facts = cb.CheckerDispatcher([])(ctx, ast.parse(module_source))
+
+    all_fixers = [fixer_type() for fixer_type in plan.fixer_types]
+    with caplog.at_level(logging.DEBUG, logger="lib3to6.transpile"):
+        triggered_fixers = transpile.select_triggered_fixers(ctx, all_fixers, facts)
+
+    triggered_types = {type(fixer) for fixer in triggered_fixers}
+    assert fixers.FStringToStrFormatFixer in triggered_types
+    assert fixers.InlineKWOnlyArgsFixer in triggered_types
+    assert fixers.ModuleImportFallbackFixer in triggered_types
+    assert fixers.UnicodeLiteralsFutureFixer in triggered_types
+    assert fixers.NamedTupleClassToAssignFixer not in triggered_types
+    assert fixers.UnpackingGeneralizationsFixer not in triggered_types
+    assert fixers.BuiltinRenameFixer not in triggered_types
+
+    assert "skipped fixers" in caplog.text
+    assert "NamedTupleClassToAssignFixer" in caplog.text
+
+
+def test_import_fallbacks_config():
+    module_source = "import mypkg.newname as nn\nimport queue\n"
+
+    ctx = common.init_build_context(target_version="2.7")
+    assert "mypkg.oldname" not in transpile.transpile_module(ctx, module_source)
+
+    ctx = common.init_build_context(
+        target_version="2.7", import_fallbacks={'mypkg.newname': "mypkg.oldname"}
+    )
+    fixed_source = transpile.transpile_module(ctx, module_source)
+    assert "import mypkg.oldname as nn" in fixed_source
+    assert "import Queue as queue" in fixed_source
+
+
+def test_builtin_renames_config():
+    module_source = "x = map(str, range(3))\ny = ascii(x)\n"
+
+    ctx          = common.init_build_context(target_version="2.7")
+    fixed_source = transpile.transpile_module(ctx, module_source)
+    assert "map = getattr(itertools, 'imap', map)" in fixed_source
+    assert "range = getattr(builtins, 'xrange', range)" in fixed_source
+    assert "str = getattr(builtins, 'unicode', str)" in fixed_source
+    assert "ascii = " not in fixed_source
+
+    ctx = common.init_build_context(target_version="2.7", builtin_renames={'ascii': "builtins.repr"})
+    fixed_source = transpile.transpile_module(ctx, module_source)
+    assert "ascii = getattr(builtins, 'repr', ascii)" in fixed_source
+    assert "range = getattr(builtins, 'xrange', range)" in fixed_source
+
+    # itertools was introduced in 2.3
+    ctx          = common.init_build_context(target_version="2.2")
+    fixed_source = transpile.transpile_module(ctx, module_source)
+    assert "itertools" not in fixed_source
+    assert "range = getattr(builtins, 'xrange', range)" in fixed_source
+
+
+PASSTHROUGH_SOURCE = """#!/usr/bin/env python
+# some comment
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+
+class Foo(object):  # trailing comment
+
+    def bar(self, x):
+        return  x  *  2
+"""
+
+
+def test_passthrough_unmodified():
+    ctx           = common.init_build_context(target_version="3.9")
+    module_source = "from __future__ import annotations\n\nx  =  1  # comment\n"
+    assert transpile.transpile_module(ctx, module_source) is module_source
+
+    source_data = module_source.encode("utf-8")
+    assert transpile.transpile_module_data(ctx, source_data) is source_data
+
+    # versions are compared as numbers, not as strings
+    ctx           = common.init_build_context(target_version="3.10")
+    module_source = "from __future__ import annotations\n\nx = 1_000\n"
+    assert transpile.transpile_module(ctx, module_source) is module_source
+
+    # the source can't be shown to be valid for python 2.7
+    ctx    = common.init_build_context(target_version="2.7")
+    result = transpile.transpile_module(ctx, PASSTHROUGH_SOURCE)
+    assert result.startswith("#!/usr/bin/env python\n# -*- coding: utf-8 -*-\n")
+    assert "return x * 2" in result
+
+
+def test_passthrough_modified():
+    ctx = common.init_build_context(target_version="3.7")
+
+    # missing future import, the statement itself is not modified
+    result = transpile.transpile_module(ctx, "x  =  1  # comment\n")
+    assert "from __future__ import annotations" in result
+    assert result.endswith("\nx  =  1  # comment\n")
+
+    # syntax that is normalized by codegen
+    module_source = "from __future__ import annotations\n"
+    result = transpile.transpile_module(ctx, module_source + "for x in *a, 1:\n    pass\n")
+    assert "for x in (*a, 1):" in result
+    result = transpile.transpile_module(ctx, module_source + "y = f'{x=}'\n")
+    assert "y = f'x={x!r}'" in result
+
+
+class _NewStyleFooFixer(fb.FixerBase):
+
+    version_info   = common.VersionInfo()
+    dispatch_types = (ast.ClassDef,)
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> ast.ClassDef:
+        if node.name == "Foo":
+            node.bases.append(ast.Name(id="object", ctx=ast.Load()))
+            self.mark_modified(node)
+        return node
+
+
+def test_splice_module():
+    module_source = clean_whitespace(
+        """
+        import os  # os comment
+
+        # leading comment
+        @decorator
+        class Foo:  # modified
+            pass
+
+        a  =  1; b = 2
+        c  =  3  # unmodified
+        # trailing comment
+        """
+    )
+    ctx    = common.init_build_context(target_version="3.7")
+    tree   = ast.parse(module_source)
+    fixed  = transpile.fix_module(ctx, [_NewStyleFooFixer()], tree, list(tree.body))
+    result = transpile.fixed_module_source(module_source, fixed, "3.7", codegen.astor_to_source)
+    assert result.endswith(
+        clean_whitespace(
+            """
+            import os  # os comment
+
+            # leading comment
+            @decorator
+            class Foo(object):
+                pass
+
+            a = 1
+            b = 2
+            c  =  3  # unmodified
+            # trailing comment
+            """
+        )
+    )
+
+
+# syntax which older versions can't parse, but which codegen normalizes
+NEWER_SYNTAX_STMTS = [
+    'def f(a, **kw,):\n    return kw\n',
+    'f(a, *args,)\n',
+    'PATH = r"C:\\Users\\foo"\n',
+    'with (a as x,\n      b as y):\n    pass\n',
+    'for x in *a, 1:\n    pass\n',
+    'def f(x):\n    return f"{x=}"\n',
+]
+
+
+def _transpile_newer_syntax(target_version):
+    ctx     = common.init_build_context(target_version=target_version)
+    sources = []
+    for stmt_source in NEWER_SYNTAX_STMTS:
+        # unmodified statement next to a modified one
+        sources.append(transpile.transpile_module(ctx, "class A:\n    pass\n\n" + stmt_source))
+        # module which is passed through
+        sources.append(transpile.transpile_module(ctx, PASSTHROUGH_SOURCE + stmt_source))
+    return sources
+
+
+def test_splice_module_py27():
+    sources = _transpile_newer_syntax("2.7")
+    assert interpreters.compile_errors(sources) == [None] * len(sources)
+    assert 'PATH = r"C:\\Users\\foo"' not in "".join(sources)
+
+
+def test_splice_module_py36():
+    sources = _transpile_newer_syntax("3.6")
+    assert interpreters.compile_errors(sources, "3.6") == [None] * len(sources)
+
+
+def test_splice_module_py37():
+    sources = _transpile_newer_syntax("3.7")
+    assert interpreters.compile_errors(sources, "3.7") == [None] * len(sources)
+
+    # other statements are still reused verbatim
+    ctx    = common.init_build_context(target_version="3.7")
+    result = transpile.transpile_module(ctx, "class A:\n    pass\n\nf(a,  *b,)\nx = f'{x!r}'\n")
+    assert result.endswith("f(a,  *b,)\nx = f'{x!r}'\n")
+
+
+def test_except_star():
+    module_source = "try:\n    pass\nexcept* ValueError:\n    pass\n"
+    for target_version in ["2.7", "3.6", "3.7"]:
+        ctx = common.init_build_context(target_version=target_version)
+        # no codegen backend supports it (and before python 3.11 it doesn't parse)
+        try:
+            result = transpile.transpile_module(ctx, module_source)
+        except Exception:
+            result = None
+        assert result is None
+
+
+MULTI_TARGET_SOURCE = clean_whitespace(
+    """
+    import typing as typ
+
+    def hello(name: str, count: int = 1) -> None:
+        print(f"hello {name}" * count)
+
+    class Foo:
+        x: typ.List[int] = []
+
+    if (n := len(Foo.x)) > 0:
+        hello("n", n)
+    """
+)
+
+
+def test_transpile_module_targets(monkeypatch):
+    target_versions = ["2.7", "3.6", "2.7", "3.8", "3.4"]
+    expected        = [
+        transpile.transpile_module(
+            common.init_build_context(target_version=target_version), MULTI_TARGET_SOURCE
+        )
+        for target_version in target_versions
+    ]
+
+    deepcopy_calls = []
+    orig_deepcopy  = transpile.copy.deepcopy
+
+    def _deepcopy(*args, **kwargs):
+        deepcopy_calls.append(args[0])
+        return orig_deepcopy(*args, **kwargs)
+
+    monkeypatch.setattr(transpile.copy, 'deepcopy', _deepcopy)
+
+    ctx     = common.init_build_context(target_version="2.7")
+    results = transpile.transpile_module_targets(ctx, MULTI_TARGET_SOURCE, target_versions)
+    assert results == expected
+    assert "format" in results[0]
+    assert ":=" in results[3]
+    # four distinct targets, so at most three copies of the tree
+    assert len(deepcopy_calls) <= 3
+
+    deepcopy_calls.clear()
+    results = transpile.transpile_module_targets(ctx, MULTI_TARGET_SOURCE, ["2.7", "2.7"])
+    assert results == [expected[0], expected[0]]
+    assert deepcopy_calls == []
+
+    # targets with the same fixers share a tree, if there are no future imports
+    deepcopy_calls.clear()
+    target_versions = ["3.5", "3.6", "3.7", "3.8"]
+    results = transpile.transpile_module_targets(ctx, "x = f'{x}'\n", target_versions)
+    assert "format" in results[0]
+    assert results[2] == results[3]
+    assert len(deepcopy_calls) == 2
+
+
+def test_check_module_targets_error():
+    module_source = clean_whitespace(
+        """
+        def gen():
+            yield from range(3)
+        """
+    )
+    ctx = common.init_build_context(target_version="3.6")
+    try:
+        transpile.transpile_module_targets(ctx, module_source, ["3.6", "3.1", "2.7"])
+        assert False, "expected CheckError"
+    except common.CheckError as err:
+        assert "target_version=3.1" in str(err)
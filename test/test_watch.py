@@ -0,0 +1,76 @@
+import os
+
+from lib3to6 import watch
+from lib3to6 import packaging
+from lib3to6 import transpile
+
+
+def _old_file(path, text, mtime=1000):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    os.utime(path, (mtime, mtime))
+
+
+def test_watcher_poll(tmp_path, monkeypatch, caplog):
+    src_dir = tmp_path / "src"
+    out_dir = tmp_path / "out"
+    _old_file(src_dir / "a.py", "a: int = 1\n")
+    _old_file(src_dir / "sub" / "b.py", "b: int = 2\n")
+    _old_file(src_dir / "__pycache__" / "c.py", "c = 3\n")
+    _old_file(src_dir / "data.txt", "data\n")
+
+    transpiled = []
+    orig_transpile_module_data = transpile.transpile_module_data
+
+    def _transpile_module_data(ctx, module_source_data):
+        transpiled.append(os.path.basename(ctx.filepath))
+        return orig_transpile_module_data(ctx, module_source_data)
+
+    monkeypatch.setattr(transpile, 'transpile_module_data', _transpile_module_data)
+
+    cfg     = packaging.eval_build_config(target_version="2.7", cache_dir=str(tmp_path / "cache"))
+    watcher = watch.Watcher(cfg, src_dir, out_dir)
+
+    assert watcher.poll() == watch.WatchStats(transpiled=2, unchanged=0, removed=0, errors=0)
+    assert "a = 1" in (out_dir / "a.py").read_text()
+    assert "b = 2" in (out_dir / "sub" / "b.py").read_text()
+    assert not (out_dir / "__pycache__").exists()
+    assert not (out_dir / "data.txt").exists()
+    assert sorted(transpiled) == ["a.py", "b.py"]
+
+    assert watcher.poll() == watch.WatchStats(0, 0, 0, 0)
+
+    _old_file(src_dir / "a.py", "a: int = 11\n", mtime=2000)
+    assert watcher.poll() == watch.WatchStats(1, 0, 0, 0)
+    assert "a = 11" in (out_dir / "a.py").read_text()
+    assert sorted(transpiled) == ["a.py", "a.py", "b.py"]
+
+    # errors are logged, the previous output is kept
+    _old_file(src_dir / "a.py", "from os import *\n", mtime=3000)
+    assert watcher.poll() == watch.WatchStats(0, 0, 0, 1)
+    assert "a = 11" in (out_dir / "a.py").read_text()
+    assert watcher.poll() == watch.WatchStats(0, 0, 0, 0)
+
+    # other errors of one module don't stop the watcher
+    _old_file(src_dir / "a.py", "a: int = 12\n", mtime=4000)
+    (src_dir / "c.py").write_bytes(b"c = '\xff'\n")
+    os.utime(src_dir / "c.py", (4000, 4000))
+    assert watcher.poll() == watch.WatchStats(1, 0, 0, 1)
+    assert "a = 12" in (out_dir / "a.py").read_text()
+    assert not (out_dir / "c.py").exists()
+    assert "UnicodeDecodeError" in caplog.text
+    (src_dir / "c.py").unlink()
+    assert watcher.poll() == watch.WatchStats(0, 0, 0, 0)
+
+    (src_dir / "sub" / "b.py").unlink()
+    assert watcher.poll() == watch.WatchStats(0, 0, 1, 0)
+    assert not (out_dir / "sub" / "b.py").exists()
+
+
+def test_watcher_output_in_src(tmp_path):
+    src_dir = tmp_path / "src"
+    _old_file(src_dir / "a.py", "a: int = 1\n")
+    cfg     = packaging.eval_build_config(target_version="2.7", cache_dir=str(tmp_path / "cache"))
+    watcher = watch.Watcher(cfg, src_dir, src_dir / "out")
+    assert watcher.poll().transpiled == 1
+    assert watcher.poll().transpiled == 0
@@ -0,0 +1,144 @@
+import base64
+import hashlib
+import zipfile
+
+import lib3to6
+from lib3to6 import wheels
+from lib3to6 import packaging
+
+
+def _check_record(wheel_path):
+    with zipfile.ZipFile(wheel_path) as zfile:
+        dist_info = next(n for n in zfile.namelist() if n.endswith(".dist-info/RECORD"))
+        record    = zfile.read(dist_info).decode("utf-8")
+        lines     = record.splitlines()
+        assert lines[-1] == dist_info + ",,"
+        for line in lines[:-1]:
+            arcname, hash_str, size = line.split(",")
+            data   = zfile.read(arcname)
+            digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=")
+            assert hash_str == "sha256=" + digest.decode("ascii")
+            assert int(size) == len(data)
+        return sorted(line.split(",")[0] for line in lines)
+
+
+def test_wheel_writer(tmp_path):
+    data_path = tmp_path / "data.bin"
+    data_path.write_bytes(bytes(range(256)) * 1000)
+
+    wheel_path = tmp_path / "pkg-1.0-py3-none-any.whl"
+    with wheels.WheelWriter(wheel_path, "pkg-1.0.dist-info") as writer:
+        writer.write("pkg/__init__.py", b"x = 1\n")
+        writer.write_path("pkg/data.bin", data_path)
+
+    arcnames = _check_record(wheel_path)
+    assert arcnames == ["pkg-1.0.dist-info/RECORD", "pkg/__init__.py", "pkg/data.bin"]
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == ".tmp"] == []
+
+
+def test_wheel_writer_abort(tmp_path):
+    wheel_path = tmp_path / "pkg-1.0-py3-none-any.whl"
+    try:
+        with wheels.WheelWriter(wheel_path, "pkg-1.0.dist-info") as writer:
+            writer.write("pkg/__init__.py", b"x = 1\n")
+            raise KeyError("error")
+    except KeyError:
+        pass
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_build_wheel(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LIB3TO6_CACHE_DIR", str(tmp_path / "cache"))
+    (tmp_path / "src" / "mypkg").mkdir(parents=True)
+    (tmp_path / "src" / "mypkg" / "__init__.py").write_text("x: int = 1\n")
+    (tmp_path / "src" / "mypkg" / "data.txt").write_text("data\n")
+
+    dist = lib3to6.Distribution(
+        {
+            'script_name'     : "setup.py",
+            'name'            : "my-pkg",
+            'version'         : "1.0",
+            'packages'        : ["mypkg"],
+            'package_dir'     : {"": "src"},
+            'package_data'    : {"mypkg": ["*.txt"]},
+            'python_requires' : ">=2.7",
+            'install_requires': ["six"],
+            'entry_points'    : {'console_scripts': ["mypkg = mypkg:main"]},
+        }
+    )
+    wheel_path = packaging.build_wheel(dist, tmp_path / "dist")
+    assert wheel_path.name == "my_pkg-1.0-py2.py3-none-any.whl"
+    assert not (tmp_path / "build").exists()
+
+    arcnames = _check_record(wheel_path)
+    assert "mypkg/__init__.py" in arcnames
+    assert "mypkg/data.txt" in arcnames
+    assert "my_pkg-1.0.dist-info/entry_points.txt" in arcnames
+
+    with zipfile.ZipFile(wheel_path) as zfile:
+        assert "x = 1" in zfile.read("mypkg/__init__.py").decode("utf-8")
+        metadata = zfile.read("my_pkg-1.0.dist-info/METADATA").decode("utf-8")
+        assert "Requires-Dist: six" in metadata
+        assert "Tag: py2-none-any" in zfile.read("my_pkg-1.0.dist-info/WHEEL").decode("utf-8")
+
+
+def _write_src_wheel(tmp_path):
+    wheel_path = tmp_path / "my_pkg-1.0-py3-none-any.whl"
+    with wheels.WheelWriter(wheel_path, "my_pkg-1.0.dist-info") as writer:
+        writer.write("mypkg/__init__.py", b"x: int = 1\n")
+        writer.write("mypkg/cli.py", b"def main() -> None:\n    print(f'{1}')\n", mode=0o755)
+        writer.write("mypkg/data.bin", bytes(range(256)) * 1000)
+        writer.write("my_pkg-1.0.dist-info/WHEEL", wheels.wheel_text("py3", "test").encode())
+        writer.write(
+            "my_pkg-1.0.dist-info/METADATA",
+            b"Name: my-pkg\nVersion: 1.0\nRequires-Python: >=3.6\n\nDescription\n",
+        )
+    return wheel_path
+
+
+def test_transpile_wheel(tmp_path, monkeypatch):
+    monkeypatch.setenv("LIB3TO6_CACHE_DIR", str(tmp_path / "cache"))
+    src_wheel_path = _write_src_wheel(tmp_path)
+
+    for jobs in [1, 2]:
+        cfg      = packaging.eval_build_config(target_version="2.7", jobs=jobs)
+        out_path = packaging.transpile_wheel(cfg, src_wheel_path, tmp_path / "dist")
+        assert out_path.name == "my_pkg-1.0-py2.py3-none-any.whl"
+
+        arcnames = _check_record(out_path)
+        assert arcnames == [
+            "my_pkg-1.0.dist-info/METADATA",
+            "my_pkg-1.0.dist-info/RECORD",
+            "my_pkg-1.0.dist-info/WHEEL",
+            "mypkg/__init__.py",
+            "mypkg/cli.py",
+            "mypkg/data.bin",
+        ]
+        with zipfile.ZipFile(src_wheel_path) as src_zip, zipfile.ZipFile(out_path) as out_zip:
+            assert out_zip.testzip() is None
+            assert "x = 1" in out_zip.read("mypkg/__init__.py").decode("utf-8")
+            assert "format" in out_zip.read("mypkg/cli.py").decode("utf-8")
+            assert out_zip.getinfo("mypkg/cli.py").external_attr >> 16 & 0o777 == 0o755
+
+            src_info = src_zip.getinfo("mypkg/data.bin")
+            out_info = out_zip.getinfo("mypkg/data.bin")
+            assert out_info.compress_size == src_info.compress_size
+            assert out_info.CRC == src_info.CRC
+
+            wheel_info = out_zip.read("my_pkg-1.0.dist-info/WHEEL").decode("utf-8")
+            metadata   = out_zip.read("my_pkg-1.0.dist-info/METADATA").decode("utf-8")
+            assert "Tag: py2-none-any\nTag: py3-none-any" in wheel_info
+            assert "Requires-Python: >=2.7" in metadata
+            assert "Requires-Python: >=3.6" not in metadata
+
+
+def test_copy_member_without_record(tmp_path):
+    src_wheel_path = _write_src_wheel(tmp_path)
+    wheel_path     = tmp_path / "out.whl"
+    with zipfile.ZipFile(src_wheel_path) as src_zip:
+        src_info = src_zip.getinfo("mypkg/data.bin")
+        with wheels.WheelWriter(wheel_path, "my_pkg-1.0.dist-info") as writer:
+            assert not writer.copy_member(src_zip, src_info)
+
+    assert "mypkg/data.bin" in _check_record(wheel_path)